@@ -1,70 +1,696 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    UploadFile,
+    File,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Form,
+)
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Literal
+import asyncio
+import base64
+import json
+import logging
+import time
 import uuid
 
-from app.schemas.dto import UploadResponse, AskRequest, AskResponse
-from app.db.database import get_db
-from app.db.models import Document, ChatMessage
-from app.db.repo import insert_document, get_document, insert_chat
-from app.services import document_service
+from app.schemas.dto import (
+    UploadResponse,
+    AskRequest,
+    AskBatchRequest,
+    AskResponse,
+    ChatMessageOut,
+    ChatHistoryResponse,
+    IngestJobResponse,
+    IngestItemOut,
+    IngestItemsResponse,
+    SearchHit,
+    SearchResponse,
+)
+from app.db.database import get_db, SessionLocal
+from app.db.models import Document, ChatMessage, IngestJob
+from app.db.repo import (
+    get_ingest_job,
+    list_ingest_items,
+    list_chat_messages,
+    stream_chat_messages,
+)
+from app.db.chat_writer import chat_writer, persist_chat
+from app.db.search import search_pages
+from app.core.config import settings
+from app.core.executor import pool_stats, run_io
+from app.core.metrics import span
+from app.services import (
+    document_service,
+    ingest_service,
+    layout_service,
+    tile_service,
+)
 from app.services.prompt_engine import build_prompt
-from app.services.llm_service import ask
+from app.services.llm_service import (
+    aask_cached,
+    astream_cached,
+    llm_flight,
+)
+from app.services.llm_router import LLMUnavailable, router as llm_router
+from app.services.metadata_cache import document_etag, metadata_cache
+from app.services.response_cache import response_cache
+from app.services.retrieval import get_index as get_retrieval_index, retrieve_context
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def _upload_response(doc: Document, deduplicated: bool = False) -> UploadResponse:
+    return UploadResponse(
+        doc_id=doc.id,
+        filename=doc.filename,
+        pages=doc.pages,
+        index_status=doc.index_status,
+        deduplicated=deduplicated,
+    )
+
+
 @router.post("/upload", response_model=UploadResponse)
-async def upload_pdf(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+async def upload_pdf(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files supported")
 
-    data = await file.read()
-    saved = await document_service.save_pdf(data, file.filename)
+    declared = request.headers.get("content-length")
+    if (
+        declared
+        and declared.isdigit()
+        and int(declared) > settings.MAX_UPLOAD_BYTES + 64 * 1024
+    ):
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    try:
+        staged = await document_service.stage_upload(file.file)
+    except document_service.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    try:
+        doc, deduplicated = await document_service.register_staged(
+            db, staged, file.filename
+        )
+    except document_service.InvalidPdf:
+        raise HTTPException(status_code=400, detail="Invalid PDF file")
+    if deduplicated:
+        return _upload_response(doc, deduplicated=True)
+
+    if settings.THUMBNAIL_ON_UPLOAD:
+        background_tasks.add_task(tile_service.prerender_first_thumbnail, doc)
+    if settings.PAGE_INDEX_ON_UPLOAD:
+        background_tasks.add_task(document_service.index_page_texts, doc.id, doc.path)
+
+    return _upload_response(doc)
+
+
+def _job_response(job: IngestJob) -> IngestJobResponse:
+    return IngestJobResponse(
+        job_id=job.id,
+        status=job.status,
+        total=job.total,
+        processed=job.processed,
+        succeeded=job.succeeded,
+        failed=job.failed,
+        progress=round(job.processed / job.total, 4) if job.total else 1.0,
+        concurrency=job.concurrency,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
+
+
+@router.post("/ingest", response_model=IngestJobResponse, status_code=202)
+async def ingest_documents(
+    background_tasks: BackgroundTasks,
+    files: list[UploadFile] = File(...),
+    concurrency: int | None = Form(None),
+    index_text: bool = Form(True),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Bulk ingestion: many PDFs and/or zip/tar archives of PDFs. Uploads are
+    only streamed to disk here; the background job unpacks archives, then
+    a worker pool saves, dedups, counts pages and (optionally) indexes
+    text. Poll /ingest/{job_id}.
+    """
+    try:
+        staged = await ingest_service.stage_files(files)
+    except ingest_service.TooManyFiles as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not staged:
+        raise HTTPException(status_code=400, detail="No files to ingest")
+
+    workers = ingest_service.resolve_concurrency(concurrency)
+    try:
+        job, work = await ingest_service.create_job(db, staged, workers)
+    except BaseException:
+        ingest_service.discard_all(staged)
+        raise
+
+    background_tasks.add_task(ingest_service.run_job, job.id, work, workers, index_text)
+    return _job_response(job)
+
+
+@router.get("/ingest/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job_status(job_id: str, db: AsyncSession = Depends(get_db)):
+    job = await get_ingest_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return _job_response(job)
+
+
+@router.get("/ingest/{job_id}/items", response_model=IngestItemsResponse)
+async def get_ingest_job_items(job_id: str, db: AsyncSession = Depends(get_db)):
+    job = await get_ingest_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    items = await list_ingest_items(db, job_id)
+    return IngestItemsResponse(
+        job_id=job_id,
+        items=[
+            IngestItemOut(
+                filename=i.filename, status=i.status, doc_id=i.doc_id, error=i.error
+            )
+            for i in items
+        ],
+    )
+
 
-    doc = Document(
-        id=saved["doc_id"],
-        filename=saved["filename"],
-        path=saved["path"],
-        pages=saved["pages"],
+@router.get("/search", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10_000),
+    doc_id: str | None = None,
+    mode: Literal["all", "any"] = "all",
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Full-text search over indexed page text; hits ranked by BM25.
+    """
+    hits = await search_pages(
+        db, q, limit=limit, offset=offset, doc_id=doc_id, any_term=mode == "any"
     )
-    await insert_document(db, doc)
+    return SearchResponse(query=q, hits=[SearchHit(**h) for h in hits])
 
-    return UploadResponse(doc_id=doc.id, filename=doc.filename, pages=doc.pages)
+
+def _not_modified(request: Request, etag: str) -> bool:
+    # If-None-Match uses weak comparison: W/ prefixes don't matter
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag.removeprefix("W/"):
+            return True
+    return False
 
 
 @router.get("/documents/{doc_id}")
-async def get_doc(doc_id: str, db: AsyncSession = Depends(get_db)):
-    doc = await get_document(db, doc_id)
+async def get_doc(
+    doc_id: str,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
+    doc = await document_service.get_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    # index_status still changes: clients revalidate every time (cheap 304)
+    headers = {"ETag": document_etag(doc), "Cache-Control": "no-cache"}
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return {
+        "id": doc.id,
+        "filename": doc.filename,
+        "pages": doc.pages,
+        "index_status": doc.index_status,
+    }
+
+
+@router.delete("/documents/{doc_id}", status_code=204)
+async def delete_doc(doc_id: str, db: AsyncSession = Depends(get_db)):
+    doc = await document_service.get_document(db, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
-    return {"id": doc.id, "filename": doc.filename, "pages": doc.pages}
+    prefix = await document_service.delete_document(db, doc)
+    if prefix:
+        # thumbnails, tiles and layouts are derived from the file as well
+        await tile_service.forget_document(prefix)
+        await layout_service.forget_document(prefix)
+    return Response(status_code=204)
 
 
 @router.get("/documents/{doc_id}/page/{page}/text")
-async def get_page_text(doc_id: str, page: int, db: AsyncSession = Depends(get_db)):
-    doc = await get_document(db, doc_id)
+async def get_page_text(
+    doc_id: str,
+    page: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
+    doc = await document_service.get_document(db, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     if page < 1 or page > doc.pages:
         raise HTTPException(status_code=400, detail="Invalid page number")
 
-    text = document_service.get_page_text(doc.path, page)
+    headers = {
+        "ETag": document_service.page_text_etag(doc, page),
+        "Cache-Control": f"public, max-age={settings.PAGE_TEXT_HTTP_MAX_AGE}",
+    }
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    text = await document_service.read_page_text(db, doc, page)
+    response.headers.update(headers)
     return {"doc_id": doc_id, "page": page, "text": text}
 
 
-@router.post("/ask", response_model=AskResponse)
-async def ask_ai(payload: AskRequest, db: AsyncSession = Depends(get_db)):
-    doc_path = None
-    if payload.document_id:
-        doc = await get_document(db, payload.document_id)
+def _encode_cursor(msg: ChatMessage) -> str:
+    raw = json.dumps([msg.created_at.isoformat(), msg.id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, msg_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), str(msg_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _message_out(msg: ChatMessage) -> ChatMessageOut:
+    return ChatMessageOut(
+        id=msg.id, role=msg.role, content=msg.content, created_at=msg.created_at
+    )
+
+
+async def _raster_response(request: Request, ref_fn, *args) -> Response:
+    """
+    Serves a thumbnail/tile with a strong ETag; If-None-Match hits return
+    304 without rendering or reading the cache.
+    """
+    try:
+        ref = ref_fn(*args)
+    except tile_service.TileNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    headers = {
+        "ETag": ref["etag"],
+        "Cache-Control": f"public, max-age={settings.TILE_HTTP_MAX_AGE}",
+    }
+    if _not_modified(request, ref["etag"]):
+        return Response(status_code=304, headers=headers)
+    try:
+        data = await tile_service.fetch(ref)
+    except tile_service.TileNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(content=data, media_type=ref["mime"], headers=headers)
+
+
+@router.get("/documents/{doc_id}/page/{page}/layout")
+async def get_page_layout(
+    doc_id: str,
+    page: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Words, lines and blocks with boxes in PDF points (origin top-left),
+    columnar: words.bbox is a flat [x0, y0, x1, y1, ...] list, words.line
+    and lines.block index into the next level.
+    """
+    doc = await document_service.get_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if page < 1 or page > doc.pages:
+        raise HTTPException(status_code=400, detail="Invalid page number")
+
+    headers = {
+        "ETag": f'"{layout_service.layout_key(doc, page)[-32:]}"',
+        "Cache-Control": f"public, max-age={settings.PAGE_TEXT_HTTP_MAX_AGE}",
+    }
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    layout = await layout_service.get_layout(doc, page)
+    response.headers.update(headers)
+    return {"doc_id": doc_id, "page": page, "units": "pt", **layout.to_dict()}
+
+
+@router.get("/documents/{doc_id}/page/{page}/layout/text")
+async def get_text_in_bbox(
+    doc_id: str,
+    page: int,
+    x: float,
+    y: float,
+    w: float = Query(gt=0),
+    h: float = Query(gt=0),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Text under a bbox given like selection.bbox (pixels at CROP_BBOX_ZOOM).
+    """
+    doc = await document_service.get_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if page < 1 or page > doc.pages:
+        raise HTTPException(status_code=400, detail="Invalid page number")
+
+    layout = await layout_service.get_layout(doc, page)
+    rect = layout_service.bbox_to_rect(
+        {"x": x, "y": y, "w": w, "h": h}, settings.CROP_BBOX_ZOOM
+    )
+    words = layout.words_in_rect(*rect, min_overlap=settings.LAYOUT_MIN_OVERLAP)
+    return {
+        "doc_id": doc_id,
+        "page": page,
+        "text": layout.text_of(words),
+        "words": words,
+    }
+
+
+@router.get("/documents/{doc_id}/page/{page}/thumbnail")
+async def get_page_thumbnail(
+    doc_id: str, page: int, request: Request, db: AsyncSession = Depends(get_db)
+):
+    doc = await document_service.get_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return await _raster_response(request, tile_service.thumbnail_ref, doc, page)
+
+
+@router.get("/documents/{doc_id}/page/{page}/tiles")
+async def get_page_tile_layout(
+    doc_id: str, page: int, db: AsyncSession = Depends(get_db)
+):
+    doc = await document_service.get_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    try:
+        return await tile_service.tile_layout(doc, page)
+    except tile_service.TileNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/documents/{doc_id}/page/{page}/tiles/{level}/{col}/{row}")
+async def get_page_tile(
+    doc_id: str,
+    page: int,
+    level: int,
+    col: int,
+    row: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    doc = await document_service.get_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return await _raster_response(
+        request, tile_service.tile_ref, doc, page, level, col, row
+    )
+
+
+@router.get("/documents/{doc_id}/messages", response_model=ChatHistoryResponse)
+async def list_messages(
+    doc_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+    order: Literal["asc", "desc"] = "asc",
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Keyset-paginated chat history: pass next_cursor back as cursor.
+    """
+    doc = await document_service.get_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    after = _decode_cursor(cursor) if cursor else None
+    rows = await list_chat_messages(
+        db, doc_id, limit + 1, after=after, descending=order == "desc"
+    )
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return ChatHistoryResponse(
+        doc_id=doc_id,
+        items=[_message_out(m) for m in rows[:limit]],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/documents/{doc_id}/messages/export")
+async def export_messages(doc_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Whole chat history as NDJSON, streamed from a server-side cursor.
+    """
+    doc = await document_service.get_document(db, doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    async def _lines():
+        async with SessionLocal() as export_db:
+            async for msg in stream_chat_messages(export_db, doc_id):
+                yield _message_out(msg).model_dump_json() + "\n"
+
+    return StreamingResponse(
+        _lines(),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="{doc_id}_messages.ndjson"'
+        },
+    )
+
+
+@router.get("/admin/pdf-cache")
+async def pdf_cache_stats():
+    return document_service.pdf_cache_stats()
+
+
+@router.get("/admin/chat-writer")
+async def chat_writer_stats():
+    return chat_writer.stats()
+
+
+@router.get("/admin/pools")
+async def executor_pool_stats():
+    return pool_stats()
+
+
+@router.get("/admin/document-cache")
+async def document_cache_stats():
+    return metadata_cache.stats()
+
+
+@router.delete("/admin/document-cache")
+async def purge_document_cache():
+    metadata_cache.clear()
+    return {"cleared": True}
+
+
+@router.get("/admin/layout-cache")
+async def layout_cache_stats():
+    return {
+        **layout_service.layout_cache.stats(),
+        "disk": layout_service.layout_disk_cache.stats(),
+        "extractions": layout_service.layout_flight.stats(),
+    }
+
+
+@router.delete("/admin/layout-cache")
+async def purge_layout_cache():
+    layout_service.layout_cache.clear()
+    removed = layout_service.layout_disk_cache.purge()
+    return {"removed": removed}
+
+
+@router.get("/admin/crop-cache")
+async def crop_cache_stats():
+    return document_service.crop_cache.stats()
+
+
+@router.delete("/admin/crop-cache")
+async def purge_crop_cache():
+    removed = document_service.crop_cache.purge()
+    return {"removed": removed}
+
+
+@router.get("/admin/llm")
+async def llm_router_stats():
+    return llm_router.stats()
+
+
+@router.get("/admin/single-flight")
+async def single_flight_stats():
+    # "coalesced" = upstream crop renders / LLM calls saved
+    return {
+        "crop": document_service.crop_flight.stats(),
+        "llm": llm_flight.stats(),
+    }
+
+
+@router.get("/admin/tile-cache")
+async def tile_cache_stats():
+    return {
+        **tile_service.tile_cache.stats(),
+        "renders": tile_service.tile_flight.stats(),
+    }
+
+
+@router.delete("/admin/tile-cache")
+async def purge_tile_cache():
+    removed = tile_service.tile_cache.purge()
+    return {"removed": removed}
+
+
+@router.get("/admin/response-cache")
+async def response_cache_stats():
+    return response_cache.stats()
+
+
+@router.delete("/admin/response-cache")
+async def purge_response_cache():
+    response_cache.clear()
+    return {"cleared": True}
+
+
+async def _selection_text(doc: Document, page: int, bbox: dict) -> str:
+    # text under an image selection, from the cached page layout
+    if settings.IMAGE_SELECTION_TEXT_TOKENS <= 0:
+        return ""
+    try:
+        return await layout_service.text_in_bbox(doc, page, bbox)
+    except layout_service.LayoutNotFound:
+        return ""
+
+
+async def _fill_regions(
+    sel: dict,
+    doc: Document | None,
+    db: AsyncSession,
+    page_texts: dict[int, str] | None = None,
+) -> list[dict] | None:
+    """
+    Multi-region selection: validates the regions, then reads missing page
+    texts (text) or renders every crop (image) concurrently. Returns the
+    crops, in region order, for image selections.
+    """
+    regions = sel["regions"]
+    if len(regions) > settings.SELECTION_MAX_REGIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"at most {settings.SELECTION_MAX_REGIONS} selection.regions",
+        )
+    if sel["type"] == "image":
+        if any(not r.get("bbox") for r in regions):
+            raise HTTPException(
+                status_code=400, detail="regions[].bbox required for image selection"
+            )
+        if not doc:
+            raise HTTPException(
+                status_code=400, detail="document_id required for image selection"
+            )
+    elif not doc and any(not r.get("content") for r in regions):
+        raise HTTPException(
+            status_code=400,
+            detail="regions[].content required or provide document_id",
+        )
+    if doc and any(r["page"] < 1 or r["page"] > doc.pages for r in regions):
+        raise HTTPException(status_code=400, detail="Invalid page number")
+
+    if sel["type"] == "image":
+        crops, texts = await asyncio.gather(
+            document_service.get_crops(doc, regions),
+            asyncio.gather(
+                *(_selection_text(doc, r["page"], r["bbox"]) for r in regions)
+            ),
+        )
+        for r, text in zip(regions, texts):
+            r["text"] = text
+        return crops
+    texts = dict(page_texts or {})
+    missing = [r["page"] for r in regions if not r.get("content")]
+    if any(p not in texts for p in missing):
+        texts.update(await document_service.read_page_texts(db, doc, missing))
+    if missing:
+        for r in regions:
+            if not r.get("content"):
+                r["content"] = texts[r["page"]]
+    return None
+
+
+async def _prepare_ask(
+    payload: AskRequest,
+    db: AsyncSession,
+    doc: Document | None = None,
+    page_texts: dict[int, str] | None = None,
+) -> tuple[dict, dict | list[dict] | None]:
+    """
+    Validates the selection, fills in page text / crop, and builds the
+    prompt plan. Returns (prompt_plan, image); image is a list of crops
+    for multi-region selections. Batches pass the already loaded doc and
+    prefetched page texts.
+    """
+    doc_path = doc.path if doc else None
+    if payload.document_id and doc is None:
+        with span("get_document"):
+            doc = await document_service.get_document(db, payload.document_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Document not found")
         doc_path = doc.path
 
     sel = payload.selection.model_dump()
+    if doc and not sel.get("regions") and not 1 <= sel["page"] <= doc.pages:
+        raise HTTPException(status_code=400, detail="Invalid page number")
+    context_chunks = None
+    retrieval_report = None
+    image = None
+    use_retrieval = (
+        settings.RETRIEVAL_ENABLED if payload.retrieval is None else payload.retrieval
+    )
+    model = llm_router.choose(payload.model)
 
+    if sel.get("regions"):
+        image = await _fill_regions(sel, doc, db, page_texts)
+        if sel["type"] == "text" and doc and use_retrieval:
+            selected = "\n\n".join(r["content"] for r in sel["regions"])
+            with span("retrieval"):
+                found = await retrieve_context(
+                    db, doc, payload.user_query, sel["page"], selected, model
+                )
+            if found:
+                context_chunks = found["chunks"]
+                retrieval_report = found["report"]
     # minimal validation for v1
-    if sel["type"] == "text":
+    elif sel["type"] == "text":
+        if doc and use_retrieval:
+            with span("retrieval"):
+                found = await retrieve_context(
+                    db,
+                    doc,
+                    payload.user_query,
+                    sel["page"],
+                    sel.get("content") or "",
+                    model,
+                )
+            if found:
+                context_chunks = found["chunks"] if sel.get("content") else None
+                sel["content"] = found["content"]
+                retrieval_report = found["report"]
         if not sel.get("content"):
             # fallback: if FE doesn't send text, pull whole page text (still basic)
             if not doc_path:
@@ -72,7 +698,12 @@ async def ask_ai(payload: AskRequest, db: AsyncSession = Depends(get_db)):
                     status_code=400,
                     detail="selection.content required or provide document_id",
                 )
-            sel["content"] = document_service.get_page_text(doc_path, sel["page"])
+            if page_texts and sel["page"] in page_texts:
+                sel["content"] = page_texts[sel["page"]]
+            else:
+                sel["content"] = await document_service.read_page_text(
+                    db, doc, sel["page"]
+                )
     elif sel["type"] == "image":
         if not sel.get("bbox"):
             raise HTTPException(
@@ -83,34 +714,295 @@ async def ask_ai(payload: AskRequest, db: AsyncSession = Depends(get_db)):
                 status_code=400, detail="document_id required for image selection"
             )
 
-    prompt_plan = build_prompt(payload.user_query, sel)
+    if sel["type"] == "image" and image is None:
+        image, sel["text"] = await asyncio.gather(
+            document_service.get_crop(doc, sel["page"], sel["bbox"]),
+            _selection_text(doc, sel["page"], sel["bbox"]),
+        )
 
-    image_path = None
-    if sel["type"] == "image":
-        image_path = document_service.crop_page_region_to_file(
-            doc_path, sel["page"], sel["bbox"]
+    # token counting is CPU work: keep it off the event loop
+    with span("build_prompt"):
+        prompt_plan = await run_io(
+            build_prompt, payload.user_query, sel, context_chunks, model=model
         )
+        routed = llm_router.choose(payload.model, prompt_plan, image)
+        if routed != model:
+            # short enough for the cheap model: fit to its budget instead
+            model = routed
+            prompt_plan = await run_io(
+                build_prompt, payload.user_query, sel, context_chunks, model=model
+            )
+    # the model the budget was computed for is the one that gets called
+    prompt_plan["model"] = model
+    if retrieval_report:
+        prompt_plan["used_context"]["retrieval"] = retrieval_report
+
+    return prompt_plan, image
 
-    chosen_model, answer = ask(payload.model, prompt_plan, image_path=image_path)
 
-    # persist chat (basic)
+def _chat_turn(
+    payload: AskRequest, answer: str, asked_at: datetime
+) -> list[ChatMessage]:
+    # explicit timestamps keep user < assistant even when rows are
+    # flushed later in one batch
     user_msg = ChatMessage(
         id=f"msg_{uuid.uuid4().hex[:12]}",
         doc_id=payload.document_id,
         role="user",
         content=payload.user_query,
+        created_at=asked_at,
     )
     assistant_msg = ChatMessage(
         id=f"msg_{uuid.uuid4().hex[:12]}",
         doc_id=payload.document_id,
         role="assistant",
         content=answer,
+        created_at=max(datetime.utcnow(), asked_at + timedelta(microseconds=1)),
     )
-    await insert_chat(db, user_msg)
-    await insert_chat(db, assistant_msg)
+    return [user_msg, assistant_msg]
+
+
+@router.post("/ask", response_model=AskResponse)
+async def ask_ai(payload: AskRequest, db: AsyncSession = Depends(get_db)):
+    asked_at = datetime.utcnow()
+    prompt_plan, image = await _prepare_ask(payload, db)
+
+    try:
+        chosen_model, answer, cache = await aask_cached(
+            prompt_plan["model"], prompt_plan, image=image, cache_mode=payload.cache
+        )
+    except LLMUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    # persist chat: one transaction (or write-behind)
+    with span("persist_chat"):
+        await persist_chat(db, _chat_turn(payload, answer, asked_at))
 
     return AskResponse(
         model=chosen_model,
         answer=answer,
         used_context=prompt_plan["used_context"],
+        cache=cache,
+    )
+
+
+def _batch_page_needs(items: list[AskRequest]) -> list[int]:
+    """Pages whose full text some text item will fall back to."""
+    pages = set()
+    for item in items:
+        sel = item.selection
+        if sel.type != "text":
+            continue
+        if sel.regions:
+            pages.update(r.page for r in sel.regions if not r.content)
+        elif not sel.content:
+            pages.add(sel.page)
+    return sorted(pages)
+
+
+@router.post("/ask/batch")
+async def ask_ai_batch(payload: AskBatchRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Many questions about one document, answered concurrently and streamed
+    back as NDJSON in completion order: {"index", "status": 200, "result":
+    AskResponse} or {"index", "status", "detail"} per item, then {"done":
+    true, ...}. The document is loaded once, page texts shared by several
+    items are read once, and identical crops / LLM calls are coalesced.
+    Chat rows for every answered item are written in one transaction just
+    before the summary; a client that disconnects earlier loses them (the
+    answers stay in the response cache).
+    """
+    if len(payload.items) > settings.ASK_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"at most {settings.ASK_BATCH_MAX_ITEMS} items per batch",
+        )
+    doc = await document_service.get_document(db, payload.document_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    started = time.perf_counter()
+    concurrency = max(
+        1,
+        min(
+            payload.concurrency or settings.ASK_BATCH_CONCURRENCY,
+            settings.ASK_BATCH_MAX_CONCURRENCY,
+        ),
+    )
+    with span("batch_prefetch"):
+        pages = [p for p in _batch_page_needs(payload.items) if p <= doc.pages]
+        page_texts = (
+            await document_service.read_page_texts(db, doc, pages) if pages else {}
+        )
+        if settings.RETRIEVAL_ENABLED or any(i.retrieval for i in payload.items):
+            # build the shared retrieval index once, not per item
+            await get_retrieval_index(db, doc)
+
+    async def _answer(index: int, item: AskRequest) -> tuple[dict, list]:
+        if item.document_id not in (None, doc.id):
+            return {"index": index, "status": 400, "detail": "document_id mismatch"}, []
+        item = item.model_copy(update={"document_id": doc.id})
+        asked_at = datetime.utcnow()
+        try:
+            # own session: items run concurrently (it only connects if a
+            # lookup wasn't served by the prefetch / caches)
+            async with SessionLocal() as item_db:
+                prompt_plan, image = await _prepare_ask(item, item_db, doc, page_texts)
+            chosen_model, answer, cache = await aask_cached(
+                prompt_plan["model"], prompt_plan, image=image, cache_mode=item.cache
+            )
+        except HTTPException as e:
+            return {"index": index, "status": e.status_code, "detail": e.detail}, []
+        except LLMUnavailable as e:
+            return {"index": index, "status": 503, "detail": str(e)}, []
+        except Exception as e:
+            logger.exception("batch /ask item %d failed", index)
+            return {"index": index, "status": 500, "detail": str(e)}, []
+        result = AskResponse(
+            model=chosen_model,
+            answer=answer,
+            used_context=prompt_plan["used_context"],
+            cache=cache,
+        )
+        line = {"index": index, "status": 200, "result": result.model_dump(mode="json")}
+        return line, _chat_turn(item, answer, asked_at)
+
+    async def _lines():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def _bounded(index: int, item: AskRequest):
+            async with slots:
+                return await _answer(index, item)
+
+        tasks = [
+            asyncio.create_task(_bounded(i, item))
+            for i, item in enumerate(payload.items)
+        ]
+        turns: list[ChatMessage] = []
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line, msgs = await next_done
+                turns.extend(msgs)
+                succeeded += line["status"] == 200
+                yield json.dumps(line) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # the request-scoped session is closed once streaming starts
+        if turns:
+            with span("persist_chat"):
+                async with SessionLocal() as batch_db:
+                    await persist_chat(batch_db, turns)
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(
+            "ask batch doc=%s items=%d ok=%d concurrency=%d total_ms=%s",
+            doc.id,
+            len(tasks),
+            succeeded,
+            concurrency,
+            total_ms,
+        )
+        summary = {
+            "done": True,
+            "items": len(tasks),
+            "succeeded": succeeded,
+            "failed": len(tasks) - succeeded,
+            "persisted_messages": len(turns),
+            "concurrency": concurrency,
+            "total_ms": total_ms,
+        }
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(
+        _lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/ask/stream")
+async def ask_ai_stream(payload: AskRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Same contract as /ask, streamed as server-sent events:
+    start {model} -> token {text}... -> done {model, used_context, ttft_ms,
+    total_ms, cache} (or error {detail}). Cache hits replay as one token.
+    Chat rows are written once, after the last token; a client disconnect
+    cancels the generator and closes the upstream LLM stream.
+
+    The upstream stream (and its router slot) is opened inside the
+    generator, so a response that is never sent holds nothing; with no
+    model available the stream is a single error event.
+    """
+    started = time.perf_counter()
+    asked_at = datetime.utcnow()
+    prompt_plan, image = await _prepare_ask(payload, db)
+
+    async def _events():
+        try:
+            chosen_model, deltas, cache = await astream_cached(
+                prompt_plan["model"],
+                prompt_plan,
+                image=image,
+                cache_mode=payload.cache,
+            )
+        except LLMUnavailable as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        except Exception as e:
+            logger.exception("opening the /ask stream failed")
+            yield _sse("error", {"detail": str(e)})
+            return
+
+        parts: list[str] = []
+        ttft_ms = None
+        try:
+            yield _sse("start", {"model": chosen_model})
+            async for text in deltas:
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                parts.append(text)
+                yield _sse("token", {"text": text})
+        except Exception as e:
+            logger.exception("streaming /ask failed")
+            yield _sse("error", {"detail": str(e)})
+            return
+        finally:
+            await deltas.aclose()
+
+        answer = "".join(parts)
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        # the request-scoped session is closed once streaming starts
+        with span("persist_chat"):
+            async with SessionLocal() as stream_db:
+                await persist_chat(stream_db, _chat_turn(payload, answer, asked_at))
+
+        logger.info(
+            "ask stream model=%s ttft_ms=%s total_ms=%s cache_hit=%s",
+            chosen_model,
+            ttft_ms,
+            total_ms,
+            cache["hit"],
+        )
+        yield _sse(
+            "done",
+            {
+                "model": chosen_model,
+                "used_context": prompt_plan["used_context"],
+                "ttft_ms": ttft_ms,
+                "total_ms": total_ms,
+                "cache": cache,
+            },
+        )
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import List
+from typing import List, Literal
 
 
 class Settings(BaseSettings):
@@ -14,10 +14,168 @@ class Settings(BaseSettings):
     PDF_DIR: str = "storage/pdfs"
     IMAGE_DIR: str = "storage/images"
 
+    # uploads are streamed to disk in chunks and rejected past the limit
+    MAX_UPLOAD_BYTES: int = 200 * 1024 * 1024
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+
+    # bulk ingestion (/ingest): files or zip/tar archives per request
+    INGEST_MAX_FILES: int = 5000
+    INGEST_MAX_ARCHIVE_BYTES: int = 4 * 1024 * 1024 * 1024
+    INGEST_CONCURRENCY: int = 4
+    INGEST_MAX_CONCURRENCY: int = 16
+
+    # max PyMuPDF documents kept open across requests (0 disables pooling)
+    PDF_MAX_OPEN_DOCS: int = 32
+    # extract and store every page's text in the background after upload
+    PAGE_INDEX_ON_UPLOAD: bool = True
+
+    # local BM25 retrieval for text selections
+    RETRIEVAL_ENABLED: bool = True
+    RETRIEVAL_CHUNK_TOKENS: int = 120
+    RETRIEVAL_TOP_K: int = 4
+    RETRIEVAL_TOKEN_BUDGET: int = 600
+    RETRIEVAL_CACHE_DOCS: int = 64
+
+    # prompt input budget in tokens (capped by the model's context window);
+    # MODEL_INPUT_BUDGETS overrides per model, e.g. {"gpt-4o": 12000}.
+    # Over-long selections are trimmed: "relevance" keeps the sentences that
+    # best overlap the question, "head_tail" keeps the start and the end.
+    PROMPT_INPUT_BUDGET: int = 6000
+    MODEL_INPUT_BUDGETS: dict[str, int] = {}
+    PROMPT_TRIM_STRATEGY: Literal["relevance", "head_tail"] = "relevance"
+
+    # /ask/batch: questions per request, and how many run at once (the
+    # model router's per-model limits still apply on top)
+    ASK_BATCH_MAX_ITEMS: int = 100
+    ASK_BATCH_CONCURRENCY: int = 8
+    ASK_BATCH_MAX_CONCURRENCY: int = 32
+
+    # structured page layout (words/lines/blocks with boxes): decoded pages
+    # kept in memory, serialized ones on disk under STORAGE_DIR/layout
+    LAYOUT_CACHE_PAGES: int = 256
+    LAYOUT_CACHE_MAX_BYTES: int = 128 * 1024 * 1024
+    # share of a word's box that must fall inside a bbox for it to count
+    LAYOUT_MIN_OVERLAP: float = 0.5
+    # image selections also send the text under their bbox, up to this
+    # many tokens (0 = off)
+    IMAGE_SELECTION_TEXT_TOKENS: int = 400
+
+    # max selection.regions per /ask (multi-page / multi-crop selections)
+    SELECTION_MAX_REGIONS: int = 8
+
+    # image selections: bbox coords are pixels of the page rendered at
+    # CROP_BBOX_ZOOM; crops render at CROP_ZOOM, scaled down to stay under
+    # CROP_MAX_PIXELS (~what vision models use before downsampling)
+    CROP_BBOX_ZOOM: float = 2.0
+    CROP_ZOOM: float = 2.0
+    CROP_MAX_PIXELS: int = 1_150_000
+    # crop encoding: png | jpeg | webp (quality applies to jpeg/webp)
+    CROP_FORMAT: Literal["png", "jpeg", "webp"] = "png"
+    CROP_QUALITY: int = 85
+    CROP_PNG_COMPRESS_LEVEL: int = 6
+    # keep crops in the IMAGE_DIR cache; off = fully in-memory
+    CROP_PERSIST: bool = True
+    # content-addressed crop cache in IMAGE_DIR (age 0 = no age limit)
+    CROP_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    CROP_CACHE_MAX_AGE_SECONDS: int = 7 * 24 * 3600
+
+    # page thumbnails + raster tiles: TILE_ZOOM_LEVELS (comma-separated)
+    # are indexed by the {level} URL segment; renders are cached on disk
+    # under IMAGE_DIR/tiles and served with ETags + Cache-Control max-age
+    THUMBNAIL_MAX_SIDE: int = 256
+    THUMBNAIL_ON_UPLOAD: bool = True
+    TILE_SIZE: int = 256
+    TILE_ZOOM_LEVELS: str = "0.5,1,2,4"
+    TILE_FORMAT: Literal["png", "jpeg", "webp"] = "webp"
+    TILE_QUALITY: int = 80
+    TILE_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    TILE_CACHE_MAX_AGE_SECONDS: int = 30 * 24 * 3600
+    TILE_HTTP_MAX_AGE: int = 24 * 3600
+
     DATABASE_URL: str = "sqlite+aiosqlite:///./storage/app.db"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    # SQLite connection pragmas
+    SQLITE_WAL: bool = True
+    SQLITE_SYNCHRONOUS: Literal["OFF", "NORMAL", "FULL"] = "NORMAL"
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # Postgres (postgresql+asyncpg://...): pre-ping + recycle connections,
+    # per-statement timeout (0 = none); DB_PGBOUNCER disables asyncpg's
+    # prepared statement cache (transaction-pooling pgbouncer)
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    DB_PGBOUNCER: bool = False
+    # run Alembic migrations to head at startup (off when a deploy step
+    # runs `alembic upgrade head` instead); concurrent workers serialise on
+    # an advisory lock (Postgres) or a lock file next to the database (SQLite)
+    DB_AUTO_MIGRATE: bool = True
+
+    # where document files live: "local" (PDF_DIR) or "package.module:Class"
+    # (a StorageBackend subclass, see app/services/storage.py)
+    STORAGE_BACKEND: str = "local"
+
+    # write-behind buffer for chat rows (flushed in batches off the
+    # request path; unflushed rows are lost if the process is killed)
+    CHAT_WRITE_BEHIND: bool = False
+    CHAT_FLUSH_BATCH_SIZE: int = 200
+    CHAT_FLUSH_INTERVAL_MS: int = 250
+    # failed flushes are retried this many times, then rows are written one
+    # by one and the ones that still fail are dropped (and logged)
+    CHAT_FLUSH_MAX_RETRIES: int = 3
+    # past this many unflushed rows, turns are written inline instead
+    CHAT_MAX_PENDING: int = 10000
 
     DEFAULT_MODEL: str = "gpt-4o-mini"
 
+    # read-through cache of document rows (immutable after upload except
+    # index_status: rows still being indexed expire after the pending TTL).
+    # Per worker: a delete in another worker stays visible here for up to
+    # DOC_CACHE_TTL_SECONDS, except that reads of its missing file give 404
+    DOC_CACHE_MAX_ENTRIES: int = 4096
+    DOC_CACHE_TTL_SECONDS: int = 300
+    DOC_CACHE_PENDING_TTL_SECONDS: float = 2.0
+    # Cache-Control max-age for page text (ETag-validated either way)
+    PAGE_TEXT_HTTP_MAX_AGE: int = 3600
+
+    # model router: per-model concurrency (LLM_MODEL_CONCURRENCY overrides
+    # LLM_MAX_CONCURRENCY, e.g. {"gpt-4o": 4}), per-attempt timeout, retries
+    # with full-jitter backoff on 429/5xx/timeouts, then fail-over along
+    # LLM_FALLBACK_MODELS. Text prompts of at most LLM_CHEAP_MAX_PROMPT_TOKENS
+    # without an explicit model go to LLM_CHEAP_MODEL (empty = off).
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_MODEL_CONCURRENCY: dict[str, int] = {}
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BASE_MS: int = 250
+    LLM_RETRY_MAX_MS: int = 4000
+    LLM_FALLBACK_MODELS: str = ""  # comma-separated
+    LLM_CHEAP_MODEL: str = ""
+    LLM_CHEAP_MAX_PROMPT_TOKENS: int = 300
+
+    # Prometheus /metrics, per-stage spans and a JSON timing log line per
+    # request (logger "app.timing"); spans are shared no-ops when disabled
+    METRICS_ENABLED: bool = True
+    TIMING_LOG: bool = True
+
+    # execution pools: threads for blocking I/O / sync LLM calls,
+    # processes for rendering (0 renders on the I/O pool instead)
+    IO_POOL_WORKERS: int = 16
+    CPU_POOL_WORKERS: int = 2
+    # use litellm.acompletion; False runs the sync client on the I/O pool
+    LLM_NATIVE_ASYNC: bool = True
+
+    # concurrent identical /ask requests share one crop render and one LLM call
+    SINGLE_FLIGHT_ENABLED: bool = True
+
+    # answer cache keyed on (model, prompts, image hash); FUZZY also
+    # ignores case/punctuation in the user prompt
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2048
+    RESPONSE_CACHE_TTL_SECONDS: int = 24 * 3600
+    RESPONSE_CACHE_FUZZY: bool = False
+
     OPENAI_API_KEY: str = Field(default="")
     ANTHROPIC_API_KEY: str = Field(default="")
 
@@ -30,5 +188,11 @@ class Settings(BaseSettings):
     def cors_origins_list(self) -> List[str]:
         return [x.strip() for x in self.CORS_ORIGINS.split(",") if x.strip()]
 
+    def tile_zoom_levels_list(self) -> List[float]:
+        return [float(x) for x in self.TILE_ZOOM_LEVELS.split(",") if x.strip()]
+
+    def fallback_models_list(self) -> List[str]:
+        return [x.strip() for x in self.LLM_FALLBACK_MODELS.split(",") if x.strip()]
+
 
 settings = Settings()
@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.core.config import settings
+
+
+class WorkPool:
+    """
+    Lazily created executor plus in-flight / queue-depth accounting.
+
+    Queue depth is work submitted but not yet picked up by a worker,
+    i.e. max(0, in_flight - max_workers). A process pool whose worker
+    died (OOM, a crash inside MuPDF) is replaced and the call retried once.
+    """
+
+    def __init__(self, name: str, max_workers: int, processes: bool = False):
+        self.name = name
+        self.max_workers = max_workers
+        self.processes = processes
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def _get(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.processes:
+                    # spawn: forking a process that holds fitz/sqlite threads is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix=f"{self.name}-pool",
+                    )
+            return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        with self._lock:
+            self.in_flight += 1
+            self.submitted += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+        try:
+            executor = self._get()
+            try:
+                return await loop.run_in_executor(executor, call)
+            except BrokenProcessPool:
+                self._discard(executor)
+                return await loop.run_in_executor(self._get(), call)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+
+    def _discard(self, broken: Executor) -> None:
+        # a broken process pool never recovers; the next _get builds a new one
+        with self._lock:
+            if self._executor is not broken:
+                return  # another caller already replaced it
+            self._executor = None
+            self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kind": "process" if self.processes else "thread",
+                "max_workers": self.max_workers,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "peak_queue_depth": self.peak_queue_depth,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "restarts": self.restarts,
+            }
+
+
+io_pool = WorkPool("io", max(1, settings.IO_POOL_WORKERS))
+cpu_pool = (
+    WorkPool("cpu", settings.CPU_POOL_WORKERS, processes=True)
+    if settings.CPU_POOL_WORKERS > 0
+    else io_pool
+)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Blocking file / DB-free / sync LLM work."""
+    return await io_pool.run(fn, *args, **kwargs)
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """
+    CPU-bound rendering. fn and its args/result must be picklable
+    (module-level functions, plain data) when the process pool is enabled.
+    """
+    return await cpu_pool.run(fn, *args, **kwargs)
+
+
+def pool_stats() -> dict:
+    stats = {"io": io_pool.stats()}
+    if cpu_pool is not io_pool:
+        stats["cpu"] = cpu_pool.stats()
+    return stats
+
+
+def shutdown_pools() -> None:
+    io_pool.shutdown()
+    if cpu_pool is not io_pool:
+        cpu_pool.shutdown()
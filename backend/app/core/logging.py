@@ -8,3 +8,6 @@ def setup_logging():
         level=level,
         format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
     )
+    if settings.TIMING_LOG:
+        # one JSON line per request from MetricsMiddleware
+        logging.getLogger("app.timing").setLevel(logging.INFO)
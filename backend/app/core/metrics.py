@@ -0,0 +1,312 @@
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+from typing import Callable
+
+from app.core.config import settings
+
+PREFIX = "marginstudio_"
+
+# seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+timing_logger = logging.getLogger("app.timing")
+
+# stage -> seconds for the request being served (set by MetricsMiddleware)
+_request_stages: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    "request_stages", default=None
+)
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels_key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, key, value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels_key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(_labels_key(labels))
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", key + (("le", str(bound)),), cumulative
+            yield f"{self.name}_sum", key, series[-1]
+            yield f"{self.name}_count", key, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+        self._collectors: dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help: str, **kwargs):
+        full = PREFIX + name
+        with self._lock:
+            metric = self._metrics.get(full)
+            if metric is None:
+                metric = self._metrics[full] = cls(full, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str = "", buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def register_stats(self, component: str, fn: Callable[[], dict]) -> None:
+        """
+        Exposes an existing stats() dict as gauges at scrape time: numeric
+        leaves become {PREFIX}{component}_{key}; one level of nested dicts
+        (e.g. per pool, per model) becomes a name="..." label.
+        """
+        self._collectors[component] = fn
+
+    def _collected(self) -> list[str]:
+        lines = []
+        for component, fn in sorted(self._collectors.items()):
+            try:
+                stats = fn()
+            except Exception:
+                continue
+            series: dict[str, list[tuple[tuple, float]]] = {}
+            for key, value in stats.items():
+                if isinstance(value, dict):
+                    for sub, leaf in value.items():
+                        if _numeric(leaf):
+                            name = f"{PREFIX}{component}_{sub}"
+                            series.setdefault(name, []).append(
+                                ((("name", key),), float(leaf))
+                            )
+                elif _numeric(value):
+                    name = f"{PREFIX}{component}_{key}"
+                    series.setdefault(name, []).append(((), float(value)))
+            for name, samples in series.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{_format_labels(k)} {v}" for k, v in samples)
+        return lines
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        for name, metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample, key, value in metric.samples():
+                lines.append(f"{sample}{_format_labels(key)} {value}")
+        lines.extend(self._collected())
+        return "\n".join(lines) + "\n"
+
+
+def _numeric(value) -> bool:
+    return isinstance(value, (int, float))
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "stage_seconds", "Time spent per processing stage (span)."
+)
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by method, route and status."
+)
+http_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route."
+)
+http_in_flight = registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served."
+)
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        stage_seconds.observe(elapsed, stage=self.stage)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[self.stage] = stages.get(self.stage, 0.0) + elapsed
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage: str):
+    """
+    with span("llm_call"): ...  -- times a stage into stage_seconds and the
+    current request's timing log. A shared no-op when metrics are off.
+    """
+    if not settings.METRICS_ENABLED:
+        return _NOOP
+    return _Span(stage)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request counter, latency histogram, in-flight gauge
+    and one structured timing log line per request (with its spans).
+    Streaming responses are timed until the last body chunk is sent.
+    """
+
+    def __init__(self, app, skip_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+        started = time.perf_counter()
+        done = {}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body"
+            ):
+                # background tasks run after this; they aren't request latency
+                done["at"] = time.perf_counter()
+            await send(message)
+
+        stages: dict[str, float] = {}
+        token = _request_stages.set(stages)
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            elapsed = done.get("at", time.perf_counter()) - started
+            http_in_flight.dec()
+            _request_stages.reset(token)
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_requests.inc(method=method, route=template, status=status["code"])
+            http_duration.observe(elapsed, method=method, route=template)
+            if settings.TIMING_LOG:
+                timing_logger.info(
+                    json.dumps(
+                        {
+                            "method": method,
+                            "route": template,
+                            "path": scope["path"],
+                            "status": status["code"],
+                            "ms": round(elapsed * 1000, 2),
+                            "stages_ms": {
+                                k: round(v * 1000, 2) for k, v in stages.items()
+                            },
+                        }
+                    )
+                )
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import ChatMessage
+from app.db.repo import insert_chats
+
+logger = logging.getLogger(__name__)
+
+
+class ChatWriteBuffer:
+    """
+    Write-behind buffer for chat rows: requests append and return, a
+    background task commits everything pending in one transaction every
+    flush interval (or as soon as a batch fills up). A failing flush is
+    retried max_retries times; then the rows are written one by one so a
+    single bad row can't wedge the buffer, and rows that still fail are
+    dropped. submit() refuses rows past max_pending.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval_ms: int,
+        max_retries: int,
+        max_pending: int,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self._pending: list[ChatMessage] = []
+        # consecutive failed flushes
+        self._retries = 0
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def submit(self, msgs: list[ChatMessage]) -> bool:
+        """Queues msgs; False (nothing queued) when the buffer is full."""
+        if len(self._pending) + len(msgs) > self.max_pending:
+            self.rejected += len(msgs)
+            return False
+        self._pending.extend(msgs)
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            async with SessionLocal() as db:
+                await insert_chats(db, batch)
+        except Exception:
+            self.failures += 1
+            self._retries += 1
+            if self._retries <= self.max_retries:
+                logger.exception("chat write-behind flush failed (%d rows)", len(batch))
+                # keep the rows for the next attempt
+                self._pending = batch + self._pending
+                return 0
+            logger.exception(
+                "chat write-behind flush failed %d times; writing %d rows one by one",
+                self._retries,
+                len(batch),
+            )
+            self._retries = 0
+            return await self._write_each(batch)
+        self._retries = 0
+        self.flushes += 1
+        self.rows_written += len(batch)
+        return len(batch)
+
+    async def _write_each(self, batch: list[ChatMessage]) -> int:
+        written = 0
+        for msg in batch:
+            try:
+                async with SessionLocal() as db:
+                    await insert_chats(db, [msg])
+            except Exception as exc:
+                self.dropped += 1
+                logger.error(
+                    "dropping chat row id=%s doc_id=%s: %s", msg.id, msg.doc_id, exc
+                )
+                continue
+            written += 1
+        self.flushes += 1
+        self.rows_written += written
+        return written
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.CHAT_WRITE_BEHIND,
+            "running": self.running,
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+        }
+
+
+chat_writer = ChatWriteBuffer(
+    settings.CHAT_FLUSH_BATCH_SIZE,
+    settings.CHAT_FLUSH_INTERVAL_MS,
+    settings.CHAT_FLUSH_MAX_RETRIES,
+    settings.CHAT_MAX_PENDING,
+)
+
+
+async def persist_chat(db, msgs: list[ChatMessage]) -> None:
+    """
+    One transaction on the caller's session, or hand-off to the
+    write-behind buffer when CHAT_WRITE_BEHIND is on (inline again while
+    the buffer is full).
+    """
+    if settings.CHAT_WRITE_BEHIND and chat_writer.running and chat_writer.submit(msgs):
+        return
+    await insert_chats(db, msgs)
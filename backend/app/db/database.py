@@ -1,7 +1,77 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from app.core.config import settings
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False, future=True)
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _set_sqlite_pragmas(dbapi_conn, _record):
+    cursor = dbapi_conn.cursor()
+    if settings.SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    # negative cache_size is in KiB
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _postgres_connect_args() -> dict:
+    server_settings = {"application_name": settings.APP_NAME}
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        server_settings["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+    args = {"server_settings": server_settings}
+    if settings.DB_PGBOUNCER:
+        # prepared statements don't survive transaction-mode pooling
+        args.update(statement_cache_size=0, prepared_statement_cache_size=0)
+    return args
+
+
+def create_engine_for(database_url: str, tuned: bool = True):
+    """
+    Async engine with pool sizing from settings; SQLite connections also
+    get WAL / synchronous / cache pragmas, Postgres connections pre-ping,
+    recycling and a statement timeout. tuned=False gives the plain
+    defaults (used by benchmarks as the baseline).
+    """
+    url = make_url(database_url)
+    if not tuned:
+        return create_async_engine(url, echo=False, future=True)
+
+    kwargs = {}
+    if url.get_backend_name() == "postgresql":
+        # pool per worker process: size it so workers * (pool_size +
+        # max_overflow) stays under the server's max_connections
+        kwargs.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=True,
+        )
+        if url.get_driver_name() == "asyncpg":
+            kwargs["connect_args"] = _postgres_connect_args()
+    elif not _is_memory_sqlite(url):
+        # aiosqlite defaults to NullPool (a new connection, cold page cache
+        # and fresh pragmas per session); keep connections pooled instead
+        kwargs.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    new_engine = create_async_engine(url, echo=False, future=True, **kwargs)
+    if url.get_backend_name() == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
+
+
+engine = create_engine_for(settings.DATABASE_URL)
 SessionLocal = async_sessionmaker(
     bind=engine, expire_on_commit=False, class_=AsyncSession
 )
@@ -0,0 +1,76 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: no file lock, see upgrade_database
+    fcntl = None
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.executor import run_io
+
+ALEMBIC_INI = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "alembic.ini",
+)
+# first revision: the schema create_all built before migrations existed
+BASELINE_REVISION = "0001"
+# arbitrary app-wide key for pg_advisory_xact_lock
+_MIGRATION_LOCK_ID = 72_690_001
+
+
+def alembic_config(connection=None) -> Config:
+    cfg = Config(ALEMBIC_INI)
+    if connection is not None:
+        cfg.attributes["connection"] = connection
+    return cfg
+
+
+def _upgrade(connection) -> None:
+    cfg = alembic_config(connection)
+    tables = set(inspect(connection).get_table_names())
+    if "documents" in tables and "alembic_version" not in tables:
+        # database from before migrations (create_all): stamp the baseline,
+        # the later revisions add whatever it is missing
+        command.stamp(cfg, BASELINE_REVISION)
+    command.upgrade(cfg, "head")
+
+
+def _sqlite_lock_path(engine: AsyncEngine) -> str | None:
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or not database or database == ":memory:":
+        return None
+    return f"{database}.migrate.lock"
+
+
+async def upgrade_database(engine: AsyncEngine) -> None:
+    """
+    Migrates to head. On Postgres this is one transaction behind an
+    advisory lock, so workers/nodes starting at once migrate exactly once.
+    On a SQLite file the same is done with flock() on a lock file next to
+    the database (POSIX only; elsewhere set DB_AUTO_MIGRATE=false and run
+    `alembic upgrade head` before starting several workers).
+    """
+    lock_path = _sqlite_lock_path(engine) if fcntl else None
+    if lock_path is None:
+        await _upgrade_database(engine)
+        return
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        # waits for another worker's migration without blocking the loop
+        await run_io(fcntl.flock, fd, fcntl.LOCK_EX)
+        await _upgrade_database(engine)
+    finally:
+        os.close(fd)  # releases the lock
+
+
+async def _upgrade_database(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(
+                text("SELECT pg_advisory_xact_lock(:id)"), {"id": _MIGRATION_LOCK_ID}
+            )
+        await conn.run_sync(_upgrade)
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer, DateTime, Text
+from sqlalchemy import String, Integer, DateTime, Text, Index, UniqueConstraint
 from datetime import datetime
 
 
@@ -14,14 +14,66 @@ class Document(Base):
     filename: Mapped[str] = mapped_column(String, nullable=False)
     path: Mapped[str] = mapped_column(String, nullable=False)
     pages: Mapped[int] = mapped_column(Integer, nullable=False)
+    # sha256 of the PDF bytes
+    content_hash: Mapped[str] = mapped_column(
+        String, nullable=True, index=True, unique=True
+    )
+    # page text index: pending/running/done/failed
+    index_status: Mapped[str] = mapped_column(
+        String, nullable=False, default="pending"
+    )
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    # history reads: WHERE doc_id = ? AND (created_at, id) > cursor ORDER BY ...
+    __table_args__ = (
+        Index("ix_chat_messages_doc_created", "doc_id", "created_at", "id"),
+    )
 
     id: Mapped[str] = mapped_column(String, primary_key=True)
     doc_id: Mapped[str] = mapped_column(String, nullable=True)
     role: Mapped[str] = mapped_column(String, nullable=False)  # user/assistant
     content: Mapped[str] = mapped_column(Text, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class PageText(Base):
+    __tablename__ = "page_texts"
+    __table_args__ = (
+        UniqueConstraint("doc_id", "page", name="uq_page_texts_doc_page"),
+    )
+
+    # stable integer rowid: the FTS index (app/db/search.py) points at it
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    doc_id: Mapped[str] = mapped_column(String, nullable=False)
+    page: Mapped[int] = mapped_column(Integer, nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    # queued/running/done/failed
+    status: Mapped[str] = mapped_column(String, nullable=False, default="queued")
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    processed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    succeeded: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    concurrency: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+
+class IngestItem(Base):
+    __tablename__ = "ingest_items"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    job_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    filename: Mapped[str] = mapped_column(String, nullable=False)
+    # queued/running/done/duplicate/failed
+    status: Mapped[str] = mapped_column(String, nullable=False, default="queued")
+    doc_id: Mapped[str] = mapped_column(String, nullable=True)
+    error: Mapped[str] = mapped_column(Text, nullable=True)
@@ -1,6 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.db.models import Document, ChatMessage
+from datetime import datetime
+from sqlalchemy import select, update, delete, tuple_
+from app.db.models import Document, ChatMessage, PageText, IngestJob, IngestItem
 
 
 async def insert_document(db: AsyncSession, doc: Document) -> None:
@@ -13,6 +14,186 @@ async def get_document(db: AsyncSession, doc_id: str) -> Document | None:
     return res.scalar_one_or_none()
 
 
+async def delete_document(db: AsyncSession, doc_id: str) -> None:
+    """
+    Removes a document row with its page texts and chat history, in one
+    transaction.
+    """
+    await db.execute(delete(PageText).where(PageText.doc_id == doc_id))
+    await db.execute(delete(ChatMessage).where(ChatMessage.doc_id == doc_id))
+    await db.execute(delete(Document).where(Document.id == doc_id))
+    await db.commit()
+
+
+async def get_document_by_hash(db: AsyncSession, content_hash: str) -> Document | None:
+    res = await db.execute(
+        select(Document).where(Document.content_hash == content_hash)
+    )
+    return res.scalar_one_or_none()
+
+
 async def insert_chat(db: AsyncSession, msg: ChatMessage) -> None:
     db.add(msg)
     await db.commit()
+
+
+async def insert_chats(db: AsyncSession, msgs: list[ChatMessage]) -> None:
+    """
+    Persists several chat rows (e.g. a user/assistant turn) in one transaction.
+    """
+    db.add_all(msgs)
+    await db.commit()
+
+
+async def set_index_status(db: AsyncSession, doc_id: str, status: str) -> None:
+    await db.execute(
+        update(Document).where(Document.id == doc_id).values(index_status=status)
+    )
+    await db.commit()
+
+
+async def replace_page_texts(db: AsyncSession, doc_id: str, texts: list[str]) -> None:
+    await db.execute(delete(PageText).where(PageText.doc_id == doc_id))
+    db.add_all(
+        PageText(doc_id=doc_id, page=i + 1, text=text) for i, text in enumerate(texts)
+    )
+    await db.commit()
+
+
+async def get_page_texts(db: AsyncSession, doc_id: str) -> list[str]:
+    res = await db.execute(
+        select(PageText.text).where(PageText.doc_id == doc_id).order_by(PageText.page)
+    )
+    return list(res.scalars().all())
+
+
+async def get_page_texts_for(
+    db: AsyncSession, doc_id: str, pages: list[int]
+) -> dict[int, str]:
+    res = await db.execute(
+        select(PageText.page, PageText.text).where(
+            PageText.doc_id == doc_id, PageText.page.in_(pages)
+        )
+    )
+    return {row.page: row.text for row in res}
+
+
+async def get_page_text(db: AsyncSession, doc_id: str, page: int) -> str | None:
+    res = await db.execute(
+        select(PageText.text).where(PageText.doc_id == doc_id, PageText.page == page)
+    )
+    return res.scalar_one_or_none()
+
+
+def _chat_history_query(
+    doc_id: str, after: tuple[datetime, str] | None = None, descending: bool = False
+):
+    key = tuple_(ChatMessage.created_at, ChatMessage.id)
+    q = select(ChatMessage).where(ChatMessage.doc_id == doc_id)
+    if after is not None:
+        q = q.where(key < tuple_(*after) if descending else key > tuple_(*after))
+    if descending:
+        return q.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+    return q.order_by(ChatMessage.created_at, ChatMessage.id)
+
+
+async def list_chat_messages(
+    db: AsyncSession,
+    doc_id: str,
+    limit: int,
+    after: tuple[datetime, str] | None = None,
+    descending: bool = False,
+) -> list[ChatMessage]:
+    """
+    Keyset page: rows strictly after the (created_at, id) cursor.
+    """
+    res = await db.execute(_chat_history_query(doc_id, after, descending).limit(limit))
+    return list(res.scalars().all())
+
+
+async def stream_chat_messages(db: AsyncSession, doc_id: str, batch_size: int = 500):
+    """
+    Yields every row for doc_id in order, fetching batch_size at a time.
+    """
+    res = await db.stream(
+        _chat_history_query(doc_id).execution_options(yield_per=batch_size)
+    )
+    async for msg in res.scalars():
+        yield msg
+
+
+async def insert_ingest_job(
+    db: AsyncSession, job: IngestJob, items: list[IngestItem]
+) -> None:
+    db.add(job)
+    db.add_all(items)
+    await db.commit()
+
+
+async def get_ingest_job(db: AsyncSession, job_id: str) -> IngestJob | None:
+    res = await db.execute(select(IngestJob).where(IngestJob.id == job_id))
+    return res.scalar_one_or_none()
+
+
+async def list_ingest_items(db: AsyncSession, job_id: str) -> list[IngestItem]:
+    res = await db.execute(
+        select(IngestItem).where(IngestItem.job_id == job_id).order_by(IngestItem.id)
+    )
+    return list(res.scalars().all())
+
+
+async def update_ingest_job(db: AsyncSession, job_id: str, **values) -> None:
+    await db.execute(update(IngestJob).where(IngestJob.id == job_id).values(**values))
+    await db.commit()
+
+
+async def replace_ingest_item(
+    db: AsyncSession, item_id: int, job_id: str, items: list[IngestItem]
+) -> None:
+    """
+    Swaps one item (a staged archive) for the files found in it and moves
+    the job counters along; items already failed count as processed.
+    """
+    failed = sum(1 for item in items if item.status == "failed")
+    await db.execute(delete(IngestItem).where(IngestItem.id == item_id))
+    db.add_all(items)
+    await db.execute(
+        update(IngestJob)
+        .where(IngestJob.id == job_id)
+        .values(
+            total=IngestJob.total + len(items) - 1,
+            processed=IngestJob.processed + failed,
+            failed=IngestJob.failed + failed,
+        )
+    )
+    await db.commit()
+
+
+async def finish_ingest_item(
+    db: AsyncSession,
+    item_id: int,
+    job_id: str,
+    status: str,
+    doc_id: str | None = None,
+    error: str | None = None,
+) -> None:
+    """
+    Records one file's outcome and bumps the job counters atomically
+    (workers finish concurrently).
+    """
+    ok = status in ("done", "duplicate")
+    await db.execute(
+        update(IngestItem)
+        .where(IngestItem.id == item_id)
+        .values(status=status, doc_id=doc_id, error=error)
+    )
+    await db.execute(
+        update(IngestJob)
+        .where(IngestJob.id == job_id)
+        .values(
+            processed=IngestJob.processed + 1,
+            succeeded=IngestJob.succeeded + (1 if ok else 0),
+            failed=IngestJob.failed + (0 if ok else 1),
+        )
+    )
+    await db.commit()
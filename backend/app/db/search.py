@@ -0,0 +1,110 @@
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# The full-text indexes are created by migrations/versions/0001_initial.py:
+# an external-content FTS5 table (page_fts) kept in step by triggers on
+# SQLite, a generated tsvector column (page_texts.tsv) with a GIN index on
+# Postgres.
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+# same markers and length as the FTS5 snippet()
+_PG_HEADLINE_OPTIONS = (
+    "StartSel=[, StopSel=], MaxWords=16, MinWords=6, "
+    "MaxFragments=1, FragmentDelimiter=…"
+)
+
+
+def to_match_query(query: str, any_term: bool = False) -> str | None:
+    """
+    User text -> safe FTS5 MATCH expression: every word quoted (no operator
+    injection), ANDed by default.
+    """
+    terms = [f'"{w}"' for w in _WORD.findall(query)]
+    if not terms:
+        return None
+    return (" OR " if any_term else " ").join(terms)
+
+
+async def search_pages(
+    db: AsyncSession,
+    query: str,
+    limit: int = 20,
+    offset: int = 0,
+    doc_id: str | None = None,
+    any_term: bool = False,
+) -> list[dict]:
+    """
+    Ranked (doc_id, page, snippet) hits, best first.
+    """
+    match = to_match_query(query, any_term)
+    if match is None:
+        return []
+
+    params = {"match": match, "limit": limit, "offset": offset, "doc_id": doc_id}
+    if db.bind.dialect.name == "sqlite":
+        sql = """
+            SELECT pt.doc_id, pt.page, d.filename,
+                   snippet(page_fts, 0, '[', ']', '…', 16) AS snippet,
+                   bm25(page_fts) AS score
+            FROM page_fts
+            JOIN page_texts pt ON pt.id = page_fts.rowid
+            JOIN documents d ON d.id = pt.doc_id
+            WHERE page_fts MATCH :match
+              AND (:doc_id IS NULL OR pt.doc_id = :doc_id)
+            ORDER BY rank
+            LIMIT :limit OFFSET :offset
+        """
+    elif db.bind.dialect.name == "postgresql":
+        # quoted words: websearch_to_tsquery never raises on user input
+        params["match"] = (" or " if any_term else " ").join(
+            f'"{w}"' for w in _WORD.findall(query)
+        )
+        # rank + page in the inner query; headlines only for the page
+        sql = f"""
+            SELECT hit.doc_id, hit.page, hit.filename, hit.score,
+                   ts_headline('english', pt.text, hit.q,
+                               '{_PG_HEADLINE_OPTIONS}') AS snippet
+            FROM (
+                SELECT pt.id, pt.doc_id, pt.page, d.filename, q,
+                       -ts_rank_cd(pt.tsv, q) AS score
+                FROM page_texts pt
+                JOIN documents d ON d.id = pt.doc_id,
+                     websearch_to_tsquery('english', :match) AS q
+                WHERE pt.tsv @@ q
+                  AND (CAST(:doc_id AS VARCHAR) IS NULL OR pt.doc_id = :doc_id)
+                ORDER BY score
+                LIMIT :limit OFFSET :offset
+            ) hit
+            JOIN page_texts pt ON pt.id = hit.id
+            ORDER BY hit.score
+        """
+    else:
+        # unindexed fallback for other backends: substring match on every term
+        words = _WORD.findall(query)
+        joiner = " OR " if any_term else " AND "
+        where = joiner.join(f"pt.text ILIKE :w{i}" for i in range(len(words)))
+        params.update({f"w{i}": f"%{w}%" for i, w in enumerate(words)})
+        sql = f"""
+            SELECT pt.doc_id, pt.page, d.filename,
+                   substr(pt.text, 1, 200) AS snippet, 0.0 AS score
+            FROM page_texts pt
+            JOIN documents d ON d.id = pt.doc_id
+            WHERE ({where})
+              AND (:doc_id IS NULL OR pt.doc_id = :doc_id)
+            ORDER BY pt.doc_id, pt.page
+            LIMIT :limit OFFSET :offset
+        """
+
+    res = await db.execute(text(sql), params)
+    return [
+        {
+            "doc_id": row.doc_id,
+            "filename": row.filename,
+            "page": row.page,
+            "snippet": row.snippet,
+            "score": round(-row.score, 4) if row.score else 0.0,
+        }
+        for row in res
+    ]
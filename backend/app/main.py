@@ -1,13 +1,45 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.core.config import settings
 from app.core.logging import setup_logging
+from app.core.executor import pool_stats, shutdown_pools
+from app.core.metrics import MetricsMiddleware, registry
 from app.api.routes import router
 from app.db.database import engine
-from app.db.models import Base
+from app.db.chat_writer import chat_writer
+from app.db.migrate import upgrade_database
+from app.services import document_service, layout_service, retrieval, tile_service
+from app.services.llm_router import router as llm_router
+from app.services.llm_service import llm_flight
+from app.services.metadata_cache import metadata_cache
+from app.services.response_cache import response_cache
+from app.utils.pdf_utils import doc_cache
 import os
 
 
+def _register_stats() -> None:
+    # existing stats() dicts, exported as gauges at scrape time
+    registry.register_stats("pool", pool_stats)
+    registry.register_stats("pdf_cache", doc_cache.stats)
+    registry.register_stats("crop_cache", document_service.crop_cache.stats)
+    registry.register_stats("tile_cache", tile_service.tile_cache.stats)
+    registry.register_stats("layout_cache", layout_service.layout_cache.stats)
+    registry.register_stats("response_cache", response_cache.stats)
+    registry.register_stats("document_cache", metadata_cache.stats)
+    registry.register_stats("retrieval_index_cache", retrieval.index_cache.stats)
+    registry.register_stats("chat_writer", chat_writer.stats)
+    registry.register_stats(
+        "single_flight",
+        lambda: {
+            "crop": document_service.crop_flight.stats(),
+            "llm": llm_flight.stats(),
+            "tile": tile_service.tile_flight.stats(),
+        },
+    )
+    registry.register_stats("llm", llm_router.gauges)
+
+
 def create_app() -> FastAPI:
     setup_logging()
 
@@ -27,10 +59,37 @@ def create_app() -> FastAPI:
 
     app.include_router(router, prefix="/api")
 
+    @app.exception_handler(FileNotFoundError)
+    async def _document_file_missing(request: Request, exc: FileNotFoundError):
+        # another worker deleted the document while this one still had its
+        # row cached (DOC_CACHE_TTL_SECONDS): drop the row, answer 404
+        if exc.filename and metadata_cache.evict_file(exc.filename):
+            return JSONResponse(
+                status_code=404, content={"detail": "Document not found"}
+            )
+        raise exc
+
+    if settings.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+        _register_stats()
+
+        @app.get("/metrics", include_in_schema=False)
+        async def metrics():
+            return PlainTextResponse(
+                registry.render(), media_type="text/plain; version=0.0.4"
+            )
+
     @app.on_event("startup")
     async def _startup():
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+        if settings.DB_AUTO_MIGRATE:
+            await upgrade_database(engine)
+        if settings.CHAT_WRITE_BEHIND:
+            await chat_writer.start()
+
+    @app.on_event("shutdown")
+    async def _shutdown():
+        await chat_writer.stop()
+        shutdown_pools()
 
     return app
 
@@ -1,18 +1,39 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, Literal, Any
+from datetime import datetime
 
 
 class UploadResponse(BaseModel):
     doc_id: str
     filename: str
     pages: int
+    index_status: str = "pending"
+    # true when the content matched an existing document
+    deduplicated: bool = False
+
+
+class Region(BaseModel):
+    page: int = Field(ge=1)
+    content: Optional[str] = None  # text: omitted = whole page text
+    bbox: Optional[dict] = None  # image: {x,y,w,h}, same coords as Selection.bbox
 
 
 class Selection(BaseModel):
     type: Literal["text", "image"]
-    page: int = Field(ge=1)
+    page: Optional[int] = Field(default=None, ge=1)
     content: Optional[str] = None
     bbox: Optional[dict] = None  # {x,y,w,h} in PDF pixel coords on rendered page
+    # several pages/regions in one question (text across a page break, a
+    # figure and its caption, ...); page/content/bbox are then ignored
+    regions: Optional[list[Region]] = Field(default=None, min_length=1)
+
+    @model_validator(mode="after")
+    def _page_or_regions(self):
+        if self.page is None:
+            if not self.regions:
+                raise ValueError("selection.page or selection.regions required")
+            self.page = self.regions[0].page
+        return self
 
 
 class AskRequest(BaseModel):
@@ -20,9 +41,73 @@ class AskRequest(BaseModel):
     user_query: str
     selection: Selection
     document_id: Optional[str] = None
+    # response cache: use | refresh (skip lookup, overwrite) | bypass
+    cache: Literal["use", "refresh", "bypass"] = "use"
+    # local retrieval for text selections; None = RETRIEVAL_ENABLED
+    retrieval: Optional[bool] = None
+
+
+class AskBatchRequest(BaseModel):
+    document_id: str
+    # each item's document_id may be omitted (or must match)
+    items: list[AskRequest] = Field(min_length=1)
+    # items in flight at once; None = ASK_BATCH_CONCURRENCY
+    concurrency: Optional[int] = Field(default=None, ge=1)
 
 
 class AskResponse(BaseModel):
     model: str
     answer: str
     used_context: dict
+    cache: Optional[dict] = None
+
+
+class ChatMessageOut(BaseModel):
+    id: str
+    role: str
+    content: str
+    created_at: datetime
+
+
+class ChatHistoryResponse(BaseModel):
+    doc_id: str
+    items: list[ChatMessageOut]
+    next_cursor: Optional[str] = None
+
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    processed: int
+    succeeded: int
+    failed: int
+    progress: float
+    concurrency: int
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class IngestItemOut(BaseModel):
+    filename: str
+    status: str
+    doc_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class IngestItemsResponse(BaseModel):
+    job_id: str
+    items: list[IngestItemOut]
+
+
+class SearchHit(BaseModel):
+    doc_id: str
+    filename: str
+    page: int
+    snippet: str
+    score: float
+
+
+class SearchResponse(BaseModel):
+    query: str
+    hits: list[SearchHit]
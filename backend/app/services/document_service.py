@@ -1,8 +1,39 @@
+import asyncio
+import hashlib
+import logging
 import os
 import uuid
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
-from app.utils.pdf_utils import get_page_count, extract_page_text, render_page_to_image
-from app.utils.image_utils import crop_bbox
+from app.core.executor import run_io, run_cpu
+from app.core.metrics import span
+from app.db import repo
+from app.db.database import SessionLocal
+from app.db.models import Document
+from app.services.metadata_cache import metadata_cache
+from app.services.retrieval import index_cache as retrieval_index_cache
+from app.services.storage import storage
+from app.utils.disk_cache import DiskCache
+from app.utils.singleflight import SingleFlight
+from app.utils.pdf_utils import (
+    doc_cache,
+    get_page_count,
+    extract_page_text,
+    extract_all_page_texts,
+    render_region_to_bytes,
+)
+from app.utils.image_utils import IMAGE_FORMATS
+
+logger = logging.getLogger(__name__)
+
+crop_cache = DiskCache(
+    settings.IMAGE_DIR,
+    max_bytes=settings.CROP_CACHE_MAX_BYTES,
+    max_age_seconds=settings.CROP_CACHE_MAX_AGE_SECONDS,
+    prefix="crop_",
+)
+crop_flight = SingleFlight("crop")
 
 
 def ensure_dirs():
@@ -10,31 +41,356 @@ def ensure_dirs():
     os.makedirs(settings.IMAGE_DIR, exist_ok=True)
 
 
-async def save_pdf(file_bytes: bytes, original_name: str) -> dict:
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidPdf(Exception):
+    pass
+
+
+def copy_and_hash(src, dst_path: str, max_bytes: int, chunk_size: int):
+    digest = hashlib.sha256()
+    size = 0
+    with open(dst_path, "wb") as out:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"upload exceeds {max_bytes} bytes")
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest(), size
+
+
+def staging_path() -> str:
+    # always local; storage.store() moves the finished file into place
+    return os.path.join(settings.PDF_DIR, f".upload_{uuid.uuid4().hex}.part")
+
+
+async def stage_upload(fileobj) -> dict:
+    """
+    Streams a file-like object into a staging file in PDF_DIR in
+    UPLOAD_CHUNK_BYTES chunks, hashing as it goes, so memory stays
+    bounded by one chunk. Returns {"path", "content_hash", "size"}.
+    """
     ensure_dirs()
+    tmp_path = staging_path()
+    try:
+        content_hash, size = await run_io(
+            copy_and_hash,
+            fileobj,
+            tmp_path,
+            settings.MAX_UPLOAD_BYTES,
+            settings.UPLOAD_CHUNK_BYTES,
+        )
+    except BaseException:
+        discard_staged({"path": tmp_path})
+        raise
+    return {"path": tmp_path, "content_hash": content_hash, "size": size}
+
+
+def discard_staged(staged: dict) -> None:
+    try:
+        os.remove(staged["path"])
+    except FileNotFoundError:
+        pass
+
+
+async def commit_staged(staged: dict, original_name: str) -> dict:
+    """
+    Moves a staged upload into document storage and reads its page count.
+    """
     doc_id = f"doc_{uuid.uuid4().hex[:12]}"
     safe_name = original_name.replace("/", "_").replace("\\", "_")
-    pdf_path = os.path.join(settings.PDF_DIR, f"{doc_id}_{safe_name}")
+    try:
+        pages = await run_io(get_page_count, staged["path"])
+    except Exception as e:
+        discard_staged(staged)
+        raise InvalidPdf(str(e)) from e
+    finally:
+        # the handle cache is keyed by path; the staged path goes away
+        doc_cache.evict(staged["path"])
+
+    ref = await run_io(storage.store, staged["path"], f"{doc_id}_{safe_name}")
+    return {
+        "doc_id": doc_id,
+        "filename": safe_name,
+        "path": ref,
+        "pages": pages,
+        "content_hash": staged["content_hash"],
+    }
+
+
+async def register_staged(
+    db: AsyncSession, staged: dict, original_name: str
+) -> tuple[Document, bool]:
+    """
+    Dedups a staged upload by content hash, otherwise moves it into place
+    and inserts the Document. Returns (document, deduplicated).
+    """
+    existing = await repo.get_document_by_hash(db, staged["content_hash"])
+    if existing:
+        discard_staged(staged)
+        return existing, True
+
+    saved = await commit_staged(staged, original_name)
+    doc = Document(
+        id=saved["doc_id"],
+        filename=saved["filename"],
+        path=saved["path"],
+        pages=saved["pages"],
+        content_hash=saved["content_hash"],
+    )
+    try:
+        await repo.insert_document(db, doc)
+    except IntegrityError:
+        # same content registered concurrently; keep the first copy
+        await db.rollback()
+        remove_pdf(saved["path"])
+        return await repo.get_document_by_hash(db, saved["content_hash"]), True
+    return doc, False
 
-    with open(pdf_path, "wb") as f:
-        f.write(file_bytes)
 
-    pages = get_page_count(pdf_path)
-    return {"doc_id": doc_id, "filename": safe_name, "path": pdf_path, "pages": pages}
+def remove_pdf(ref: str) -> None:
+    if storage.is_local:
+        doc_cache.evict(storage.local_path(ref))
+    storage.delete(ref)
+
+
+async def local_pdf_path(ref: str) -> str:
+    """
+    Local path for a Document.path ref (remote backends may fetch it).
+    """
+    if storage.is_local:
+        return storage.local_path(ref)
+    return await run_io(storage.local_path, ref)
+
+
+async def get_document(db: AsyncSession, doc_id: str) -> Document | None:
+    """
+    Document row through the metadata cache; the returned object is a
+    detached snapshot (read-only by convention).
+    """
+    doc = metadata_cache.get(doc_id)
+    if doc is not None:
+        return doc
+    doc = await repo.get_document(db, doc_id)
+    if doc is None:
+        return None
+    return metadata_cache.put(doc)
+
+
+async def set_index_status(db: AsyncSession, doc_id: str, status: str) -> None:
+    await repo.set_index_status(db, doc_id, status)
+    metadata_cache.evict(doc_id)
+
+
+async def delete_document(db: AsyncSession, doc: Document) -> str | None:
+    """
+    Deletes the row (with page texts and chat history), the stored file,
+    its crops and every per-document cache entry in this process. Returns
+    the document's cache key prefix (see cache_prefix) so the tile and
+    layout caches can drop theirs too; None if it can't be derived.
+    """
+    try:
+        prefix = cache_prefix(document_fingerprint(doc))
+    except FileNotFoundError:
+        prefix = None  # pre-hashing row whose file is already gone
+    await repo.delete_document(db, doc.id)
+    metadata_cache.evict(doc.id)
+    retrieval_index_cache.evict(doc.id)
+    await run_io(remove_pdf, doc.path)
+    if prefix:
+        await run_io(crop_cache.remove_prefix, prefix)
+    return prefix
+
+
+async def index_page_texts(doc_id: str, ref: str) -> None:
+    """
+    Background job: extracts every page once into the page_texts table.
+    """
+    async with SessionLocal() as db:
+        await set_index_status(db, doc_id, "running")
+        try:
+            pdf_path = await local_pdf_path(ref)
+            texts = await run_io(extract_all_page_texts, pdf_path)
+            await repo.replace_page_texts(db, doc_id, texts)
+            retrieval_index_cache.evict(doc_id)
+        except Exception:
+            logger.exception("page text indexing failed for %s", doc_id)
+            await db.rollback()
+            await set_index_status(db, doc_id, "failed")
+            return
+        await set_index_status(db, doc_id, "done")
 
 
 def get_page_text(pdf_path: str, page: int) -> str:
     return extract_page_text(pdf_path, page)
 
 
-def crop_page_region_to_file(pdf_path: str, page: int, bbox: dict) -> str:
+async def read_page_text(db: AsyncSession, doc: Document, page: int) -> str:
     """
-    Renders page -> crops bbox -> saves png -> returns path
+    Indexed lookup, falling back to live extraction while indexing is
+    still pending/running (or failed).
     """
-    ensure_dirs()
-    img = render_page_to_image(pdf_path, page, zoom=2.0)
-    cropped = crop_bbox(img, bbox)
+    if doc.index_status == "done":
+        with span("page_text_lookup"):
+            text = await repo.get_page_text(db, doc.id, page)
+        if text is not None:
+            return text
+    with span("extract_page_text"):
+        pdf_path = await local_pdf_path(doc.path)
+        return await run_io(get_page_text, pdf_path, page)
+
+
+async def read_page_texts(
+    db: AsyncSession, doc: Document, pages: list[int]
+) -> dict[int, str]:
+    """
+    read_page_text for several pages: one indexed query, and live
+    extraction of whatever is missing in parallel on the I/O pool.
+    """
+    wanted = sorted(set(pages))
+    texts: dict[int, str] = {}
+    if doc.index_status == "done":
+        with span("page_text_lookup"):
+            texts = await repo.get_page_texts_for(db, doc.id, wanted)
+    missing = [p for p in wanted if p not in texts]
+    if missing:
+        with span("extract_page_text"):
+            pdf_path = await local_pdf_path(doc.path)
+            extracted = await asyncio.gather(
+                *(run_io(get_page_text, pdf_path, p) for p in missing)
+            )
+        texts.update(zip(missing, extracted))
+    return texts
+
+
+def crop_options() -> dict:
+    """
+    Render/encode settings, resolved in the caller's process so worker
+    processes render exactly what the cache key describes.
+    """
+    return {
+        "bbox_zoom": settings.CROP_BBOX_ZOOM,
+        "zoom": settings.CROP_ZOOM,
+        "max_pixels": settings.CROP_MAX_PIXELS,
+        "fmt": settings.CROP_FORMAT,
+        "quality": settings.CROP_QUALITY,
+        "png_compress_level": settings.CROP_PNG_COMPRESS_LEVEL,
+    }
+
+
+def crop_page_region(
+    pdf_path: str, page: int, bbox: dict, options: dict | None = None
+) -> bytes:
+    """
+    Renders only the bbox region and encodes it in memory.
+    """
+    return render_region_to_bytes(pdf_path, page, bbox, **(options or crop_options()))
+
+
+def document_fingerprint(doc: Document) -> str:
+    if doc.content_hash:
+        return doc.content_hash
+    # rows uploaded before content hashing (local files only)
+    path = storage.local_path(doc.path)
+    return f"{os.path.abspath(path)}:{os.stat(path).st_mtime_ns}"
+
+
+def page_text_etag(doc: Document, page: int) -> str:
+    raw = f"text:{document_fingerprint(doc)}:{page}"
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def cache_prefix(fingerprint: str) -> str:
+    """
+    Leading part of every disk-cache key derived from one document (crops,
+    tiles, layouts), so deleting it can drop them all.
+    """
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16] + "_"
+
+
+def crop_cache_key(fingerprint: str, page: int, bbox: dict, options: dict) -> str:
+    x, y = int(bbox["x"]), int(bbox["y"])
+    w, h = max(int(bbox["w"]), 1), max(int(bbox["h"]), 1)
+    opts = ",".join(f"{k}={options[k]}" for k in sorted(options))
+    raw = f"{fingerprint}|{page}|{x},{y},{w},{h}|{opts}"
+    return cache_prefix(fingerprint) + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def load_or_render(
+    cache: DiskCache, key: str, ext: str, render, name: str
+) -> tuple[bytes, str]:
+    """
+    Bytes for `key` from a DiskCache, or from `await render()` on a miss
+    (then written back). Returns (data, cached file path). All disk access
+    runs in the I/O pool; `name` prefixes the metric spans.
+    """
+    cached = await run_io(cache.get, key, ext)
+    if cached:
+        try:
+            with span(f"{name}_cache_read"):
+                return await run_io(_read_file, cached), cached
+        except FileNotFoundError:
+            pass  # evicted between lookup and read
+
+    with span(f"{name}_render"):
+        data = await render()
+    with span(f"{name}_cache_write"):
+        path = await run_io(cache.put, key, ext, data)
+    return data, path
+
+
+async def get_crop(doc: Document, page: int, bbox: dict) -> dict:
+    """
+    Returns {"data": encoded bytes, "mime": ..., "path": file or None}.
+
+    With CROP_PERSIST the crop is content-addressed in IMAGE_DIR and
+    served from there when the same document/page/bbox/settings was
+    rendered before; otherwise it never touches disk.
+    """
+    options = crop_options()
+    key = crop_cache_key(document_fingerprint(doc), page, bbox, options)
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await _load_or_render_crop(doc.path, page, bbox, options, key)
+    # identical concurrent selections share one render
+    crop, _ = await crop_flight.do(
+        key, lambda: _load_or_render_crop(doc.path, page, bbox, options, key)
+    )
+    return crop
+
+
+async def get_crops(doc: Document, regions: list[dict]) -> list[dict]:
+    """
+    get_crop for every {"page", "bbox"} region, rendered concurrently (the
+    CPU pool bounds real parallelism); results keep the region order.
+    """
+    return list(
+        await asyncio.gather(*(get_crop(doc, r["page"], r["bbox"]) for r in regions))
+    )
+
+
+async def _load_or_render_crop(
+    ref: str, page: int, bbox: dict, options: dict, key: str
+) -> dict:
+    _, mime, ext = IMAGE_FORMATS[options["fmt"]]
+
+    async def render() -> bytes:
+        # clip render + encode, in a CPU-pool worker
+        pdf_path = await local_pdf_path(ref)
+        return await run_cpu(crop_page_region, pdf_path, page, bbox, options)
 
-    out_path = os.path.join(settings.IMAGE_DIR, f"crop_{uuid.uuid4().hex[:12]}.png")
-    cropped.save(out_path, format="PNG")
-    return out_path
+    if not settings.CROP_PERSIST:
+        with span("crop_render"):
+            return {"data": await render(), "mime": mime, "path": None}
+    data, path = await load_or_render(crop_cache, key, ext, render, "crop")
+    return {"data": data, "mime": mime, "path": path}
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import os
+import tarfile
+import uuid
+import zipfile
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.executor import run_io
+from app.db import repo
+from app.db.database import SessionLocal
+from app.db.models import IngestJob, IngestItem
+from app.services import document_service, tile_service
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = (
+    ".zip",
+    ".tar",
+    ".tar.gz",
+    ".tgz",
+    ".tar.bz2",
+    ".tbz2",
+    ".tar.xz",
+    ".txz",
+)
+
+
+class TooManyFiles(Exception):
+    pass
+
+
+def _stage_member(src, name: str) -> dict:
+    dst = document_service.staging_path()
+    try:
+        content_hash, size = document_service.copy_and_hash(
+            src, dst, settings.MAX_UPLOAD_BYTES, settings.UPLOAD_CHUNK_BYTES
+        )
+    except document_service.UploadTooLarge:
+        document_service.discard_staged({"path": dst})
+        return {"filename": name, "error": "File too large"}
+    return {"filename": name, "path": dst, "content_hash": content_hash, "size": size}
+
+
+def _extract_pdfs(archive_path: str, archive_name: str, limit: int) -> list[dict]:
+    """
+    Streams every *.pdf member into its own staging file. Only member
+    basenames are kept, so archive paths can't escape the staging dir.
+    """
+    staged: list[dict] = []
+
+    def _add(src, member_name: str):
+        if len(staged) >= limit:
+            raise TooManyFiles(f"more than {limit} files")
+        staged.append(_stage_member(src, os.path.basename(member_name)))
+
+    try:
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                        continue
+                    with zf.open(info) as src:
+                        _add(src, info.filename)
+        elif tarfile.is_tarfile(archive_path):
+            with tarfile.open(archive_path, "r:*") as tf:
+                for member in tf:
+                    if not member.isfile() or not member.name.lower().endswith(".pdf"):
+                        continue
+                    src = tf.extractfile(member)
+                    if src is not None:
+                        with src:
+                            _add(src, member.name)
+        else:
+            return [{"filename": archive_name, "error": "Unsupported archive"}]
+    except TooManyFiles:
+        for item in staged:
+            if "path" in item:
+                document_service.discard_staged(item)
+        raise
+    except (zipfile.BadZipFile, tarfile.TarError, OSError) as e:
+        staged.append({"filename": archive_name, "error": f"Corrupt archive: {e}"})
+    return staged
+
+
+async def stage_files(files) -> list[dict]:
+    """
+    Streams each upload to a staging file before the request ends; nothing
+    is unpacked or parsed here. Each entry is {"filename", "path", ...}
+    (archives carry "archive": True and are expanded by run_job) or
+    {"filename", "error"} for files rejected up front.
+    """
+    if len(files) > settings.INGEST_MAX_FILES:
+        raise TooManyFiles(f"more than {settings.INGEST_MAX_FILES} files")
+    staged: list[dict] = []
+    try:
+        for upload in files:
+            name = os.path.basename(upload.filename or "upload")
+            lower = name.lower()
+            if lower.endswith(ARCHIVE_SUFFIXES):
+                archive_path = document_service.staging_path()
+                try:
+                    await run_io(
+                        document_service.copy_and_hash,
+                        upload.file,
+                        archive_path,
+                        settings.INGEST_MAX_ARCHIVE_BYTES,
+                        settings.UPLOAD_CHUNK_BYTES,
+                    )
+                except document_service.UploadTooLarge:
+                    document_service.discard_staged({"path": archive_path})
+                    staged.append({"filename": name, "error": "Archive too large"})
+                    continue
+                except BaseException:
+                    document_service.discard_staged({"path": archive_path})
+                    raise
+                staged.append({"filename": name, "path": archive_path, "archive": True})
+            elif lower.endswith(".pdf"):
+                try:
+                    item = await document_service.stage_upload(upload.file)
+                    staged.append({"filename": name, **item})
+                except document_service.UploadTooLarge:
+                    staged.append({"filename": name, "error": "File too large"})
+            else:
+                staged.append({"filename": name, "error": "Only PDF files supported"})
+    except BaseException:
+        discard_all(staged)
+        raise
+    return staged
+
+
+def discard_all(staged: list[dict]) -> None:
+    for item in staged:
+        if "path" in item:
+            document_service.discard_staged(item)
+
+
+def resolve_concurrency(requested: int | None) -> int:
+    n = requested or settings.INGEST_CONCURRENCY
+    return max(1, min(n, settings.INGEST_MAX_CONCURRENCY))
+
+
+async def create_job(
+    db: AsyncSession, staged: list[dict], concurrency: int
+) -> tuple[IngestJob, list[tuple[int, dict]]]:
+    """
+    Persists the job and one item per file; files rejected while staging
+    are recorded as failed straight away. Returns (job, queued work).
+    """
+    rejected = sum(1 for s in staged if "error" in s)
+    job_id = f"job_{uuid.uuid4().hex[:12]}"
+    job = IngestJob(
+        id=job_id,
+        status="queued",
+        total=len(staged),
+        processed=rejected,
+        failed=rejected,
+        concurrency=concurrency,
+    )
+    items = _items(job_id, staged)
+    await repo.insert_ingest_job(db, job, items)
+    return job, _work(items, staged)
+
+
+def _items(job_id: str, staged: list[dict]) -> list[IngestItem]:
+    return [
+        IngestItem(
+            job_id=job_id,
+            filename=s["filename"],
+            status="failed" if "error" in s else "queued",
+            error=s.get("error"),
+        )
+        for s in staged
+    ]
+
+
+def _work(items: list[IngestItem], staged: list[dict]) -> list[tuple[int, dict]]:
+    return [(item.id, s) for item, s in zip(items, staged) if "error" not in s]
+
+
+async def _expand_archive(
+    db: AsyncSession, job_id: str, item_id: int, archive: dict, limit: int
+) -> tuple[list[tuple[int, dict]], int]:
+    """
+    Extracts the PDFs of a staged archive and replaces the archive's item
+    with one item per member; if the archive holds more than `limit` PDFs
+    its item fails instead. Returns (queued work, number of items now
+    standing for the archive).
+    """
+    try:
+        members = await run_io(
+            _extract_pdfs, archive["path"], archive["filename"], limit
+        )
+    except TooManyFiles as e:
+        await repo.finish_ingest_item(db, item_id, job_id, "failed", error=str(e))
+        return [], 1
+    finally:
+        document_service.discard_staged(archive)
+    items = _items(job_id, members)
+    await repo.replace_ingest_item(db, item_id, job_id, items)
+    return _work(items, members), len(items)
+
+
+async def _ingest_one(job_id: str, item_id: int, staged: dict, index_text: bool):
+    async with SessionLocal() as db:
+        try:
+            doc, duplicate = await document_service.register_staged(
+                db, staged, staged["filename"]
+            )
+        except Exception as e:
+            document_service.discard_staged(staged)
+            await db.rollback()
+            error = (
+                "Invalid PDF file"
+                if isinstance(e, document_service.InvalidPdf)
+                else f"{type(e).__name__}: {e}"
+            )
+            await repo.finish_ingest_item(db, item_id, job_id, "failed", error=error)
+            return
+        await repo.finish_ingest_item(
+            db, item_id, job_id, "duplicate" if duplicate else "done", doc_id=doc.id
+        )
+
+    if duplicate:
+        return
+    if settings.THUMBNAIL_ON_UPLOAD:
+        await tile_service.prerender_first_thumbnail(doc)
+    if index_text:
+        await document_service.index_page_texts(doc.id, doc.path)
+
+
+async def run_job(
+    job_id: str, work: list[tuple[int, dict]], concurrency: int, index_text: bool
+) -> None:
+    """
+    Background job: expands staged archives into their PDFs (one at a
+    time, at most INGEST_MAX_FILES files per job), then a worker pool
+    saves, page-counts and indexes at most `concurrency` files at once.
+    """
+    files: list[tuple[int, dict]] = []
+    async with SessionLocal() as db:
+        await repo.update_ingest_job(db, job_id, status="running")
+        total = (await repo.get_ingest_job(db, job_id)).total
+        for item_id, staged in work:
+            if not staged.get("archive"):
+                files.append((item_id, staged))
+                continue
+            # the archive's own item is replaced by its members
+            limit = settings.INGEST_MAX_FILES - total + 1
+            try:
+                members, n_items = await _expand_archive(
+                    db, job_id, item_id, staged, limit
+                )
+            except Exception as e:
+                logger.exception("ingest job %s: expanding %s failed", job_id, item_id)
+                await db.rollback()
+                await repo.finish_ingest_item(
+                    db, item_id, job_id, "failed", error=f"{type(e).__name__}: {e}"
+                )
+                continue
+            total += n_items - 1
+            files.extend(members)
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def _worker(item_id: int, staged: dict):
+        async with slots:
+            try:
+                await _ingest_one(job_id, item_id, staged, index_text)
+            except Exception:
+                logger.exception("ingest job %s item %s crashed", job_id, item_id)
+
+    await asyncio.gather(*(_worker(item_id, s) for item_id, s in files))
+
+    async with SessionLocal() as db:
+        job = await repo.get_ingest_job(db, job_id)
+        status = "failed" if job.total and job.failed == job.total else "done"
+        await repo.update_ingest_job(
+            db, job_id, status=status, finished_at=datetime.utcnow()
+        )
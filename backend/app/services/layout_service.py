@@ -0,0 +1,112 @@
+import hashlib
+import os
+
+from app.core.config import settings
+from app.core.executor import run_io
+from app.core.metrics import span
+from app.db.models import Document
+from app.services.document_service import (
+    cache_prefix,
+    document_fingerprint,
+    local_pdf_path,
+)
+from app.utils.disk_cache import DiskCache
+from app.utils.layout import PageLayout
+from app.utils.lru import LRUCache
+from app.utils.pdf_utils import extract_page_layout
+from app.utils.singleflight import SingleFlight
+
+# serialized layouts survive restarts; decoded ones stay in memory
+layout_disk_cache = DiskCache(
+    os.path.join(settings.STORAGE_DIR, "layout"),
+    max_bytes=settings.LAYOUT_CACHE_MAX_BYTES,
+)
+layout_flight = SingleFlight("layout")
+
+
+class _LayoutCache(LRUCache):
+    def stats(self) -> dict:
+        layouts = self.values()
+        return {**super().stats(), "bytes": sum(x.nbytes() for x in layouts)}
+
+
+layout_cache = _LayoutCache(settings.LAYOUT_CACHE_PAGES)
+
+
+class LayoutNotFound(Exception):
+    pass
+
+
+def layout_key(doc: Document, page: int) -> str:
+    fingerprint = document_fingerprint(doc)
+    raw = f"layout:v1:{fingerprint}:{page}"
+    return cache_prefix(fingerprint) + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _read_layout(path: str) -> PageLayout:
+    with open(path, "rb") as f:
+        return PageLayout.from_bytes(f.read())
+
+
+def _write_layout(key: str, layout: PageLayout) -> None:
+    layout_disk_cache.put(key, ".layout", layout.to_bytes())
+
+
+async def _load_or_extract(ref: str, page: int, key: str) -> PageLayout:
+    cached = await run_io(layout_disk_cache.get, key, ".layout")
+    if cached:
+        try:
+            layout = await run_io(_read_layout, cached)
+            layout_cache.put(key, layout)
+            return layout
+        except (FileNotFoundError, ValueError):
+            pass  # evicted or unreadable: extract again
+    with span("extract_page_layout"):
+        pdf_path = await local_pdf_path(ref)
+        layout = await run_io(extract_page_layout, pdf_path, page)
+    layout_cache.put(key, layout)
+    await run_io(_write_layout, key, layout)
+    return layout
+
+
+async def get_layout(doc: Document, page: int) -> PageLayout:
+    """
+    Structured layout of one page, extracted once per document content
+    and page (memory, then disk; concurrent misses share one extraction).
+    """
+    if page < 1 or page > doc.pages:
+        raise LayoutNotFound(f"page {page} out of range")
+    key = layout_key(doc, page)
+    layout = layout_cache.get(key)
+    if layout is not None:
+        return layout
+    layout, _ = await layout_flight.do(
+        key, lambda: _load_or_extract(doc.path, page, key)
+    )
+    return layout
+
+
+def bbox_to_rect(bbox: dict, bbox_zoom: float) -> tuple[float, float, float, float]:
+    """Selection bbox (pixels at bbox_zoom) -> page rectangle in points."""
+    x, y = float(bbox["x"]) / bbox_zoom, float(bbox["y"]) / bbox_zoom
+    w, h = float(bbox["w"]) / bbox_zoom, float(bbox["h"]) / bbox_zoom
+    return x, y, x + w, y + h
+
+
+async def text_in_bbox(doc: Document, page: int, bbox: dict) -> str:
+    """
+    Text of the words inside an image selection (bbox in the same pixel
+    coords as crops, i.e. at CROP_BBOX_ZOOM).
+    """
+    layout = await get_layout(doc, page)
+    with span("layout_lookup"):
+        return layout.text_in_rect(
+            *bbox_to_rect(bbox, settings.CROP_BBOX_ZOOM),
+            min_overlap=settings.LAYOUT_MIN_OVERLAP,
+        )
+
+
+async def forget_document(prefix: str) -> None:
+    """Drops a deleted document's layouts (see cache_prefix)."""
+    layout_cache.evict_where(lambda key, _: key.startswith(prefix))
+    await run_io(layout_disk_cache.remove_prefix, prefix)
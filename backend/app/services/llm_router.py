@@ -0,0 +1,280 @@
+import asyncio
+import bisect
+import logging
+import random
+import time
+from typing import Awaitable, Callable
+
+from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in ms; the last bucket is +Inf
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# upstream statuses worth retrying on the same model
+_RETRYABLE_STATUS = {408, 409, 425, 429}
+
+llm_seconds = registry.histogram(
+    "llm_request_seconds", "Upstream LLM call latency by model (successful calls)."
+)
+llm_attempts = registry.counter(
+    "llm_attempts_total", "Upstream LLM attempts by model and outcome."
+)
+
+
+class LLMUnavailable(Exception):
+    """Every model in the chain failed; `errors` holds (model, error) pairs."""
+
+    def __init__(self, errors: list[tuple[str, str]]):
+        self.errors = errors
+        last = errors[-1] if errors else ("", "no models configured")
+        super().__init__(
+            f"LLM call failed on {len(errors)} attempt(s); last: {last[1]}"
+        )
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and (status in _RETRYABLE_STATUS or status >= 500)
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Full jitter: uniform(0, min(cap, base * 2**attempt))."""
+    ceiling = min(settings.LLM_RETRY_MAX_MS, settings.LLM_RETRY_BASE_MS * 2**attempt)
+    return random.uniform(0, ceiling) / 1000
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return float(self.buckets[i]) if i < len(self.buckets) else None
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            "buckets_ms": list(self.buckets),
+            "counts": list(self.counts),
+            "count": self.total,
+            "sum_ms": round(self.sum_ms, 1),
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+        }
+
+
+class _ModelStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.fallbacks = 0  # calls this model served after an earlier one failed
+        self.in_flight = 0
+        self.waiting = 0
+
+
+class ModelRouter:
+    """
+    Picks the model for a request and runs upstream calls with a
+    per-model concurrency limit, a timeout, retries with jittered backoff
+    and fail-over along LLM_FALLBACK_MODELS.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._sems: dict[str, asyncio.Semaphore] = {}
+        self._stats: dict[str, _ModelStats] = {}
+
+    def choose(
+        self, requested: str | None, prompt_plan: dict | None = None, image=None
+    ) -> str:
+        """
+        Explicit model > cheap model for short text-only prompts > default.
+        """
+        if requested and requested.strip():
+            return requested.strip()
+        cheap = settings.LLM_CHEAP_MODEL
+        if cheap and image is None and prompt_plan is not None:
+            tokens = prompt_plan.get("used_context", {}).get("prompt_tokens")
+            if tokens is not None and tokens <= settings.LLM_CHEAP_MAX_PROMPT_TOKENS:
+                return cheap
+        return settings.DEFAULT_MODEL
+
+    def chain(self, model: str) -> list[str]:
+        return [model] + [m for m in settings.fallback_models_list() if m != model]
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        # semaphores bind to the running loop; start over if it changed
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._sems = {}
+        sem = self._sems.get(model)
+        if sem is None:
+            limit = settings.LLM_MODEL_CONCURRENCY.get(
+                model, settings.LLM_MAX_CONCURRENCY
+            )
+            sem = self._sems[model] = asyncio.Semaphore(limit)
+        return sem
+
+    def _model_stats(self, model: str) -> _ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = _ModelStats()
+        return stats
+
+    async def _acquire(self, model: str) -> asyncio.Semaphore:
+        sem = self._semaphore(model)
+        stats = self._model_stats(model)
+        stats.waiting += 1
+        try:
+            await sem.acquire()
+        finally:
+            stats.waiting -= 1
+        stats.in_flight += 1
+        return sem
+
+    def _release(self, model: str, sem: asyncio.Semaphore) -> None:
+        self._model_stats(model).in_flight -= 1
+        sem.release()
+
+    async def _attempts(self, model: str, call, keep_slot: bool):
+        """
+        Runs call(model) along the chain. Returns (model, result, sem);
+        with keep_slot the caller owns the slot and must _release it.
+        """
+        errors: list[tuple[str, str]] = []
+        for position, candidate in enumerate(self.chain(model)):
+            stats = self._model_stats(candidate)
+            for attempt in range(settings.LLM_MAX_RETRIES + 1):
+                sem = await self._acquire(candidate)
+                started = time.perf_counter()
+                error: Exception | None = None
+                keep = False
+                try:
+                    result = await asyncio.wait_for(
+                        call(candidate), settings.LLM_TIMEOUT_SECONDS
+                    )
+                    keep = keep_slot
+                except Exception as exc:
+                    error = exc
+                finally:
+                    # also on cancellation (client gone, batch aborted)
+                    if not keep:
+                        self._release(candidate, sem)
+
+                if error is not None:
+                    stats.errors += 1
+                    timed_out = isinstance(error, asyncio.TimeoutError)
+                    if timed_out:
+                        stats.timeouts += 1
+                    llm_attempts.inc(
+                        model=candidate, outcome="timeout" if timed_out else "error"
+                    )
+                    errors.append((candidate, f"{type(error).__name__}: {error}"))
+                    logger.warning(
+                        "llm call failed model=%s attempt=%s: %s",
+                        candidate,
+                        attempt + 1,
+                        error,
+                    )
+                    if not is_retryable(error) or attempt == settings.LLM_MAX_RETRIES:
+                        break
+                    stats.retries += 1
+                    await asyncio.sleep(backoff_seconds(attempt))
+                    continue
+
+                elapsed = time.perf_counter() - started
+                stats.calls += 1
+                stats.latency.observe(elapsed * 1000)
+                llm_seconds.observe(elapsed, model=candidate)
+                llm_attempts.inc(
+                    model=candidate, outcome="fallback" if position else "ok"
+                )
+                if position:
+                    stats.fallbacks += 1
+                return candidate, result, sem
+        raise LLMUnavailable(errors)
+
+    async def run(
+        self, model: str, call: Callable[[str], Awaitable]
+    ) -> tuple[str, object]:
+        """
+        Returns (model that answered, result of call(model)).
+        """
+        served, result, _ = await self._attempts(model, call, keep_slot=False)
+        return served, result
+
+    async def open_stream(self, model: str, call: Callable[[str], Awaitable]):
+        """
+        Like run() for streaming calls: retries and fail-over only cover
+        opening the stream. Returns (model, stream, release); the model's
+        slot stays taken until release() is called.
+        """
+        served, stream, sem = await self._attempts(model, call, keep_slot=True)
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self._release(served, sem)
+
+        return served, stream, release
+
+    def stats(self) -> dict:
+        return {
+            "default_model": settings.DEFAULT_MODEL,
+            "cheap_model": settings.LLM_CHEAP_MODEL or None,
+            "fallback_models": settings.fallback_models_list(),
+            "models": {
+                model: {
+                    "limit": settings.LLM_MODEL_CONCURRENCY.get(
+                        model, settings.LLM_MAX_CONCURRENCY
+                    ),
+                    "in_flight": s.in_flight,
+                    "waiting": s.waiting,
+                    "calls": s.calls,
+                    "errors": s.errors,
+                    "timeouts": s.timeouts,
+                    "retries": s.retries,
+                    "fallbacks": s.fallbacks,
+                    "latency": s.latency.snapshot(),
+                }
+                for model, s in sorted(self._stats.items())
+            },
+        }
+
+    def gauges(self) -> dict:
+        return {
+            model: {"in_flight": s.in_flight, "waiting": s.waiting}
+            for model, s in self._stats.items()
+        }
+
+    def reset_stats(self) -> None:
+        self._stats = {}
+
+
+router = ModelRouter()
@@ -1,63 +1,279 @@
 import base64
-from litellm import completion
+import time
+from litellm import completion, acompletion
 from app.core.config import settings
+from app.core.executor import run_io
+from app.core.metrics import span
+from app.services.llm_router import router
+from app.services.response_cache import cache_key, response_cache
+from app.utils.singleflight import SingleFlight
 
+llm_flight = SingleFlight("llm")
 
-def _pick_model(requested: str | None) -> str:
-    return (
-        requested.strip() if requested and requested.strip() else settings.DEFAULT_MODEL
+
+def _complete(model: str, messages: list[dict]) -> str:
+    resp = completion(
+        model=model, messages=messages, timeout=settings.LLM_TIMEOUT_SECONDS
     )
+    return resp.choices[0].message["content"]
 
 
-def _read_image_b64(path: str) -> str:
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
 
 
-def ask_text(model: str, system: str, user: str) -> str:
-    resp = completion(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-    )
-    return resp.choices[0].message["content"]
+def _text_messages(system: str, user: str) -> list[dict]:
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
 
 
-def ask_image(model: str, system: str, user: str, image_path: str) -> str:
+def _image_messages(
+    system: str, user: str, img_b64: str, mime: str = "image/png"
+) -> list[dict]:
     """
     Uses OpenAI/Anthropic-style multimodal messages via LiteLLM.
     (Works for models that support vision.)
     """
-    img_b64 = _read_image_b64(image_path)
+    return [
+        {"role": "system", "content": system},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": user},
+                _image_part(img_b64, mime),
+            ],
+        },
+    ]
 
-    resp = completion(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": user},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{img_b64}"},
-                    },
-                ],
-            },
-        ],
-    )
-    return resp.choices[0].message["content"]
 
+def _image_part(img_b64: str, mime: str) -> dict:
+    return {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{img_b64}"}}
 
-def ask(
-    model: str | None, prompt_plan: dict, image_path: str | None = None
-) -> tuple[str, str]:
-    chosen = _pick_model(model)
+
+def _build_messages(prompt_plan: dict, image: dict | list[dict] | None) -> list[dict]:
+    """
+    image: one crop, or a list of crops (multi-region selections) sent as
+    several images of one user message, in order.
+    """
     system = prompt_plan["system"]
     user = prompt_plan["user"]
+    if image is not None:
+        images = image if isinstance(image, list) else [image]
+        with span("base64_encode"):
+            encoded = [(_b64(i["data"]), i["mime"]) for i in images]
+        messages = _image_messages(system, user, *encoded[0])
+        messages[1]["content"].extend(_image_part(b, m) for b, m in encoded[1:])
+        return messages
+    return _text_messages(system, user)
+
+
+async def aask(
+    model: str | None,
+    prompt_plan: dict,
+    image: dict | list[dict] | None = None,
+) -> tuple[str, str]:
+    """
+    One completion through the model router: native acompletion, or the
+    sync client on the I/O pool when LLM_NATIVE_ASYNC is off.
+    image: {"data": bytes, "mime": str} crop(s) from document_service.
+    Returns (model that answered, answer).
+    """
+    chosen = router.choose(model, prompt_plan, image)
+    messages = _build_messages(prompt_plan, image)
+
+    async def _call(m: str) -> str:
+        if not settings.LLM_NATIVE_ASYNC:
+            return await run_io(_complete, m, messages)
+        resp = await acompletion(
+            model=m, messages=messages, timeout=settings.LLM_TIMEOUT_SECONDS
+        )
+        return resp.choices[0].message["content"]
+
+    with span("llm_call"):
+        return await router.run(chosen, _call)
+
+
+def response_cache_key(chosen: str, prompt_plan: dict, image: dict | None) -> str:
+    return cache_key(chosen, prompt_plan, image, settings.RESPONSE_CACHE_FUZZY)
+
+
+def cache_info(
+    mode: str, hit: bool, saved_ms: float = 0.0, coalesced: bool = False
+) -> dict:
+    return {
+        "mode": mode if settings.RESPONSE_CACHE_ENABLED else "disabled",
+        "hit": hit,
+        "time_saved_ms": round(saved_ms, 1),
+        "hit_ratio": response_cache.hit_ratio(),
+        # answered by an identical request already in flight
+        "coalesced": coalesced,
+    }
+
+
+async def aask_cached(
+    model: str | None,
+    prompt_plan: dict,
+    image: dict | None = None,
+    cache_mode: str = "use",
+) -> tuple[str, str, dict]:
+    """
+    aask() behind the response cache. cache_mode: "use" (read + write),
+    "refresh" (skip read, overwrite), "bypass" (no cache, no coalescing).
+    Concurrent misses with the same key share one upstream call.
+    Returns (model, answer, cache_info).
+    """
+    chosen = router.choose(model, prompt_plan, image)
+    key = None
+    if cache_mode != "bypass":
+        key = response_cache_key(chosen, prompt_plan, image)
+    use_cache = settings.RESPONSE_CACHE_ENABLED and key is not None
+    if use_cache and cache_mode == "use":
+        hit = response_cache.get(key)
+        if hit is not None:
+            return chosen, hit[0], cache_info(cache_mode, True, hit[1])
+
+    async def _call() -> tuple[str, str]:
+        started = time.perf_counter()
+        served, answer = await aask(chosen, prompt_plan, image=image)
+        # a fallback model's answer must not be replayed as chosen's
+        if use_cache and served == chosen:
+            response_cache.put(key, answer, (time.perf_counter() - started) * 1000)
+        return served, answer
 
-    if image_path:
-        return chosen, ask_image(chosen, system, user, image_path)
-    return chosen, ask_text(chosen, system, user)
+    shared = False
+    if key is not None and settings.SINGLE_FLIGHT_ENABLED:
+        # identical questions in flight at the same time share one call
+        (served, answer), shared = await llm_flight.do(key, _call)
+    else:
+        served, answer = await _call()
+    return served, answer, cache_info(cache_mode, False, coalesced=shared)
+
+
+async def _close_stream(resp) -> None:
+    # CustomStreamWrapper has no aclose(); close the provider stream under it
+    inner = getattr(resp, "completion_stream", None)
+    for target in (resp, inner):
+        closer = getattr(target, "aclose", None) or getattr(target, "close", None)
+        if closer is None:
+            continue
+        try:
+            result = closer()
+            if hasattr(result, "__await__"):
+                await result
+        except Exception:
+            pass
+        return
+
+
+class DeltaStream:
+    """
+    Async iterator of answer chunks. Unlike a bare async generator,
+    aclose() runs the cleanup even if iteration never started (e.g. the
+    client went away before the first token). Something still has to call
+    aclose(): the router slot and upstream stream stay held until then,
+    so open the stream where its consumer can close it in a finally.
+    """
+
+    def __init__(self, chunks, on_close=None):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            await self.aclose()
+            raise
+
+    async def aclose(self) -> None:
+        on_close, self._on_close = self._on_close, None
+        try:
+            await self._chunks.aclose()
+        finally:
+            if on_close is not None:
+                await on_close()
+
+
+async def astream(model: str | None, prompt_plan: dict, image: dict | None = None):
+    """
+    Streams answer deltas via acompletion(stream=True).
+    Returns (model, async iterator of text chunks); closing the iterator
+    early (e.g. client disconnect) closes the upstream stream. The model's
+    router slot is held until the stream ends.
+    """
+    chosen = router.choose(model, prompt_plan, image)
+    messages = _build_messages(prompt_plan, image)
+
+    async def _open(m: str):
+        return await acompletion(
+            model=m,
+            messages=messages,
+            stream=True,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+        )
+
+    with span("llm_stream_open"):
+        served, resp, release = await router.open_stream(chosen, _open)
+
+    async def _deltas():
+        async for chunk in resp:
+            if not chunk.choices:
+                continue
+            text = getattr(chunk.choices[0].delta, "content", None)
+            if text:
+                yield text
+
+    async def _close():
+        release()
+        await _close_stream(resp)
+
+    return served, DeltaStream(_deltas(), _close)
+
+
+async def astream_cached(
+    model: str | None,
+    prompt_plan: dict,
+    image: dict | None = None,
+    cache_mode: str = "use",
+):
+    """
+    astream() behind the response cache: a hit replays the cached answer
+    as a single chunk, a fully consumed miss is stored.
+    Returns (model, async iterator of text chunks, cache_info).
+    """
+    chosen = router.choose(model, prompt_plan, image)
+    key = None
+    if settings.RESPONSE_CACHE_ENABLED and cache_mode != "bypass":
+        key = response_cache_key(chosen, prompt_plan, image)
+        if cache_mode == "use":
+            hit = response_cache.get(key)
+            if hit is not None:
+
+                async def _replay():
+                    yield hit[0]
+
+                return chosen, _replay(), cache_info(cache_mode, True, hit[1])
+
+    started = time.perf_counter()
+    served, deltas = await astream(chosen, prompt_plan, image=image)
+
+    async def _recording():
+        parts = []
+        async for text in deltas:
+            parts.append(text)
+            yield text
+        # a fallback model's answer must not be replayed as chosen's
+        if key is not None and served == chosen:
+            latency_ms = (time.perf_counter() - started) * 1000
+            response_cache.put(key, "".join(parts), latency_ms)
+
+    return (
+        served,
+        DeltaStream(_recording(), deltas.aclose),
+        cache_info(cache_mode, False),
+    )
@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+from app.core.config import settings
+from app.db.models import Document
+from app.utils.lru import LRUCache
+
+# index_status values after which a row no longer changes
+SETTLED_STATUSES = ("done", "failed")
+
+
+def _snapshot(doc: Document) -> Document:
+    # detached copy: safe to share across sessions and requests
+    return Document(**{c.key: getattr(doc, c.key) for c in Document.__table__.c})
+
+
+def document_etag(doc: Document) -> str:
+    raw = f"{doc.id}:{doc.content_hash or doc.path}:{doc.pages}:{doc.index_status}"
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+class MetadataCache(LRUCache):
+    """
+    In-process LRU of Document rows. Rows are immutable after upload except
+    index_status, so rows still being indexed expire after pending_ttl
+    (the indexing job may run in another worker); settled rows live for
+    ttl. Deletes and status changes in this process evict immediately; a
+    delete in another worker is only seen here when the row expires or a
+    read finds its file gone (see evict_file).
+    """
+
+    def __init__(
+        self, max_entries: int, ttl_seconds: float, pending_ttl_seconds: float
+    ):
+        super().__init__(max_entries, ttl_seconds)
+        self.pending_ttl_seconds = pending_ttl_seconds
+
+    def put(self, doc: Document) -> Document:
+        """Caches a snapshot of doc and returns it."""
+        snapshot = _snapshot(doc)
+        ttl = (
+            self.ttl_seconds
+            if doc.index_status in SETTLED_STATUSES
+            else self.pending_ttl_seconds
+        )
+        super().put(doc.id, snapshot, ttl)
+        return snapshot
+
+    def evict_file(self, path: str) -> bool:
+        """
+        Drops cached rows whose document file is `path` (matched on the
+        file name, which starts with the doc_id for every storage
+        backend). Returns whether any row was cached.
+        """
+        name = os.path.basename(path)
+        return bool(self.evict_where(lambda _, doc: os.path.basename(doc.path) == name))
+
+    def stats(self) -> dict:
+        return {**super().stats(), "pending_ttl_seconds": self.pending_ttl_seconds}
+
+
+metadata_cache = MetadataCache(
+    settings.DOC_CACHE_MAX_ENTRIES,
+    settings.DOC_CACHE_TTL_SECONDS,
+    settings.DOC_CACHE_PENDING_TTL_SECONDS,
+)
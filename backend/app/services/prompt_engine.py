@@ -1,35 +1,289 @@
-def build_prompt(user_query: str, selection: dict) -> dict:
+import re
+
+from app.core.config import settings
+from app.services.retrieval import terms
+from app.utils.tokens import count_message_tokens, count_tokens, input_budget
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+_GAP = "\n[...]\n"
+
+
+def _sentences(text: str) -> list[str]:
+    return [s.strip() for s in _SENTENCE.split(text) if s.strip()]
+
+
+def sized_sentences(text: str, model: str | None = None):
+    """
+    (sentences, token count of each): counted once, reused by every trim
+    pass over the same text.
+    """
+    sents = _sentences(text)
+    return sents, [count_tokens(s, model) for s in sents]
+
+
+def _cut(text: str, tokens: int, target: int, from_end: bool = False) -> str:
+    # proportional char cut for a single sentence that doesn't fit
+    keep = max(0, len(text) * target // max(tokens, 1) - 1)
+    return text[len(text) - keep :] if from_end else text[:keep]
+
+
+def trim_head_tail(text: str, target: int, model: str | None = None, sized=None) -> str:
+    """
+    Keeps whole sentences from the start (~2/3 of target) and the end.
+    sized: sized_sentences(text, model), if already computed.
+    """
+    sents, sizes = sized or sized_sentences(text, model)
+    head, used, i = [], 0, 0
+    head_target = target * 2 // 3
+    while i < len(sents) and used + sizes[i] <= head_target:
+        head.append(sents[i])
+        used += sizes[i]
+        i += 1
+    if not head and sents:
+        head.append(_cut(sents[0], sizes[0], head_target))
+        used += head_target
+        i = 1
+
+    tail, j = [], len(sents) - 1
+    while j >= i and used + sizes[j] <= target:
+        tail.insert(0, sents[j])
+        used += sizes[j]
+        j -= 1
+    if not tail and j >= i and target > used:
+        tail.append(_cut(sents[j], sizes[j], target - used, from_end=True))
+
+    return _GAP.join(p for p in (" ".join(head), " ".join(tail)) if p)
+
+
+def trim_by_relevance(
+    text: str, query: str, target: int, model: str | None = None, sized=None
+):
+    """
+    Keeps the sentences that share the most terms with the question, in
+    their original order; head/tail when nothing overlaps.
+    """
+    wanted = set(terms(query))
+    sized = sized or sized_sentences(text, model)
+    sents, sizes = sized
+    scores = []
+    for idx, sent in enumerate(sents):
+        words = terms(sent)
+        overlap = sum(1 for w in words if w in wanted)
+        scores.append((overlap / (1 + len(words)) ** 0.5, idx))
+    if not any(score for score, _ in scores):
+        return trim_head_tail(text, target, model, sized)
+
+    picked, used = [], 0
+    for score, idx in sorted(scores, key=lambda s: (-s[0], s[1])):
+        if score == 0:
+            break
+        n = sizes[idx] + 2
+        if used + n > target:
+            continue
+        picked.append(idx)
+        used += n
+    if not picked:
+        return trim_head_tail(text, target, model, sized)
+
+    picked.sort()
+    parts, prev = [], None
+    for idx in picked:
+        if prev is not None and idx != prev + 1:
+            parts.append("[...]")
+        parts.append(sents[idx])
+        prev = idx
+    if picked[0] > 0:
+        parts.insert(0, "[...]")
+    if picked[-1] < len(sents) - 1:
+        parts.append("[...]")
+    return "\n".join(parts)
+
+
+def trim_text(
+    text: str, query: str, target: int, model: str | None = None, sized=None
+) -> str:
+    if settings.PROMPT_TRIM_STRATEGY == "head_tail":
+        return trim_head_tail(text, target, model, sized)
+    return trim_by_relevance(text, query, target, model, sized)
+
+
+def _pages_label(pages: list[int]) -> str:
+    if len(pages) == 1:
+        return f"page {pages[0]}"
+    return "pages " + ", ".join(str(p) for p in pages)
+
+
+def _selection_pages(selection: dict) -> list[int]:
+    regions = selection.get("regions")
+    if not regions:
+        return [selection["page"]]
+    return sorted({r["page"] for r in regions})
+
+
+def _regions_text(regions: list[dict]) -> str:
+    # one block per region, in selection order, tagged with its page
+    return "\n\n".join(f"[page {r['page']}]\n{r.get('content') or ''}" for r in regions)
+
+
+def _text_user_prompt(
+    user_query: str, pages: list[int], selected_text: str, context_chunks: list[dict]
+) -> str:
+    user = (
+        f"User question: {user_query}\n\n"
+        f"Selected text ({_pages_label(pages)}):\n"
+        f"{selected_text}"
+    )
+    if context_chunks:
+        related = "\n\n".join(f"[page {c['page']}] {c['text']}" for c in context_chunks)
+        user += f"\n\nRelated context from the document:\n{related}"
+    return user
+
+
+def _image_selection_text(selection: dict, user_query: str, model: str | None) -> str:
+    """
+    Text under the image selection(s), filled in from the page layout,
+    trimmed to IMAGE_SELECTION_TEXT_TOKENS.
+    """
+    regions = selection.get("regions")
+    if regions:
+        text = "\n\n".join(
+            f"[crop {i}, page {r['page']}]\n{r['text']}"
+            for i, r in enumerate(regions, start=1)
+            if r.get("text")
+        )
+    else:
+        text = selection.get("text") or ""
+    cap = settings.IMAGE_SELECTION_TEXT_TOKENS
+    if not text or cap <= 0:
+        return ""
+    if count_tokens(text, model) > cap:
+        text = trim_text(text, user_query, cap, model)
+    return text
+
+
+def _messages(system: str, user: str) -> list[dict]:
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+
+def build_prompt(
+    user_query: str,
+    selection: dict,
+    context_chunks: list[dict] | None = None,
+    model: str | None = None,
+) -> dict:
     """
     Returns a structured prompt plan:
     - system prompt
     - user prompt
     - metadata (for FE / debugging)
+
+    context_chunks: retrieved passages ({"page", "text"}) sent after the
+    selection as related context. Text prompts are fitted to the model's
+    input budget: related context goes first, then the selection is trimmed.
+    A selection with "regions" covers several pages/crops; text regions
+    must already carry their content.
     """
     system = (
         "You are a helpful learning assistant for PDFs and research papers. "
         "Answer ONLY using the provided selection context. "
         "If the selection is insufficient, ask a clarifying question."
     )
+    budget = input_budget(model)
+    pages = _selection_pages(selection)
+    regions = selection.get("regions")
 
     if selection["type"] == "text":
-        selected_text = selection.get("content") or ""
-        user = (
-            f"User question: {user_query}\n\n"
-            f"Selected text (page {selection['page']}):\n"
-            f"{selected_text}"
+        page = selection["page"]
+        if regions:
+            selected_text = _regions_text(regions)
+        else:
+            selected_text = selection.get("content") or ""
+        chunks = list(context_chunks or [])
+
+        overhead = count_message_tokens(
+            _messages(system, _text_user_prompt(user_query, pages, "", [])), model
         )
+        available = max(0, budget - overhead)
+        content_tokens = count_tokens(selected_text, model)
+
+        trimmed = None
+        if content_tokens > available:
+            chunks = []
+            target = available
+            sized = sized_sentences(selected_text, model)
+            # the tokenizer doesn't split exactly on our joins; shrink until it fits
+            for _ in range(4):
+                kept = trim_text(selected_text, user_query, target, model, sized)
+                overflow = count_tokens(kept, model) - available
+                if overflow <= 0:
+                    break
+                target = max(0, target - overflow - 8)
+            trimmed = {
+                "strategy": settings.PROMPT_TRIM_STRATEGY,
+                "content_tokens": content_tokens,
+                "kept_tokens": count_tokens(kept, model),
+            }
+            selected_text = kept
+        else:
+            room = available - content_tokens
+            kept_chunks = []
+            for c in chunks:
+                n = count_tokens(c["text"], model) + 8
+                if n > room:
+                    break
+                kept_chunks.append(c)
+                room -= n
+            chunks = kept_chunks
+
+        user = _text_user_prompt(user_query, pages, selected_text, chunks)
         used_context = {
             "type": "text",
-            "page": selection["page"],
+            "page": page,
             "chars": len(selected_text),
+            "prompt_tokens": count_message_tokens(_messages(system, user), model),
+            "input_budget": budget,
         }
+        if context_chunks and len(chunks) < len(context_chunks):
+            used_context["context_chunks_dropped"] = len(context_chunks) - len(chunks)
+        if trimmed:
+            used_context["trimmed"] = trimmed
+        if regions:
+            used_context.update(pages=pages, regions=len(regions))
         return {"system": system, "user": user, "used_context": used_context}
 
     # image: prompt without adding the raw image bytes here (LLM service will attach)
+    if regions:
+        order = ", ".join(
+            f"{i}) page {r['page']}" for i, r in enumerate(regions, start=1)
+        )
+        shown = (
+            f"{len(regions)} selected image crops, attached in this order: "
+            f"{order}. Explain what they show together."
+        )
+    else:
+        shown = (
+            f"Selected image crop from page {selection['page']}. "
+            "Explain what it shows."
+        )
     user = (
         f"User question: {user_query}\n\n"
-        f"Selected image crop from page {selection['page']}. "
-        "Explain what it shows. If it contains math, explain step-by-step."
+        f"{shown} If it contains math, explain step-by-step."
     )
-    used_context = {"type": "image", "page": selection["page"]}
+    region_text = _image_selection_text(selection, user_query, model)
+    if region_text:
+        user += f"\n\nText found inside the selection:\n{region_text}"
+    used_context = {
+        "type": "image",
+        "page": selection["page"],
+        # text part only; the provider adds the image's own tokens
+        "prompt_tokens": count_message_tokens(_messages(system, user), model),
+        "input_budget": budget,
+    }
+    if region_text:
+        used_context["selection_text_tokens"] = count_tokens(region_text, model)
+    if regions:
+        used_context.update(pages=pages, regions=len(regions))
     return {"system": system, "user": user, "used_context": used_context}
@@ -0,0 +1,70 @@
+import hashlib
+import re
+
+from app.core.config import settings
+from app.utils.lru import LRUCache
+
+_WS = re.compile(r"\s+")
+_PUNCT = re.compile(r"[^\w\s]")
+
+
+def normalize_prompt(text: str, fuzzy: bool = False) -> str:
+    """
+    Whitespace-insensitive; fuzzy also ignores case and punctuation so
+    "What is this?" and "what is this" share an entry.
+    """
+    if fuzzy:
+        text = _PUNCT.sub(" ", text.casefold())
+    return _WS.sub(" ", text).strip()
+
+
+def image_hash(image: dict | list[dict] | None) -> str:
+    if image is None:
+        return ""
+    if isinstance(image, list):
+        return ",".join(image_hash(i) for i in image)
+    return hashlib.sha256(image["data"]).hexdigest()
+
+
+def cache_key(
+    model: str, prompt_plan: dict, image: dict | None, fuzzy: bool = False
+) -> str:
+    raw = "\x1f".join(
+        [
+            model,
+            normalize_prompt(prompt_plan["system"]),
+            normalize_prompt(prompt_plan["user"], fuzzy),
+            image_hash(image),
+        ]
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(LRUCache):
+    """
+    In-process LRU of LLM answers with a TTL. Each entry remembers how
+    long the upstream call took so hits can report time saved.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        super().__init__(max_entries, ttl_seconds)
+        self.time_saved_ms = 0.0
+
+    def get(self, key: str) -> tuple[str, float] | None:
+        """(answer, upstream latency ms), or None."""
+        entry = super().get(key)
+        if entry is not None:
+            with self._lock:
+                self.time_saved_ms += entry[1]
+        return entry
+
+    def put(self, key: str, answer: str, latency_ms: float) -> None:
+        super().put(key, (answer, latency_ms))
+
+    def stats(self) -> dict:
+        return {**super().stats(), "time_saved_ms": round(self.time_saved_ms, 1)}
+
+
+response_cache = ResponseCache(
+    settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,235 @@
+import math
+import re
+from collections import Counter
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.executor import run_io
+from app.db import repo
+from app.db.models import Document
+from app.utils.lru import LRUCache
+from app.utils.tokens import count_tokens, estimate_tokens
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were what which with why how does do can".split()
+)
+
+
+def _stem(word: str) -> str:
+    # plural folding only; enough to match "eigenvalue" to "eigenvalues"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def terms(text: str) -> list[str]:
+    return [
+        _stem(w)
+        for w in (m.group(0).lower() for m in _WORD.finditer(text))
+        if len(w) > 1 and w not in _STOPWORDS
+    ]
+
+
+def chunk_pages(page_texts: list[str], max_tokens: int) -> list[dict]:
+    """
+    Splits each page into chunks of whole lines/sentences of up to
+    max_tokens. Chunks never cross pages: {"page", "text", "tokens"}.
+    """
+    chunks = []
+    for page_no, page_text in enumerate(page_texts, start=1):
+        pieces = []
+        for line in page_text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if estimate_tokens(line) > max_tokens:
+                pieces.extend(s for s in _SENTENCE.split(line) if s)
+            else:
+                pieces.append(line)
+
+        buf, buf_tokens = [], 0
+        for piece in pieces:
+            n = estimate_tokens(piece)
+            if buf and buf_tokens + n > max_tokens:
+                chunks.append({"page": page_no, "text": " ".join(buf)})
+                buf, buf_tokens = [], 0
+            buf.append(piece)
+            buf_tokens += n
+        if buf:
+            chunks.append({"page": page_no, "text": " ".join(buf)})
+
+    for c in chunks:
+        c["tokens"] = estimate_tokens(c["text"])
+    return chunks
+
+
+class BM25Index:
+    """
+    Per-document BM25 over chunks; built once, queried per question.
+    """
+
+    def __init__(self, chunks: list[dict], k1: float = 1.2, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, list[tuple[int, int]]] = {}
+        self.lengths = []
+        for i, chunk in enumerate(chunks):
+            tf = Counter(terms(chunk["text"]))
+            self.lengths.append(sum(tf.values()))
+            for term, count in tf.items():
+                self.postings.setdefault(term, []).append((i, count))
+        self.avg_len = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def search(self, query: str, page: int | None = None) -> list[tuple[int, float]]:
+        """
+        (chunk index, score) best first. Chunks on `page` (and its
+        neighbours) get a small boost: nearby definitions matter most.
+        """
+        scores: dict[int, float] = {}
+        for term in set(terms(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.lengths[i] / (self.avg_len or 1)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (
+                    tf + self.k1 * norm
+                )
+        if page is not None:
+            for i in scores:
+                distance = abs(self.chunks[i]["page"] - page)
+                if distance <= 1:
+                    scores[i] *= 1.5 if distance == 0 else 1.2
+        return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+
+
+# doc_id -> BM25Index
+index_cache = LRUCache(settings.RETRIEVAL_CACHE_DOCS)
+
+
+def _build_index(page_texts: list[str]) -> BM25Index:
+    return BM25Index(chunk_pages(page_texts, settings.RETRIEVAL_CHUNK_TOKENS))
+
+
+async def get_index(db: AsyncSession, doc: Document) -> BM25Index | None:
+    """
+    Cached per-document index, built from the page text index. None while
+    the document's text isn't indexed yet.
+    """
+    index = index_cache.get(doc.id)
+    if index is not None:
+        return index
+    if doc.index_status != "done":
+        return None
+    page_texts = await repo.get_page_texts(db, doc.id)
+    index = await run_io(_build_index, page_texts)
+    index_cache.put(doc.id, index)
+    return index
+
+
+def select_chunks(
+    index: BM25Index,
+    query: str,
+    budget_tokens: int,
+    top_k: int,
+    page: int | None = None,
+    only_page: bool = False,
+    exclude_text: str = "",
+) -> list[dict]:
+    """
+    Greedy top-k under a token budget, returned in reading order.
+    """
+    picked, used = [], 0
+    for i, _ in index.search(query, page):
+        chunk = index.chunks[i]
+        if only_page and chunk["page"] != page:
+            continue
+        if exclude_text and chunk["text"] in exclude_text:
+            continue
+        if used + chunk["tokens"] > budget_tokens:
+            continue
+        picked.append(i)
+        used += chunk["tokens"]
+        if len(picked) >= top_k:
+            break
+    return [index.chunks[i] for i in sorted(picked)]
+
+
+def _report(
+    index: BM25Index,
+    page: int,
+    content: str,
+    chunks: list[dict],
+    selected_text: str,
+    model: str | None,
+) -> dict:
+    page_text = "\n\n".join(c["text"] for c in index.chunks if c["page"] == page)
+    page_tokens = count_tokens(page_text, model)
+    sent_tokens = count_tokens(content, model)
+    if selected_text:
+        sent_tokens += sum(count_tokens(c["text"], model) for c in chunks)
+    # without retrieval the prompt carries the whole page, or just the
+    # selection; added context costs tokens rather than saving any
+    baseline = count_tokens(selected_text, model) if selected_text else page_tokens
+    return {
+        "chunks": len(chunks),
+        "pages": sorted({c["page"] for c in chunks}),
+        "context_tokens": sent_tokens,
+        "page_tokens": page_tokens,
+        "tokens_saved": max(baseline - sent_tokens, 0),
+    }
+
+
+async def retrieve_context(
+    db: AsyncSession,
+    doc: Document,
+    query: str,
+    page: int,
+    selected_text: str = "",
+    model: str | None = None,
+) -> dict | None:
+    """
+    Picks context for a text selection. Without a selection, the best
+    chunks of the page replace the whole page; with one, the best chunks
+    from elsewhere in the document are added next to it. Returns
+    {"content", "chunks", "report"}, or None when there is no index (or no
+    chunk matches) and the caller should fall back to the old behaviour.
+    The report counts tokens with `model`'s tokenizer.
+    """
+    index = await get_index(db, doc)
+    if index is None or not index.chunks:
+        return None
+
+    budget = settings.RETRIEVAL_TOKEN_BUDGET
+    top_k = settings.RETRIEVAL_TOP_K
+    if selected_text:
+        chunks = select_chunks(
+            index,
+            f"{query}\n{selected_text}",
+            budget,
+            top_k,
+            page=page,
+            exclude_text=selected_text,
+        )
+        content = selected_text
+    else:
+        chunks = select_chunks(index, query, budget, top_k, page=page, only_page=True)
+        content = "\n\n".join(c["text"] for c in chunks)
+    if not chunks:
+        return None
+
+    # token counts for the model's tokenizer: CPU work, off the loop
+    report = await run_io(_report, index, page, content, chunks, selected_text, model)
+    return {"content": content, "chunks": chunks, "report": report}
@@ -0,0 +1,82 @@
+import importlib
+import os
+from abc import ABC, abstractmethod
+
+from app.core.config import settings
+
+
+class StorageBackend(ABC):
+    """
+    Where document files live. Document.path holds the backend's ref for
+    the file; readers turn it into a local path with local_path() (remote
+    backends may fetch into a local cache first).
+    """
+
+    # local_path() is a cheap, non-blocking lookup
+    is_local = False
+
+    @abstractmethod
+    def store(self, local_file: str, name: str) -> str:
+        """Moves a finished local file into storage; returns its ref."""
+
+    @abstractmethod
+    def local_path(self, ref: str) -> str:
+        """Local filesystem path for a ref, for PyMuPDF to open."""
+
+    @abstractmethod
+    def delete(self, ref: str) -> None:
+        """Removes the file; a missing ref is not an error."""
+
+    @abstractmethod
+    def exists(self, ref: str) -> bool:
+        """Whether the file behind a ref is still there."""
+
+
+class LocalStorage(StorageBackend):
+    """
+    Files under PDF_DIR as {doc_id}_{filename}; the ref is the path. Point
+    PDF_DIR at a shared volume to serve the same documents from several
+    nodes.
+    """
+
+    is_local = True
+
+    def __init__(self, root: str | None = None):
+        self.root = root or settings.PDF_DIR
+
+    def store(self, local_file: str, name: str) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, name)
+        os.replace(local_file, path)
+        return path
+
+    def local_path(self, ref: str) -> str:
+        return ref
+
+    def delete(self, ref: str) -> None:
+        try:
+            os.remove(ref)
+        except FileNotFoundError:
+            pass
+
+    def exists(self, ref: str) -> bool:
+        return os.path.exists(ref)
+
+
+def load_storage(spec: str) -> StorageBackend:
+    """
+    "local", or "package.module:ClassName" for a custom backend (built
+    with no arguments; read its own settings/env).
+    """
+    if spec == "local":
+        return LocalStorage()
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"STORAGE_BACKEND must be 'local' or 'module:Class': {spec}")
+    backend = getattr(importlib.import_module(module_name), class_name)()
+    if not isinstance(backend, StorageBackend):
+        raise TypeError(f"{spec} is not a StorageBackend")
+    return backend
+
+
+storage = load_storage(settings.STORAGE_BACKEND)
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import os
+
+from app.core.config import settings
+from app.core.executor import run_cpu, run_io
+from app.db.models import Document
+from app.services.document_service import (
+    cache_prefix,
+    document_fingerprint,
+    load_or_render,
+    local_pdf_path,
+)
+from app.utils.disk_cache import DiskCache
+from app.utils.image_utils import IMAGE_FORMATS
+from app.utils.pdf_utils import (
+    get_page_size,
+    render_thumbnail_to_bytes,
+    render_tile_to_bytes,
+    tile_grid,
+)
+from app.utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+tile_cache = DiskCache(
+    os.path.join(settings.IMAGE_DIR, "tiles"),
+    max_bytes=settings.TILE_CACHE_MAX_BYTES,
+    max_age_seconds=settings.TILE_CACHE_MAX_AGE_SECONDS,
+)
+tile_flight = SingleFlight("tile")
+
+
+class TileNotFound(Exception):
+    pass
+
+
+def raster_options() -> dict:
+    """
+    Encode settings, resolved in the caller's process (see crop_options).
+    """
+    return {
+        "fmt": settings.TILE_FORMAT,
+        "quality": settings.TILE_QUALITY,
+        "png_compress_level": 6,
+    }
+
+
+def _key(fingerprint: str, *parts) -> str:
+    opts = raster_options()
+    raw = "|".join([fingerprint, *map(str, parts)] + [f"{k}={opts[k]}" for k in opts])
+    return cache_prefix(fingerprint) + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _check_page(doc: Document, page: int) -> None:
+    if page < 1 or page > doc.pages:
+        raise TileNotFound("Page out of range")
+
+
+def thumbnail_ref(doc: Document, page: int) -> dict:
+    """
+    Identifies a thumbnail without rendering it: {"key", "etag", "mime",
+    "render"}. The key doubles as the ETag, so conditional GETs are
+    answered before any rendering or disk access.
+    """
+    _check_page(doc, page)
+    max_side = settings.THUMBNAIL_MAX_SIDE
+    key = _key(document_fingerprint(doc), "thumb", page, max_side)
+    render = (render_thumbnail_to_bytes, doc.path, page, max_side)
+    return _ref(key, render)
+
+
+def tile_ref(doc: Document, page: int, level: int, col: int, row: int) -> dict:
+    _check_page(doc, page)
+    levels = settings.tile_zoom_levels_list()
+    if not 0 <= level < len(levels):
+        raise TileNotFound("Zoom level out of range")
+    if col < 0 or row < 0:
+        raise TileNotFound("Tile out of range")
+    key = _key(document_fingerprint(doc), "tile", page, levels[level], col, row)
+    render = (
+        render_tile_to_bytes,
+        doc.path,
+        page,
+        levels[level],
+        col,
+        row,
+        settings.TILE_SIZE,
+    )
+    return _ref(key, render)
+
+
+def _ref(key: str, render: tuple) -> dict:
+    options = raster_options()
+    _, mime, ext = IMAGE_FORMATS[options["fmt"]]
+    return {
+        "key": key,
+        "etag": f'"{key[-32:]}"',
+        "mime": mime,
+        "ext": ext,
+        "render": render,
+        "options": options,
+    }
+
+
+async def _load_or_render(ref: dict) -> bytes:
+    fn, doc_ref, *args = ref["render"]
+
+    async def render() -> bytes:
+        pdf_path = await local_pdf_path(doc_ref)
+        try:
+            return await run_cpu(fn, pdf_path, *args, **ref["options"])
+        except ValueError as e:
+            # tile outside the page at this zoom
+            raise TileNotFound(str(e))
+
+    data, _ = await load_or_render(tile_cache, ref["key"], ref["ext"], render, "tile")
+    return data
+
+
+async def fetch(ref: dict) -> bytes:
+    """
+    Cached bytes for a thumbnail/tile ref, rendered once on a miss
+    (concurrent requests for the same image share the render).
+    """
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await _load_or_render(ref)
+    data, _ = await tile_flight.do(ref["key"], lambda: _load_or_render(ref))
+    return data
+
+
+async def tile_layout(doc: Document, page: int) -> dict:
+    _check_page(doc, page)
+    pdf_path = await local_pdf_path(doc.path)
+    width, height = await run_io(get_page_size, pdf_path, page)
+    levels = []
+    for i, zoom in enumerate(settings.tile_zoom_levels_list()):
+        cols, rows = tile_grid(width, height, zoom, settings.TILE_SIZE)
+        levels.append(
+            {
+                "level": i,
+                "zoom": zoom,
+                "width": round(width * zoom),
+                "height": round(height * zoom),
+                "cols": cols,
+                "rows": rows,
+            }
+        )
+    return {
+        "doc_id": doc.id,
+        "page": page,
+        "tile_size": settings.TILE_SIZE,
+        "mime": IMAGE_FORMATS[settings.TILE_FORMAT][1],
+        "levels": levels,
+    }
+
+
+async def prerender_first_thumbnail(doc: Document) -> None:
+    """
+    Background job after upload so the library view never waits.
+    """
+    try:
+        await fetch(thumbnail_ref(doc, 1))
+    except Exception:
+        logger.exception("thumbnail prerender failed for %s", doc.id)
+
+
+async def forget_document(prefix: str) -> None:
+    """Drops a deleted document's thumbnails and tiles (see cache_prefix)."""
+    await run_io(tile_cache.remove_prefix, prefix)
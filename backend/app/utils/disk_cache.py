@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class DiskCache:
+    """
+    Directory of content-addressed files bounded by total size and age.
+
+    Files are named {prefix}{key}{ext}; recency is the file mtime, bumped
+    on every hit. The (size, mtime) index is built from a directory scan
+    on first use and kept in memory afterwards, oldest first, so a write
+    only evicts (from the front) when the cache is over budget. Expired
+    files are dropped on read, and swept every sweep_every writes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        max_age_seconds: int = 0,
+        prefix: str = "",
+        sweep_every: int = 64,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.prefix = prefix
+        self.sweep_every = max(1, sweep_every)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[int, float]] | None" = None
+        self._total = 0
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path_for(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{self.prefix}{key}{ext}")
+
+    def _index(self) -> "OrderedDict[str, tuple[int, float]]":
+        # caller holds self._lock
+        if self._entries is None:
+            found = []
+            os.makedirs(self.directory, exist_ok=True)
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    name = entry.name
+                    if (
+                        entry.is_file()
+                        and name.startswith(self.prefix)
+                        and not name.endswith(".tmp")
+                    ):
+                        st = entry.stat()
+                        found.append((entry.path, (st.st_size, st.st_mtime)))
+            found.sort(key=lambda kv: kv[1][1])
+            self._entries = OrderedDict(found)
+            self._total = sum(size for _, (size, _) in found)
+        return self._entries
+
+    def _expired(self, mtime: float, now: float) -> bool:
+        return self.max_age_seconds > 0 and now - mtime > self.max_age_seconds
+
+    def get(self, key: str, ext: str) -> str | None:
+        path = self.path_for(key, ext)
+        with self._lock:
+            entries = self._index()
+            now = time.time()
+            if path not in entries:
+                # may have been written by another process sharing the dir
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    self.misses += 1
+                    return None
+                entries[path] = (st.st_size, st.st_mtime)
+                self._total += st.st_size
+            size, mtime = entries[path]
+            if self._expired(mtime, now):
+                self._remove(path)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                self._forget(path)
+                self.misses += 1
+                return None
+            entries[path] = (size, now)
+            entries.move_to_end(path)
+            self.hits += 1
+            return path
+
+    def put(self, key: str, ext: str, data: bytes) -> str:
+        path = self.path_for(key, ext)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.record(path)
+        return path
+
+    def record(self, path: str) -> None:
+        """
+        Accounts for a file written directly at path_for(...) (e.g. by a
+        worker process) and enforces the size/age bounds.
+        """
+        st = os.stat(path)
+        with self._lock:
+            entries = self._index()
+            self._forget(path)
+            entries[path] = (st.st_size, st.st_mtime)
+            self._total += st.st_size
+            self._enforce(keep=path)
+
+    def _enforce(self, keep: str) -> None:
+        # caller holds self._lock; entries run oldest to newest
+        entries = self._index()
+        self._writes += 1
+        if self.max_age_seconds and self._writes % self.sweep_every == 0:
+            now = time.time()
+            while entries:
+                path, (_, mtime) = next(iter(entries.items()))
+                if path == keep or not self._expired(mtime, now):
+                    break
+                self._remove(path)
+                self.evictions += 1
+
+        while self._total > self.max_bytes:
+            oldest = next(iter(entries))
+            if oldest == keep:
+                break  # only the new file is left
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _forget(self, path: str) -> None:
+        entry = self._index().pop(path, None)
+        if entry is not None:
+            self._total -= entry[0]
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self._forget(path)
+
+    def remove_prefix(self, key_prefix: str) -> int:
+        """Removes every file whose key starts with key_prefix."""
+        head = self.path_for(key_prefix, "")
+        with self._lock:
+            # rescan so files written by other workers are included
+            self._entries = None
+            entries = self._index()
+            doomed = [path for path in entries if path.startswith(head)]
+            for path in doomed:
+                self._remove(path)
+            return len(doomed)
+
+    def purge(self) -> int:
+        with self._lock:
+            # rescan so files written by other workers are included
+            self._entries = None
+            entries = self._index()
+            removed = len(entries)
+            for path in list(entries):
+                self._remove(path)
+            return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._index()
+            return {
+                "files": len(entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
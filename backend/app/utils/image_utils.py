@@ -19,3 +19,29 @@ def crop_bbox(img: Image.Image, bbox: dict) -> Image.Image:
     y2 = min(y2, img.height)
 
     return img.crop((x, y, x2, y2))
+
+
+IMAGE_FORMATS = {
+    # name: (PIL format, mime type, file extension)
+    "png": ("PNG", "image/png", ".png"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+    "webp": ("WEBP", "image/webp", ".webp"),
+}
+
+
+def encode_image(
+    img: Image.Image, fmt: str = "png", quality: int = 85, png_compress_level: int = 6
+) -> bytes:
+    """
+    Encodes to bytes in memory. quality applies to jpeg/webp,
+    png_compress_level (0-9) to png.
+    """
+    import io
+
+    pil_format = IMAGE_FORMATS[fmt][0]
+    buf = io.BytesIO()
+    if fmt == "png":
+        img.save(buf, format=pil_format, compress_level=png_compress_level)
+    else:
+        img.save(buf, format=pil_format, quality=quality)
+    return buf.getvalue()
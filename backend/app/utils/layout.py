@@ -0,0 +1,290 @@
+import json
+import struct
+import sys
+from array import array
+
+_MAGIC = b"PLY1"
+# grid cell edge in PDF points (~2-3 lines of body text)
+GRID_CELL = 48.0
+
+
+def _union(boxes: array, start: int, end: int) -> tuple[float, float, float, float]:
+    # union of boxes[start:end) (indices of boxes, 4 floats each)
+    x0 = min(boxes[i * 4] for i in range(start, end))
+    y0 = min(boxes[i * 4 + 1] for i in range(start, end))
+    x1 = max(boxes[i * 4 + 2] for i in range(start, end))
+    y1 = max(boxes[i * 4 + 3] for i in range(start, end))
+    return x0, y0, x1, y1
+
+
+class GridIndex:
+    """
+    Uniform grid over the page: cell -> word indices whose box touches it.
+    Rectangle queries only look at the covered cells.
+    """
+
+    def __init__(self, boxes: array, width: float, height: float, cell: float):
+        self.cell = cell
+        self.cols = max(1, int(width // cell) + 1)
+        self.rows = max(1, int(height // cell) + 1)
+        self._cells: dict[int, array] = {}
+        for i in range(len(boxes) // 4):
+            for c in self._cover(*boxes[i * 4 : i * 4 + 4]):
+                self._cells.setdefault(c, array("I")).append(i)
+
+    def _cover(self, x0: float, y0: float, x1: float, y1: float):
+        c0 = min(max(int(x0 // self.cell), 0), self.cols - 1)
+        c1 = min(max(int(x1 // self.cell), 0), self.cols - 1)
+        r0 = min(max(int(y0 // self.cell), 0), self.rows - 1)
+        r1 = min(max(int(y1 // self.cell), 0), self.rows - 1)
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                yield r * self.cols + c
+
+    def candidates(self, x0: float, y0: float, x1: float, y1: float) -> set[int]:
+        found: set[int] = set()
+        for c in self._cover(x0, y0, x1, y1):
+            found.update(self._cells.get(c, ()))
+        return found
+
+
+class PageLayout:
+    """
+    Words, lines and blocks of one page with bounding boxes in PDF points
+    (origin top-left), stored column-wise: boxes as float32 arrays of
+    x0,y0,x1,y1 per item, parent links as uint32 arrays, and all words as
+    one space-joined string with start offsets. Words are in reading order,
+    so a line is a contiguous word range and a block a contiguous line
+    range.
+    """
+
+    __slots__ = (
+        "width",
+        "height",
+        "text",
+        "word_offsets",
+        "word_boxes",
+        "word_line",
+        "line_boxes",
+        "line_block",
+        "block_boxes",
+        "_grid",
+    )
+
+    def __init__(
+        self,
+        width: float,
+        height: float,
+        text: str,
+        word_offsets: array,
+        word_boxes: array,
+        word_line: array,
+        line_boxes: array,
+        line_block: array,
+        block_boxes: array,
+    ):
+        self.width = width
+        self.height = height
+        self.text = text
+        # n_words + 1 entries; word i is text[off[i] : off[i + 1] - 1]
+        self.word_offsets = word_offsets
+        self.word_boxes = word_boxes
+        self.word_line = word_line
+        self.line_boxes = line_boxes
+        self.line_block = line_block
+        self.block_boxes = block_boxes
+        self._grid: GridIndex | None = None
+
+    @classmethod
+    def from_words(cls, width: float, height: float, words) -> "PageLayout":
+        """
+        words: PyMuPDF get_text("words") tuples
+        (x0, y0, x1, y1, word, block_no, line_no, word_no).
+        """
+        word_boxes, word_line = array("f"), array("I")
+        line_boxes, line_block, block_boxes = array("f"), array("I"), array("f")
+        offsets, parts = array("I"), []
+        pos = 0
+        line_key = block_key = None
+        line_start = block_start = 0
+
+        def close_line(end: int):
+            if end > line_start:
+                line_boxes.extend(_union(word_boxes, line_start, end))
+
+        def close_block(end: int):
+            if end > block_start:
+                block_boxes.extend(_union(line_boxes, block_start, end))
+
+        for x0, y0, x1, y1, word, block_no, line_no, _ in words:
+            i = len(word_line)
+            if (block_no, line_no) != line_key:
+                close_line(i)
+                line_start = i
+                if block_no != block_key:
+                    n_lines = len(line_boxes) // 4
+                    close_block(n_lines)
+                    block_start = n_lines
+                    block_key = block_no
+                line_key = (block_no, line_no)
+                line_block.append(len(block_boxes) // 4)
+            word_boxes.extend((x0, y0, x1, y1))
+            word_line.append(len(line_block) - 1)
+            offsets.append(pos)
+            parts.append(word)
+            pos += len(word) + 1
+        close_line(len(word_line))
+        close_block(len(line_boxes) // 4)
+        offsets.append(pos)
+        return cls(
+            width,
+            height,
+            " ".join(parts),
+            offsets,
+            word_boxes,
+            word_line,
+            line_boxes,
+            line_block,
+            block_boxes,
+        )
+
+    @property
+    def n_words(self) -> int:
+        return len(self.word_line)
+
+    @property
+    def n_lines(self) -> int:
+        return len(self.line_block)
+
+    @property
+    def n_blocks(self) -> int:
+        return len(self.block_boxes) // 4
+
+    def word(self, i: int) -> str:
+        return self.text[self.word_offsets[i] : self.word_offsets[i + 1] - 1]
+
+    def words_in_rect(
+        self, x0: float, y0: float, x1: float, y1: float, min_overlap: float = 0.5
+    ) -> list[int]:
+        """
+        Indices (reading order) of words with at least min_overlap of their
+        area inside the rectangle.
+        """
+        if self._grid is None:
+            self._grid = GridIndex(self.word_boxes, self.width, self.height, GRID_CELL)
+        hits = []
+        boxes = self.word_boxes
+        for i in self._grid.candidates(x0, y0, x1, y1):
+            wx0, wy0, wx1, wy1 = boxes[i * 4 : i * 4 + 4]
+            ix = min(x1, wx1) - max(x0, wx0)
+            iy = min(y1, wy1) - max(y0, wy0)
+            if ix <= 0 or iy <= 0:
+                continue
+            area = max((wx1 - wx0) * (wy1 - wy0), 1e-6)
+            if ix * iy / area >= min_overlap:
+                hits.append(i)
+        hits.sort()
+        return hits
+
+    def text_of(self, word_indices: list[int]) -> str:
+        """Words joined by spaces, lines by newlines, blocks by blank lines."""
+        out, prev_line = [], None
+        for i in word_indices:
+            line = self.word_line[i]
+            if prev_line is not None and line != prev_line:
+                same_block = self.line_block[line] == self.line_block[prev_line]
+                out.append("\n" if same_block else "\n\n")
+            elif prev_line is not None:
+                out.append(" ")
+            out.append(self.word(i))
+            prev_line = line
+        return "".join(out)
+
+    def text_in_rect(
+        self, x0: float, y0: float, x1: float, y1: float, min_overlap: float = 0.5
+    ) -> str:
+        return self.text_of(self.words_in_rect(x0, y0, x1, y1, min_overlap))
+
+    def to_dict(self) -> dict:
+        """Columnar JSON shape: flat [x0, y0, x1, y1, ...] box lists."""
+
+        def rounded(boxes: array) -> list[float]:
+            return [round(v, 2) for v in boxes]
+
+        return {
+            "width": round(self.width, 2),
+            "height": round(self.height, 2),
+            "words": {
+                "text": [self.word(i) for i in range(self.n_words)],
+                "bbox": rounded(self.word_boxes),
+                "line": self.word_line.tolist(),
+            },
+            "lines": {
+                "bbox": rounded(self.line_boxes),
+                "block": self.line_block.tolist(),
+            },
+            "blocks": {"bbox": rounded(self.block_boxes)},
+        }
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps(
+            {
+                "width": self.width,
+                "height": self.height,
+                "words": self.n_words,
+                "lines": self.n_lines,
+                "blocks": self.n_blocks,
+                "byteorder": sys.byteorder,
+            }
+        ).encode("utf-8")
+        arrays = (
+            self.word_offsets,
+            self.word_boxes,
+            self.word_line,
+            self.line_boxes,
+            self.line_block,
+            self.block_boxes,
+        )
+        return b"".join(
+            [_MAGIC, struct.pack("<I", len(header)), header]
+            + [a.tobytes() for a in arrays]
+            + [self.text.encode("utf-8")]
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PageLayout":
+        if data[:4] != _MAGIC:
+            raise ValueError("not a page layout")
+        (header_len,) = struct.unpack("<I", data[4:8])
+        header = json.loads(data[8 : 8 + header_len])
+        pos = 8 + header_len
+        n_words, n_lines = header["words"], header["lines"]
+        arrays = []
+        for code, count in (
+            ("I", n_words + 1),
+            ("f", n_words * 4),
+            ("I", n_words),
+            ("f", n_lines * 4),
+            ("I", n_lines),
+            ("f", header["blocks"] * 4),
+        ):
+            a = array(code)
+            end = pos + count * a.itemsize
+            a.frombytes(data[pos:end])
+            if header["byteorder"] != sys.byteorder:
+                a.byteswap()
+            arrays.append(a)
+            pos = end
+        text = data[pos:].decode("utf-8")
+        return cls(header["width"], header["height"], text, *arrays)
+
+    def nbytes(self) -> int:
+        arrays = (
+            self.word_offsets,
+            self.word_boxes,
+            self.word_line,
+            self.line_boxes,
+            self.line_block,
+            self.block_boxes,
+        )
+        return sum(len(a) * a.itemsize for a in arrays) + len(self.text)
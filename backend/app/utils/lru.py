@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU with an optional TTL, shared by the
+    in-memory caches (LLM answers, document rows, retrieval indexes, page
+    layouts). max_entries <= 0 disables it; expired entries are dropped
+    on lookup and count as misses.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (value, expires at or None)
+        self._entries: "OrderedDict[Hashable, tuple[object, float | None]]" = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        """The cached value (now most recently used), or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < now):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value, ttl_seconds: float | None = None) -> None:
+        """Caches value, for ttl_seconds if given (else the cache's TTL)."""
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def evict_where(self, predicate: Callable[[Hashable, object], bool]) -> int:
+        """Drops every entry for which predicate(key, value) holds."""
+        with self._lock:
+            stale = [k for k, (v, _) in self._entries.items() if predicate(k, v)]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def values(self) -> list:
+        with self._lock:
+            return [value for value, _ in self._entries.values()]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return round(self.hits / total, 4) if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio(),
+        }
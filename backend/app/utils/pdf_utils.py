@@ -1,31 +1,344 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import fitz  # PyMuPDF
 
+from app.core.config import settings
+from app.utils.layout import PageLayout
+
+
+class _Handle:
+    __slots__ = ("doc", "lock", "users", "evicted")
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.lock = threading.Lock()
+        self.users = 0
+        self.evicted = False
+
+
+class DocumentHandleCache:
+    """
+    Bounded LRU of open fitz documents keyed by (abs path, mtime_ns).
+
+    A handle is used by one thread at a time; evicted handles are closed
+    once their last user releases them.
+    """
+
+    def __init__(self, max_open: int):
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple[str, int], _Handle]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextmanager
+    def open(self, pdf_path: str):
+        if self.max_open <= 0:
+            doc = fitz.open(pdf_path)
+            try:
+                yield doc
+            finally:
+                doc.close()
+            return
+
+        path = os.path.abspath(pdf_path)
+        key = (path, os.stat(path).st_mtime_ns)
+        handle = self._acquire(key)
+        try:
+            with handle.lock:
+                yield handle.doc
+        finally:
+            self._release(handle)
+
+    def _acquire(self, key: tuple[str, int]) -> _Handle:
+        with self._lock:
+            handle = self._entries.get(key)
+            if handle is not None:
+                self._entries.move_to_end(key)
+                handle.users += 1
+                self.hits += 1
+                return handle
+            self.misses += 1
+
+        # parse outside the cache lock so other documents aren't blocked
+        doc = fitz.open(key[0])
+
+        with self._lock:
+            handle = self._entries.get(key)
+            if handle is not None:
+                # another thread opened it meanwhile
+                doc.close()
+                self._entries.move_to_end(key)
+            else:
+                # a new mtime means the file was replaced; drop stale handles
+                for stale in [k for k in self._entries if k[0] == key[0]]:
+                    self._drop(stale)
+                handle = _Handle(doc)
+                self._entries[key] = handle
+                while len(self._entries) > self.max_open:
+                    oldest = next(iter(self._entries))
+                    self._drop(oldest)
+                    self.evictions += 1
+            handle.users += 1
+            return handle
+
+    def _release(self, handle: _Handle) -> None:
+        with self._lock:
+            handle.users -= 1
+            close = handle.evicted and handle.users == 0
+        if close:
+            handle.doc.close()
+
+    def _drop(self, key: tuple[str, int]) -> None:
+        # caller holds self._lock
+        handle = self._entries.pop(key)
+        handle.evicted = True
+        if handle.users == 0:
+            handle.doc.close()
+
+    def evict(self, pdf_path: str) -> None:
+        path = os.path.abspath(pdf_path)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": len(self._entries),
+                "max_open": self.max_open,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+doc_cache = DocumentHandleCache(settings.PDF_MAX_OPEN_DOCS)
+open_pdf = doc_cache.open
+
 
 def get_page_count(pdf_path: str) -> int:
-    doc = fitz.open(pdf_path)
-    n = doc.page_count
-    doc.close()
-    return n
+    with open_pdf(pdf_path) as doc:
+        return doc.page_count
 
 
 def extract_page_text(pdf_path: str, page_number_1idx: int) -> str:
-    doc = fitz.open(pdf_path)
-    page = doc.load_page(page_number_1idx - 1)
-    text = page.get_text("text")
-    doc.close()
+    with open_pdf(pdf_path) as doc:
+        page = doc.load_page(page_number_1idx - 1)
+        text = page.get_text("text")
     return text.strip()
 
 
+def extract_page_layout(pdf_path: str, page_number_1idx: int) -> PageLayout:
+    """
+    Words with their line/block structure and boxes (PDF points), in
+    PyMuPDF's reading order.
+    """
+    with open_pdf(pdf_path) as doc:
+        page = doc.load_page(page_number_1idx - 1)
+        words = page.get_text("words")
+        rect = page.rect
+    return PageLayout.from_words(rect.width, rect.height, words)
+
+
+def extract_all_page_texts(pdf_path: str) -> list[str]:
+    # the handle is taken per page, so renders and text lookups on the same
+    # PDF interleave with a long indexing run instead of waiting for it
+    return [
+        extract_page_text(pdf_path, page)
+        for page in range(1, get_page_count(pdf_path) + 1)
+    ]
+
+
 def render_page_to_image(pdf_path: str, page_number_1idx: int, zoom: float = 2.0):
     """
     Returns PIL.Image for the page render.
     """
     from PIL import Image
 
-    doc = fitz.open(pdf_path)
-    page = doc.load_page(page_number_1idx - 1)
-    mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat, alpha=False)
-    doc.close()
+    with open_pdf(pdf_path) as doc:
+        page = doc.load_page(page_number_1idx - 1)
+        mat = fitz.Matrix(zoom, zoom)
+        pix = page.get_pixmap(matrix=mat, alpha=False)
     img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
     return img
+
+
+def bbox_to_clip(page, bbox: dict, bbox_zoom: float = 2.0):
+    """
+    bbox {x, y, w, h} is in pixel coords of the page rendered at bbox_zoom
+    (same convention as image_utils.crop_bbox); returns the matching page
+    rect in PDF points, clamped to the page.
+    """
+    x = int(bbox["x"])
+    y = int(bbox["y"])
+    x2 = max(x + int(bbox["w"]), x + 1)
+    y2 = max(y + int(bbox["h"]), y + 1)
+
+    ox, oy = page.rect.x0, page.rect.y0
+    clip = fitz.Rect(
+        ox + x / bbox_zoom,
+        oy + y / bbox_zoom,
+        ox + x2 / bbox_zoom,
+        oy + y2 / bbox_zoom,
+    )
+    return clip & page.rect
+
+
+def fit_zoom(clip, zoom: float, max_pixels: int | None) -> float:
+    """
+    Lowers zoom so the rendered clip stays within max_pixels.
+    """
+    area = clip.width * clip.height
+    if not max_pixels or area <= 0:
+        return zoom
+    if area * zoom * zoom <= max_pixels:
+        return zoom
+    return math.sqrt(max_pixels / area)
+
+
+def _render_region_pixmap(
+    doc,
+    page_number_1idx: int,
+    bbox: dict,
+    bbox_zoom: float,
+    zoom: float,
+    max_pixels: int | None,
+):
+    page = doc.load_page(page_number_1idx - 1)
+    clip = bbox_to_clip(page, bbox, bbox_zoom)
+    if clip.is_empty:
+        # selection entirely off-page: mirror crop_bbox's 1px minimum
+        x0, y0 = page.rect.x0, page.rect.y0
+        clip = fitz.Rect(x0, y0, x0 + 1 / bbox_zoom, y0 + 1 / bbox_zoom)
+    z = fit_zoom(clip, zoom, max_pixels)
+    return page.get_pixmap(matrix=fitz.Matrix(z, z), clip=clip, alpha=False)
+
+
+def render_region_to_image(
+    pdf_path: str,
+    page_number_1idx: int,
+    bbox: dict,
+    bbox_zoom: float = 2.0,
+    zoom: float = 2.0,
+    max_pixels: int | None = None,
+):
+    """
+    Renders only the bbox area (PyMuPDF clip) instead of the whole page.
+    Returns PIL.Image.
+    """
+    from PIL import Image
+
+    with open_pdf(pdf_path) as doc:
+        pix = _render_region_pixmap(
+            doc, page_number_1idx, bbox, bbox_zoom, zoom, max_pixels
+        )
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+
+def render_region_to_bytes(
+    pdf_path: str,
+    page_number_1idx: int,
+    bbox: dict,
+    bbox_zoom: float = 2.0,
+    zoom: float = 2.0,
+    max_pixels: int | None = None,
+    fmt: str = "png",
+    quality: int = 85,
+    png_compress_level: int = 6,
+) -> bytes:
+    """
+    Like render_region_to_image, but encodes straight from the pixmap
+    buffer (no intermediate copy, no file).
+    """
+    with open_pdf(pdf_path) as doc:
+        pix = _render_region_pixmap(
+            doc, page_number_1idx, bbox, bbox_zoom, zoom, max_pixels
+        )
+    return _encode_pixmap(pix, fmt, quality, png_compress_level)
+
+
+def _encode_pixmap(pix, fmt: str, quality: int, png_compress_level: int) -> bytes:
+    from PIL import Image
+    from app.utils.image_utils import encode_image
+
+    # zero-copy view over the pixmap samples; pix must outlive img
+    img = Image.frombuffer(
+        "RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1
+    )
+    return encode_image(
+        img, fmt, quality=quality, png_compress_level=png_compress_level
+    )
+
+
+def get_page_size(pdf_path: str, page_number_1idx: int) -> tuple[float, float]:
+    """
+    (width, height) in PDF points.
+    """
+    with open_pdf(pdf_path) as doc:
+        rect = doc.load_page(page_number_1idx - 1).rect
+    return rect.width, rect.height
+
+
+def render_thumbnail_to_bytes(
+    pdf_path: str,
+    page_number_1idx: int,
+    max_side: int = 256,
+    fmt: str = "png",
+    quality: int = 85,
+    png_compress_level: int = 6,
+) -> bytes:
+    """
+    Whole page scaled so its longer side is max_side pixels.
+    """
+    with open_pdf(pdf_path) as doc:
+        page = doc.load_page(page_number_1idx - 1)
+        z = max_side / max(page.rect.width, page.rect.height, 1)
+        pix = page.get_pixmap(matrix=fitz.Matrix(z, z), alpha=False)
+    return _encode_pixmap(pix, fmt, quality, png_compress_level)
+
+
+def tile_grid(width: float, height: float, zoom: float, tile_size: int):
+    """
+    (cols, rows) of tile_size px tiles covering a page rendered at zoom.
+    """
+    cols = max(1, math.ceil(width * zoom / tile_size))
+    rows = max(1, math.ceil(height * zoom / tile_size))
+    return cols, rows
+
+
+def render_tile_to_bytes(
+    pdf_path: str,
+    page_number_1idx: int,
+    zoom: float,
+    col: int,
+    row: int,
+    tile_size: int = 256,
+    fmt: str = "png",
+    quality: int = 85,
+    png_compress_level: int = 6,
+) -> bytes:
+    """
+    One tile_size x tile_size tile (smaller on the right/bottom edges) of
+    the page rendered at zoom; only the tile's clip is rasterized.
+    """
+    with open_pdf(pdf_path) as doc:
+        page = doc.load_page(page_number_1idx - 1)
+        span = tile_size / zoom
+        x0 = page.rect.x0 + col * span
+        y0 = page.rect.y0 + row * span
+        clip = fitz.Rect(x0, y0, x0 + span, y0 + span) & page.rect
+        if clip.is_empty:
+            raise ValueError(f"tile {col},{row} is outside the page")
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+    return _encode_pixmap(pix, fmt, quality, png_compress_level)
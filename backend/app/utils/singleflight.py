@@ -0,0 +1,48 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution;
+    every caller gets the leader's result (or exception).
+
+    The shared work runs as its own task, so a cancelled caller (e.g. a
+    client disconnect) never cancels it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> tuple:
+        """
+        Returns (result, shared): shared is True when this caller joined a
+        call already in flight.
+        """
+        task = self._tasks.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        self._tasks[key] = task
+        self.executed += 1
+        task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), False
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # mark the exception retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._tasks),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
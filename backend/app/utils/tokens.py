@@ -0,0 +1,71 @@
+import logging
+from functools import lru_cache
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 chars per token for English prose).
+    """
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
+
+def _litellm():
+    # imported on first use: litellm is slow to import, and spawned CPU-pool
+    # workers pull this module in through the services
+    import litellm
+
+    return litellm
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """
+    Offline count with the model's tokenizer (tiktoken / bundled HF
+    tokenizers via litellm); heuristic when the model is unknown to it.
+    """
+    if not text:
+        return 0
+    if model:
+        try:
+            return _litellm().token_counter(model=model, text=text)
+        except Exception:
+            logger.debug("no tokenizer for %s, estimating", model)
+    return estimate_tokens(text)
+
+
+def count_message_tokens(messages: list[dict], model: str | None = None) -> int:
+    """
+    Tokens for chat messages, including per-message framing overhead.
+    """
+    if model:
+        try:
+            return _litellm().token_counter(model=model, messages=messages)
+        except Exception:
+            logger.debug("no tokenizer for %s, estimating", model)
+    # ~4 tokens of framing per message
+    return sum(4 + estimate_tokens(m.get("content") or "") for m in messages)
+
+
+@lru_cache(maxsize=128)
+def _context_window(model: str) -> int | None:
+    try:
+        return _litellm().get_model_info(model).get("max_input_tokens")
+    except Exception:
+        return None
+
+
+def input_budget(model: str | None) -> int:
+    """
+    Prompt input budget: MODEL_INPUT_BUDGETS[model], else
+    PROMPT_INPUT_BUDGET, never above the model's context window.
+    """
+    budget = settings.MODEL_INPUT_BUDGETS.get(model or "", settings.PROMPT_INPUT_BUDGET)
+    window = _context_window(model) if model else None
+    if window:
+        budget = min(budget, window)
+    return budget
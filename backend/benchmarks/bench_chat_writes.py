@@ -0,0 +1,85 @@
+"""
+Chat persistence throughput on a file-backed SQLite database.
+
+    python -m benchmarks.bench_chat_writes [turns]
+
+baseline      default aiosqlite engine, two commits per turn (old /ask)
+turn          tuned engine (WAL, synchronous=NORMAL, pooled), one commit
+write_behind  tuned engine, rows committed in batches of 200 (as ChatWriteBuffer does)
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.db.database import create_engine_for
+from app.db.models import Base, ChatMessage
+from app.db.repo import insert_chat, insert_chats
+
+
+def _turn() -> list[ChatMessage]:
+    return [
+        ChatMessage(
+            id=f"msg_{uuid.uuid4().hex[:12]}",
+            doc_id="doc_bench",
+            role=role,
+            content="x" * 400,
+        )
+        for role in ("user", "assistant")
+    ]
+
+
+async def _run(mode: str, db_path: Path, turns: int) -> float:
+    engine = create_engine_for(
+        f"sqlite+aiosqlite:///{db_path}", tuned=mode != "baseline"
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(
+        bind=engine, expire_on_commit=False, class_=AsyncSession
+    )
+
+    started = time.perf_counter()
+    if mode == "baseline":
+        for _ in range(turns):
+            async with sessions() as db:
+                for msg in _turn():
+                    await insert_chat(db, msg)
+    elif mode == "turn":
+        for _ in range(turns):
+            async with sessions() as db:
+                await insert_chats(db, _turn())
+    else:
+        batch_size = 200
+        pending: list[ChatMessage] = []
+        for _ in range(turns):
+            pending.extend(_turn())
+            if len(pending) >= batch_size:
+                async with sessions() as db:
+                    await insert_chats(db, pending)
+                pending = []
+        if pending:
+            async with sessions() as db:
+                await insert_chats(db, pending)
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return turns * 2 / elapsed
+
+
+async def main(turns: int = 500) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("baseline", "turn", "write_behind"):
+            results[mode] = round(await _run(mode, Path(tmp) / f"{mode}.db", turns), 1)
+    for mode, rate in results.items():
+        print(f"{mode:>13}: {rate:10.1f} rows/s")
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,86 @@
+"""
+Full-page render + crop vs clip-region render for image selections.
+
+    python -m benchmarks.bench_crop
+
+Reports median latency and the raster bytes each path materialises
+(PyMuPDF/PIL buffers live outside tracemalloc, so pixels are counted).
+"""
+
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from app.utils.image_utils import crop_bbox
+from app.utils.pdf_utils import render_page_to_image, render_region_to_image
+
+# (label, page width pt, page height pt)
+PAGE_SIZES = [("letter", 612, 792), ("a3", 842, 1191), ("a0", 2384, 3370)]
+# small figure selection in pixel coords at zoom 2.0
+BBOX = {"x": 200, "y": 300, "w": 500, "h": 350}
+ZOOM = 2.0
+RUNS = 15
+
+
+def _make_pdf(path: Path, width: float, height: float) -> str:
+    doc = fitz.open()
+    page = doc.new_page(width=width, height=height)
+    for i in range(0, int(height), 24):
+        page.insert_text((36, 36 + i), f"line {i} " * 12, fontsize=9)
+    page.draw_rect(fitz.Rect(100, 150, 350, 325), color=(1, 0, 0), width=2)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def _time(fn) -> tuple[float, object]:
+    samples = []
+    out = None
+    for _ in range(RUNS):
+        t0 = time.perf_counter()
+        out = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), out
+
+
+def main() -> list[dict]:
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, w, h in PAGE_SIZES:
+            pdf = _make_pdf(Path(tmp) / f"{label}.pdf", w, h)
+
+            def full():
+                img = render_page_to_image(pdf, 1, zoom=ZOOM)
+                return img, crop_bbox(img, BBOX)
+
+            def clip():
+                return render_region_to_image(pdf, 1, BBOX, bbox_zoom=ZOOM, zoom=ZOOM)
+
+            full_ms, (page_img, full_crop) = _time(full)
+            clip_ms, clip_crop = _time(clip)
+            rows.append(
+                {
+                    "page": label,
+                    "full_ms": round(full_ms, 2),
+                    "clip_ms": round(clip_ms, 2),
+                    "full_raster_bytes": page_img.width * page_img.height * 3,
+                    "clip_raster_bytes": clip_crop.width * clip_crop.height * 3,
+                    "same_size": full_crop.size == clip_crop.size,
+                }
+            )
+
+    for r in rows:
+        print(
+            f"{r['page']:>7}: full {r['full_ms']:8.2f} ms "
+            f"{r['full_raster_bytes'] / 1e6:7.2f} MB | "
+            f"clip {r['clip_ms']:7.2f} ms {r['clip_raster_bytes'] / 1e6:6.2f} MB"
+            f" | same crop size: {r['same_size']}"
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    main()
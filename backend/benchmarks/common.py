@@ -0,0 +1,101 @@
+"""
+Shared helpers: synthetic PDFs, timing and latency summaries.
+"""
+
+import os
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+# (label, page width pt, page height pt)
+PAGE_SIZES = {"letter": (612, 792), "a3": (842, 1191), "a0": (2384, 3370)}
+
+LOREM = (
+    "Gradient descent minimises the loss by stepping against the gradient. "
+    "The learning rate sets the step size and momentum smooths the updates. "
+    "Eigenvalues describe how a linear map stretches space along its axes. "
+)
+
+
+def make_pdf_bytes(
+    pages: int = 1, size: str = "letter", figures: bool = True, nonce: str = ""
+) -> bytes:
+    """
+    Text-heavy synthetic PDF; `nonce` makes otherwise identical documents
+    hash differently (uploads are deduplicated by content).
+    """
+    width, height = PAGE_SIZES[size]
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page(width=width, height=height)
+        page.insert_text((36, 30), f"Page {p + 1} {nonce}", fontsize=12)
+        rect = fitz.Rect(36, 48, width - 36, height - 36)
+        page.insert_textbox(rect, LOREM * int(width * height / 9000), fontsize=9)
+        if figures:
+            page.draw_rect(fitz.Rect(100, 150, 350, 325), color=(1, 0, 0), width=2)
+            page.draw_circle(fitz.Point(225, 237), 60, color=(0, 0, 1), width=2)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def write_pdf(directory: str, name: str, **kwargs) -> str:
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(make_pdf_bytes(**kwargs))
+    return path
+
+
+def percentile(sorted_samples: list[float], q: float) -> float:
+    """Linear interpolation between closest ranks (q in 0..1)."""
+    if not sorted_samples:
+        return 0.0
+    pos = q * (len(sorted_samples) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_samples) - 1)
+    return sorted_samples[lo] + (sorted_samples[hi] - sorted_samples[lo]) * (pos - lo)
+
+
+def summarize(samples_ms: list[float], wall_seconds: float | None = None) -> dict:
+    """
+    p50/p95/p99 in ms plus throughput: completed ops per wall-clock second
+    (sequential runs use the summed latency as wall time).
+    """
+    ordered = sorted(samples_ms)
+    wall = wall_seconds if wall_seconds is not None else sum(ordered) / 1000
+    return {
+        "n": len(ordered),
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p95_ms": round(percentile(ordered, 0.95), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "throughput_rps": round(len(ordered) / wall, 2) if wall > 0 else 0.0,
+    }
+
+
+def time_calls(fn, runs: int, warmup: int = 2) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples)
+
+
+def configure_env(storage_dir: str | None = None) -> str:
+    """
+    Points settings at a throwaway storage dir / SQLite file. Must run
+    before anything under app/ is imported (settings are read at import).
+    """
+    base = storage_dir or tempfile.mkdtemp(prefix="marginstudio_bench_")
+    os.environ.setdefault("ENV", "bench")
+    os.environ["STORAGE_DIR"] = base
+    os.environ["PDF_DIR"] = os.path.join(base, "pdfs")
+    os.environ["IMAGE_DIR"] = os.path.join(base, "images")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{base}/bench.db"
+    os.environ.setdefault("TIMING_LOG", "false")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    return base
@@ -0,0 +1,148 @@
+"""
+End-to-end load driver against the ASGI app (in-process, httpx
+ASGITransport) with LiteLLM replaced by a fake of configurable latency.
+
+    python -m benchmarks.load [--quick]
+
+Prefer benchmarks.run, which isolates storage and writes a baseline.
+Latencies are client-side and include background tasks (page indexing,
+thumbnail), since the in-process transport waits for the whole ASGI call.
+"""
+
+import asyncio
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import make_pdf_bytes, summarize
+
+SCENARIOS = ("upload", "page_text", "tile", "ask_text", "ask_image")
+
+
+def fake_acompletion(latency_ms: float, jitter_ms: float):
+    async def _acompletion(*args, **kwargs):
+        await asyncio.sleep(
+            max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000
+        )
+        message = {"content": "BENCH_ANSWER"}
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    return _acompletion
+
+
+async def _drive(client, make_request, total: int, concurrency: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+    samples: list[float] = []
+    errors = 0
+
+    async def _one(i: int):
+        nonlocal errors
+        async with slots:
+            t0 = time.perf_counter()
+            resp = await make_request(client, i)
+            elapsed = (time.perf_counter() - t0) * 1000
+        if resp.status_code >= 400:
+            errors += 1
+        else:
+            samples.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(total)))
+    wall = time.perf_counter() - started
+    return {**summarize(samples, wall), "errors": errors, "concurrency": concurrency}
+
+
+async def run(
+    total: int = 64,
+    concurrency: int = 8,
+    llm_latency_ms: float = 150.0,
+    llm_jitter_ms: float = 50.0,
+    pages: int = 5,
+) -> dict:
+    """Returns {"load.<scenario>": latency summary + errors}."""
+    import httpx
+
+    import app.services.llm_service as llm_service
+    from app.main import app
+
+    llm_service.acompletion = fake_acompletion(llm_latency_ms, llm_jitter_ms)
+    uploads = [
+        make_pdf_bytes(pages=pages, nonce=f"bench-{i}-{time.time_ns()}")
+        for i in range(total)
+    ]
+    doc_ids: list[str] = []
+
+    async def upload(client, i):
+        files = {"file": (f"bench_{i}.pdf", uploads[i], "application/pdf")}
+        resp = await client.post("/api/upload", files=files)
+        if resp.status_code == 200:
+            doc_ids.append(resp.json()["doc_id"])
+        return resp
+
+    def doc(i: int) -> str:
+        return doc_ids[i % len(doc_ids)]
+
+    async def page_text(client, i):
+        return await client.get(f"/api/documents/{doc(i)}/page/{i % pages + 1}/text")
+
+    async def tile(client, i):
+        # distinct (doc, col, row) per request: cold renders
+        col, row = (i // len(doc_ids)) % 4, (i // len(doc_ids)) // 4 % 6
+        return await client.get(f"/api/documents/{doc(i)}/page/1/tiles/2/{col}/{row}")
+
+    async def ask_text(client, i):
+        return await client.post(
+            "/api/ask",
+            json={
+                "user_query": "What does the learning rate control?",
+                "selection": {"type": "text", "page": i % pages + 1},
+                "document_id": doc(i),
+                "cache": "bypass",
+            },
+        )
+
+    async def ask_image(client, i):
+        bbox = {"x": 40 + (i % 50) * 7, "y": 60 + (i % 30) * 11, "w": 400, "h": 300}
+        return await client.post(
+            "/api/ask",
+            json={
+                "user_query": "What is this?",
+                "selection": {"type": "image", "page": 1, "bbox": bbox},
+                "document_id": doc(i),
+                "cache": "bypass",
+            },
+        )
+
+    requests = {
+        "upload": upload,
+        "page_text": page_text,
+        "tile": tile,
+        "ask_text": ask_text,
+        "ask_image": ask_image,
+    }
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=120
+        ) as client:
+            for name in SCENARIOS:
+                results[f"load.{name}"] = await _drive(
+                    client, requests[name], total, concurrency
+                )
+    return results
+
+
+if __name__ == "__main__":
+    from benchmarks.common import configure_env
+
+    configure_env()
+    quick = "--quick" in sys.argv
+    out = asyncio.run(run(total=16 if quick else 64))
+    for name, s in out.items():
+        print(
+            f"{name:<16} p50 {s['p50_ms']:9.2f} ms  p95 {s['p95_ms']:9.2f} ms  "
+            f"p99 {s['p99_ms']:9.2f} ms  {s['throughput_rps']:8.1f} req/s  "
+            f"errors {s['errors']}"
+        )
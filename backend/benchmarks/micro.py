@@ -0,0 +1,127 @@
+"""
+Microbenchmarks for pdf_utils, image_utils.crop_bbox and
+prompt_engine.build_prompt over synthetic PDFs of varying page count and
+page size.
+
+    python -m benchmarks.micro [--quick]
+
+Prefer benchmarks.run, which isolates storage and writes a baseline.
+"""
+
+import sys
+import tempfile
+
+from benchmarks.common import LOREM, time_calls, write_pdf
+
+# (label, pages, page size)
+PDF_VARIANTS = [
+    ("1p-letter", 1, "letter"),
+    ("25p-letter", 25, "letter"),
+    ("200p-letter", 200, "letter"),
+    ("1p-a0", 1, "a0"),
+]
+QUICK_VARIANTS = ("1p-letter", "25p-letter", "1p-a0")
+BBOX = {"x": 200, "y": 300, "w": 500, "h": 350}
+
+
+def _pdf_benchmarks(pdf: str, pages: int, runs: int) -> dict:
+    from app.utils import pdf_utils
+    from app.utils.image_utils import crop_bbox
+
+    last = pages
+
+    def cold_page_count():
+        pdf_utils.doc_cache.clear()
+        pdf_utils.get_page_count(pdf)
+
+    page_img = pdf_utils.render_page_to_image(pdf, 1, zoom=2.0)
+    layout = pdf_utils.extract_page_layout(pdf, 1)
+    rect = (
+        BBOX["x"] / 2,
+        BBOX["y"] / 2,
+        (BBOX["x"] + BBOX["w"]) / 2,
+        (BBOX["y"] + BBOX["h"]) / 2,
+    )
+    heavy = max(3, runs // 5)
+    return {
+        "get_page_count.cold": time_calls(cold_page_count, runs),
+        "get_page_count.warm": time_calls(lambda: pdf_utils.get_page_count(pdf), runs),
+        "extract_page_text.last": time_calls(
+            lambda: pdf_utils.extract_page_text(pdf, last), runs
+        ),
+        "extract_page_layout": time_calls(
+            lambda: pdf_utils.extract_page_layout(pdf, 1), runs
+        ),
+        "layout.text_in_rect": time_calls(lambda: layout.text_in_rect(*rect), runs),
+        "extract_all_page_texts": time_calls(
+            lambda: pdf_utils.extract_all_page_texts(pdf), heavy, warmup=1
+        ),
+        "render_page_to_image.z2": time_calls(
+            lambda: pdf_utils.render_page_to_image(pdf, 1, zoom=2.0), heavy, warmup=1
+        ),
+        "render_region_to_bytes.png": time_calls(
+            lambda: pdf_utils.render_region_to_bytes(pdf, 1, BBOX, fmt="png"), runs
+        ),
+        "render_thumbnail_to_bytes.webp": time_calls(
+            lambda: pdf_utils.render_thumbnail_to_bytes(pdf, 1, 256, fmt="webp"), runs
+        ),
+        "render_tile_to_bytes.z2.webp": time_calls(
+            lambda: pdf_utils.render_tile_to_bytes(pdf, 1, 2.0, 1, 1, fmt="webp"),
+            runs,
+        ),
+        "crop_bbox": time_calls(lambda: crop_bbox(page_img, BBOX), runs),
+    }
+
+
+def _prompt_benchmarks(runs: int) -> dict:
+    import litellm
+
+    from app.services.prompt_engine import build_prompt
+
+    # unknown models make litellm print its provider list on every lookup
+    litellm.suppress_debug_info = True
+
+    short = {"type": "text", "page": 1, "content": LOREM}
+    # ~60k tokens: exercises counting + trimming to the input budget
+    long = {"type": "text", "page": 1, "content": LOREM * 1200}
+    image = {"type": "image", "page": 1, "bbox": BBOX}
+    q = "What does the learning rate control?"
+    model = "gpt-4o-mini"
+    return {
+        "build_prompt.text_short": time_calls(
+            lambda: build_prompt(q, short, model=model), runs
+        ),
+        "build_prompt.text_trimmed": time_calls(
+            lambda: build_prompt(q, long, model=model), max(3, runs // 5), warmup=1
+        ),
+        "build_prompt.text_heuristic": time_calls(
+            lambda: build_prompt(q, short, model="unknown-local-model"), runs
+        ),
+        "build_prompt.image": time_calls(
+            lambda: build_prompt(q, image, model=model), runs
+        ),
+    }
+
+
+def run(quick: bool = False) -> dict:
+    """Returns {benchmark name: latency summary}."""
+    runs = 10 if quick else 40
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, pages, size in PDF_VARIANTS:
+            if quick and label not in QUICK_VARIANTS:
+                continue
+            pdf = write_pdf(tmp, f"{label}.pdf", pages=pages, size=size)
+            for name, summary in _pdf_benchmarks(pdf, pages, runs).items():
+                results[f"micro.{name}[{label}]"] = summary
+    for name, summary in _prompt_benchmarks(runs).items():
+        results[f"micro.{name}"] = summary
+    return results
+
+
+if __name__ == "__main__":
+    from benchmarks.common import configure_env
+
+    configure_env()
+    for name, s in run(quick="--quick" in sys.argv).items():
+        print(f"{name:<55} p50 {s['p50_ms']:9.3f} ms  p95 {s['p95_ms']:9.3f} ms")
@@ -0,0 +1,159 @@
+"""
+Runs the micro + load benchmarks and writes a JSON baseline; optionally
+compares against an earlier one.
+
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.run --out new.json --compare bench.json --threshold 0.2
+    python -m benchmarks.run --compare-only bench.json new.json
+
+Exits 1 when any benchmark's p95 grew (or throughput dropped) by more than
+--threshold (relative). Storage and the SQLite DB live in a temp dir.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.common import configure_env
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(old: dict, new: dict, threshold: float) -> tuple[list[dict], list[str]]:
+    """
+    Rows for benchmarks present in both baselines, and the names of those
+    that regressed beyond threshold.
+    """
+    rows, regressions = [], []
+    old_results, new_results = old["results"], new["results"]
+    for name in sorted(set(old_results) & set(new_results)):
+        a, b = old_results[name], new_results[name]
+        p95_delta = (b["p95_ms"] - a["p95_ms"]) / a["p95_ms"] if a["p95_ms"] else 0.0
+        rps_delta = (
+            (b["throughput_rps"] - a["throughput_rps"]) / a["throughput_rps"]
+            if a["throughput_rps"]
+            else 0.0
+        )
+        regressed = p95_delta > threshold or rps_delta < -threshold
+        rows.append(
+            {
+                "name": name,
+                "old_p95_ms": a["p95_ms"],
+                "new_p95_ms": b["p95_ms"],
+                "p95_change": round(p95_delta, 4),
+                "throughput_change": round(rps_delta, 4),
+                "regressed": regressed,
+            }
+        )
+        if regressed:
+            regressions.append(name)
+    return rows, regressions
+
+
+def print_comparison(rows: list[dict]) -> None:
+    for r in rows:
+        flag = "REGRESSED" if r["regressed"] else ""
+        print(
+            f"{r['name']:<58} p95 {r['old_p95_ms']:9.3f} -> {r['new_p95_ms']:9.3f} ms "
+            f"({r['p95_change']:+7.1%})  thr {r['throughput_change']:+7.1%}  {flag}"
+        )
+
+
+def print_results(results: dict) -> None:
+    for name, s in results.items():
+        print(
+            f"{name:<58} p50 {s['p50_ms']:9.3f}  p95 {s['p95_ms']:9.3f}  "
+            f"p99 {s['p99_ms']:9.3f} ms  {s['throughput_rps']:9.1f}/s"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--out", help="write the results baseline here")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--compare-only", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--only", choices=("micro", "load"))
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=150.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    args = parser.parse_args(argv)
+
+    if args.compare_only:
+        old, new = (json.load(open(p)) for p in args.compare_only)
+        rows, regressions = compare(old, new, args.threshold)
+        print_comparison(rows)
+        return 1 if regressions else 0
+
+    storage = configure_env()
+    # app modules read settings at import: only import after configure_env
+    from benchmarks import load, micro
+
+    results = {}
+    if args.only != "load":
+        results.update(micro.run(quick=args.quick))
+    requests = min(args.requests, 16) if args.quick else args.requests
+    if args.only != "micro":
+        results.update(
+            asyncio.run(
+                load.run(
+                    total=requests,
+                    concurrency=args.concurrency,
+                    llm_latency_ms=args.llm_latency_ms,
+                    llm_jitter_ms=args.llm_jitter_ms,
+                )
+            )
+        )
+
+    baseline = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": args.quick,
+            "load": {
+                "requests": requests,
+                "concurrency": args.concurrency,
+                "llm_latency_ms": args.llm_latency_ms,
+                "llm_jitter_ms": args.llm_jitter_ms,
+            },
+            "storage": storage,
+        },
+        "results": results,
+    }
+    print_results(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            rows, regressions = compare(json.load(f), baseline, args.threshold)
+        print_comparison(rows)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.core.config import settings
+from app.db.models import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # full-text index objects are raw DDL, not in the models
+    if type_ == "table" and name.startswith("page_fts"):
+        return False
+    if type_ == "column" and name == "tsv" and obj.table.name == "page_texts":
+        return False
+    if type_ == "index" and name == "ix_page_texts_tsv":
+        return False
+    return True
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=settings.DATABASE_URL,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        render_as_batch=settings.DATABASE_URL.startswith("sqlite"),
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        # SQLite can't ALTER most things; batch mode rebuilds the table
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    from app.db.database import create_engine_for
+
+    engine = create_engine_for(settings.DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(do_run_migrations)
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+elif config.attributes.get("connection") is not None:
+    # app startup (app/db/migrate.py) passes its own connection
+    do_run_migrations(config.attributes["connection"])
+else:
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    asyncio.run(run_async_migrations())
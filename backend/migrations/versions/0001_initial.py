@@ -0,0 +1,44 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+The two tables Base.metadata.create_all built before page text indexing.
+Databases created that way are stamped here (app/db/migrate.py) and
+brought forward by the later revisions, which check what is already
+there: create_all added new tables, never new columns or indexes, so an
+old database can be anywhere in between.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "documents",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("pages", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_table(
+        "chat_messages",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("doc_id", sa.String(), nullable=True),
+        sa.Column("role", sa.String(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("chat_messages")
+    op.drop_table("documents")
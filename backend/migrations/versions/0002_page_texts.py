@@ -0,0 +1,45 @@
+"""page text index: documents.index_status and page_texts
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+Existing documents get index_status 'pending': they were never indexed,
+so page text reads fall back to live extraction for them.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    columns = {c["name"] for c in insp.get_columns("documents")}
+    if "index_status" not in columns:
+        op.add_column(
+            "documents",
+            sa.Column(
+                "index_status",
+                sa.String(),
+                nullable=False,
+                server_default="pending",
+            ),
+        )
+    if not insp.has_table("page_texts"):
+        op.create_table(
+            "page_texts",
+            sa.Column("doc_id", sa.String(), primary_key=True),
+            sa.Column("page", sa.Integer(), primary_key=True),
+            sa.Column("text", sa.Text(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("page_texts")
+    with op.batch_alter_table("documents") as batch_op:
+        batch_op.drop_column("index_status")
@@ -0,0 +1,40 @@
+"""documents.content_hash for upload dedup
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+The index started out non-unique; one found in that state is rebuilt as
+unique.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEX = "ix_documents_content_hash"
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    columns = {c["name"] for c in insp.get_columns("documents")}
+    if "content_hash" not in columns:
+        op.add_column(
+            "documents", sa.Column("content_hash", sa.String(), nullable=True)
+        )
+    indexes = {ix["name"]: ix for ix in insp.get_indexes("documents")}
+    if INDEX in indexes and not indexes[INDEX]["unique"]:
+        op.drop_index(INDEX, table_name="documents")
+        del indexes[INDEX]
+    if INDEX not in indexes:
+        op.create_index(INDEX, "documents", ["content_hash"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX, table_name="documents")
+    with op.batch_alter_table("documents") as batch_op:
+        batch_op.drop_column("content_hash")
@@ -0,0 +1,27 @@
+"""chat history index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+INDEX = "ix_chat_messages_doc_created"
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if INDEX not in {ix["name"] for ix in insp.get_indexes("chat_messages")}:
+        # history reads: WHERE doc_id = ? AND (created_at, id) > cursor
+        op.create_index(INDEX, "chat_messages", ["doc_id", "created_at", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX, table_name="chat_messages")
@@ -0,0 +1,47 @@
+"""bulk ingest jobs
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table("ingest_jobs"):
+        op.create_table(
+            "ingest_jobs",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("total", sa.Integer(), nullable=False),
+            sa.Column("processed", sa.Integer(), nullable=False),
+            sa.Column("succeeded", sa.Integer(), nullable=False),
+            sa.Column("failed", sa.Integer(), nullable=False),
+            sa.Column("concurrency", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+        )
+    if not insp.has_table("ingest_items"):
+        op.create_table(
+            "ingest_items",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("job_id", sa.String(), nullable=False),
+            sa.Column("filename", sa.String(), nullable=False),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("doc_id", sa.String(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+        )
+        op.create_index("ix_ingest_items_job_id", "ingest_items", ["job_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("ingest_items")
+    op.drop_table("ingest_jobs")
@@ -0,0 +1,68 @@
+"""page_texts surrogate key
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+page_texts moves from a (doc_id, page) primary key to an integer id, which
+the full-text index (0007) points at; (doc_id, page) stays unique.
+SQLite can't change a primary key in place, so the table is copied, keeping
+the implicit rowid as the new id.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+UNIQUE = "uq_page_texts_doc_page"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    if "id" in {c["name"] for c in insp.get_columns("page_texts")}:
+        return
+    if bind.dialect.name == "sqlite":
+        op.create_table(
+            "page_texts_new",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("doc_id", sa.String(), nullable=False),
+            sa.Column("page", sa.Integer(), nullable=False),
+            sa.Column("text", sa.Text(), nullable=False),
+            sa.UniqueConstraint("doc_id", "page", name=UNIQUE),
+        )
+        op.execute(
+            "INSERT INTO page_texts_new (id, doc_id, page, text) "
+            "SELECT rowid, doc_id, page, text FROM page_texts"
+        )
+        op.drop_table("page_texts")
+        op.rename_table("page_texts_new", "page_texts")
+    else:
+        pk = insp.get_pk_constraint("page_texts")["name"]
+        op.drop_constraint(pk, "page_texts", type_="primary")
+        op.execute("ALTER TABLE page_texts ADD COLUMN id SERIAL PRIMARY KEY")
+        op.create_unique_constraint(UNIQUE, "page_texts", ["doc_id", "page"])
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        op.create_table(
+            "page_texts_old",
+            sa.Column("doc_id", sa.String(), primary_key=True),
+            sa.Column("page", sa.Integer(), primary_key=True),
+            sa.Column("text", sa.Text(), nullable=False),
+        )
+        op.execute(
+            "INSERT INTO page_texts_old (doc_id, page, text) "
+            "SELECT doc_id, page, text FROM page_texts"
+        )
+        op.drop_table("page_texts")
+        op.rename_table("page_texts_old", "page_texts")
+    else:
+        op.drop_constraint(UNIQUE, "page_texts", type_="unique")
+        op.drop_column("page_texts", "id")
+        op.create_primary_key("page_texts_pkey", "page_texts", ["doc_id", "page"])
@@ -0,0 +1,77 @@
+"""full-text index over page_texts
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+FTS5 on SQLite, a generated tsvector column with a GIN index on Postgres.
+Existing page texts are indexed here as well.
+"""
+
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+# External-content FTS5 index over page_texts: the text is stored once (in
+# page_texts) and triggers keep the inverted index in step with every
+# insert/delete, so new documents are indexed incrementally.
+SQLITE_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS page_fts USING fts5(
+        text,
+        content='page_texts',
+        content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS page_texts_fts_ai AFTER INSERT ON page_texts BEGIN
+        INSERT INTO page_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS page_texts_fts_ad AFTER DELETE ON page_texts BEGIN
+        INSERT INTO page_fts(page_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS page_texts_fts_au AFTER UPDATE ON page_texts BEGIN
+        INSERT INTO page_fts(page_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO page_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    # index rows that predate the triggers
+    "INSERT INTO page_fts(page_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_FTS_DDL = [
+    """
+    ALTER TABLE page_texts ADD COLUMN IF NOT EXISTS tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', text)) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_page_texts_tsv ON page_texts USING GIN (tsv)",
+]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for ddl in SQLITE_FTS_DDL:
+            op.execute(ddl)
+    elif dialect == "postgresql":
+        for ddl in POSTGRES_FTS_DDL:
+            op.execute(ddl)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for trigger in ("ai", "ad", "au"):
+            op.execute(f"DROP TRIGGER IF EXISTS page_texts_fts_{trigger}")
+        op.execute("DROP TABLE IF EXISTS page_fts")
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_page_texts_tsv")
+        op.execute("ALTER TABLE page_texts DROP COLUMN IF EXISTS tsv")
@@ -32,10 +32,41 @@ class _FakeResp:
         self.choices = [_FakeChoice(content)]
 
 
+class _FakeDelta:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeChunk:
+    def __init__(self, content: str):
+        self.choices = [type("_Choice", (), {"delta": _FakeDelta(content)})()]
+
+
+class _FakeStream:
+    """Async iterator shaped like LiteLLM's CustomStreamWrapper."""
+
+    def __init__(self, content: str, chunk_size: int = 4):
+        self._chunks = [
+            content[i : i + chunk_size] for i in range(0, len(content), chunk_size)
+        ]
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        return _FakeChunk(self._chunks.pop(0))
+
+    async def aclose(self):
+        self.closed = True
+
+
 @pytest.fixture()
 def mock_litellm(monkeypatch):
     """
-    Patch app.services.llm_service.completion (imported as `completion`)
+    Patch app.services.llm_service.completion / acompletion (imported by name)
     so /ask doesn't call any real provider.
     """
 
@@ -51,9 +82,16 @@ def mock_litellm(monkeypatch):
             pass
         return _FakeResp("FAKE_TEXT_ANSWER")
 
+    async def _fake_acompletion(*args, **kwargs):
+        resp = _fake_completion(*args, **kwargs)
+        if kwargs.get("stream"):
+            return _FakeStream(resp.choices[0].message["content"])
+        return resp
+
     import app.services.llm_service as llm_service
 
     monkeypatch.setattr(llm_service, "completion", _fake_completion)
+    monkeypatch.setattr(llm_service, "acompletion", _fake_acompletion)
 
 
 def upload_sample_pdf(client, pages: int = 2):
@@ -165,6 +203,20 @@ def test_ask_image_requires_bbox(client, mock_litellm):
     assert "selection.bbox required" in resp.text
 
 
+def test_ask_rejects_page_outside_document(client, mock_litellm):
+    doc_id = upload_sample_pdf(client, pages=2)["doc_id"]
+    bbox = {"x": 10, "y": 10, "w": 50, "h": 50}
+    for selection in (
+        {"type": "text", "page": 3},
+        {"type": "text", "page": 3, "content": "some text"},
+        {"type": "image", "page": 3, "bbox": bbox},
+    ):
+        payload = {"document_id": doc_id, "user_query": "q", "selection": selection}
+        resp = client.post("/api/ask", json=payload)
+        assert resp.status_code == 400, resp.text
+        assert "Invalid page number" in resp.text
+
+
 def test_ask_image_crop_success(client, mock_litellm):
     out = upload_sample_pdf(client, pages=1)
     doc_id = out["doc_id"]
@@ -191,3 +243,859 @@ def test_ask_image_crop_success(client, mock_litellm):
     img_dir = os.environ["IMAGE_DIR"]
     saved = [f for f in os.listdir(img_dir) if f.endswith(".png")]
     assert len(saved) >= 1
+
+
+def test_page_text_served_from_index_after_upload(client, monkeypatch):
+    out = upload_sample_pdf(client, pages=2)
+    doc_id = out["doc_id"]
+
+    resp = client.get(f"/api/documents/{doc_id}")
+    assert resp.json()["index_status"] == "done"
+
+    import app.services.document_service as document_service
+
+    def _no_live_extraction(*args, **kwargs):
+        raise AssertionError("page text should come from the index")
+
+    monkeypatch.setattr(document_service, "extract_page_text", _no_live_extraction)
+
+    resp = client.get(f"/api/documents/{doc_id}/page/2/text")
+    assert resp.status_code == 200
+    assert "Test Document (page 2)" in resp.json()["text"]
+
+
+def test_ask_offloads_render_and_reports_pool_stats(client, mock_litellm):
+    out = upload_sample_pdf(client, pages=1)
+    payload = {
+        "document_id": out["doc_id"],
+        "user_query": "Explain this diagram",
+        "selection": {
+            "type": "image",
+            "page": 1,
+            "bbox": {"x": 50, "y": 50, "w": 300, "h": 200},
+        },
+    }
+    resp = client.post("/api/ask", json=payload)
+    assert resp.status_code == 200, resp.text
+
+    stats = client.get("/api/admin/pools").json()
+    render_pool = stats.get("cpu", stats["io"])
+    assert render_pool["completed"] >= 1
+    assert render_pool["in_flight"] == 0
+    assert render_pool["queue_depth"] == 0
+
+
+def test_cpu_pool_recovers_after_worker_dies(client, mock_litellm):
+    import signal
+    import time
+    from app.core.executor import cpu_pool, io_pool, run_cpu
+
+    if cpu_pool is io_pool:
+        pytest.skip("CPU pool runs on threads")
+    out = upload_sample_pdf(client, pages=1)
+    worker = client.portal.call(run_cpu, os.getpid)
+    os.kill(worker, signal.SIGKILL)
+    time.sleep(0.2)
+
+    restarts = cpu_pool.restarts
+    payload = {
+        "document_id": out["doc_id"],
+        "user_query": "Explain this diagram",
+        "selection": {
+            "type": "image",
+            "page": 1,
+            "bbox": {"x": 40, "y": 60, "w": 310, "h": 190},
+        },
+        "cache": "bypass",
+    }
+    resp = client.post("/api/ask", json=payload)
+    assert resp.status_code == 200, resp.text
+    assert cpu_pool.restarts == restarts + 1
+    assert client.get("/api/admin/pools").json()["cpu"]["restarts"] >= 1
+
+
+def test_ask_sync_llm_path_runs_on_io_pool(client, mock_litellm, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "LLM_NATIVE_ASYNC", False)
+    payload = {
+        "user_query": "Explain this",
+        "selection": {"type": "text", "page": 1, "content": "Some selected snippet"},
+    }
+    resp = client.post("/api/ask", json=payload)
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["answer"] == "FAKE_TEXT_ANSWER"
+
+
+def test_repeated_image_ask_reuses_cached_crop(client, mock_litellm):
+    out = upload_sample_pdf(client, pages=1)
+    payload = {
+        "document_id": out["doc_id"],
+        "user_query": "What is this?",
+        "selection": {
+            "type": "image",
+            "page": 1,
+            "bbox": {"x": 40, "y": 60, "w": 222, "h": 111},
+        },
+    }
+    before = client.get("/api/admin/crop-cache").json()
+    assert client.post("/api/ask", json=payload).status_code == 200
+    files_after_first = set(os.listdir(os.environ["IMAGE_DIR"]))
+    assert client.post("/api/ask", json=payload).status_code == 200
+    assert set(os.listdir(os.environ["IMAGE_DIR"])) == files_after_first
+
+    after = client.get("/api/admin/crop-cache").json()
+    assert after["hits"] - before["hits"] == 1
+    assert after["files"] >= 1
+
+    resp = client.delete("/api/admin/crop-cache")
+    assert resp.status_code == 200
+    assert resp.json()["removed"] >= 1
+    assert client.get("/api/admin/crop-cache").json()["files"] == 0
+
+
+def test_image_ask_in_memory_jpeg_crop(client, monkeypatch):
+    import base64
+    import app.services.llm_service as llm_service
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "CROP_PERSIST", False)
+    monkeypatch.setattr(settings, "CROP_FORMAT", "jpeg")
+    monkeypatch.setattr(settings, "CROP_QUALITY", 70)
+
+    seen = {}
+
+    async def _capture(*args, **kwargs):
+        seen["messages"] = kwargs["messages"]
+        return _FakeResp("FAKE_IMAGE_ANSWER")
+
+    monkeypatch.setattr(llm_service, "acompletion", _capture)
+
+    out = upload_sample_pdf(client, pages=1)
+    files_before = set(os.listdir(os.environ["IMAGE_DIR"]))
+    payload = {
+        "document_id": out["doc_id"],
+        "user_query": "Explain this diagram",
+        "selection": {
+            "type": "image",
+            "page": 1,
+            "bbox": {"x": 90, "y": 230, "w": 520, "h": 220},
+        },
+        "cache": "bypass",
+    }
+    resp = client.post("/api/ask", json=payload)
+    assert resp.status_code == 200, resp.text
+    assert set(os.listdir(os.environ["IMAGE_DIR"])) == files_before
+
+    url = seen["messages"][-1]["content"][1]["image_url"]["url"]
+    prefix = "data:image/jpeg;base64,"
+    assert url.startswith(prefix)
+    assert base64.b64decode(url[len(prefix) :])[:3] == b"\xff\xd8\xff"
+
+
+def _parse_sse(body: str) -> list[tuple[str, dict]]:
+    import json
+
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_ask_stream_sends_tokens_and_persists_once(client, mock_litellm):
+    out = upload_sample_pdf(client, pages=1)
+    payload = {
+        "document_id": out["doc_id"],
+        "user_query": "Explain this",
+        "selection": {"type": "text", "page": 1, "content": "Some selected snippet"},
+        "cache": "bypass",
+    }
+    with client.stream("POST", "/api/ask/stream", json=payload) as resp:
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        body = "".join(resp.iter_text())
+
+    events = _parse_sse(body)
+    names = [name for name, _ in events]
+    assert names[0] == "start" and names[-1] == "done"
+    assert names.count("token") > 1
+    answer = "".join(data["text"] for name, data in events if name == "token")
+    assert answer == "FAKE_TEXT_ANSWER"
+
+    done = events[-1][1]
+    assert done["model"] == "gpt-4o-mini"
+    assert done["used_context"]["type"] == "text"
+    assert done["ttft_ms"] is not None
+
+    import asyncio
+    from sqlalchemy import select
+    from app.db.database import SessionLocal
+    from app.db.models import ChatMessage
+
+    async def _rows():
+        async with SessionLocal() as db:
+            res = await db.execute(
+                select(ChatMessage).where(ChatMessage.doc_id == out["doc_id"])
+            )
+            return res.scalars().all()
+
+    rows = asyncio.run(_rows())
+    assert sorted(r.role for r in rows) == ["assistant", "user"]
+    assert [r.content for r in rows if r.role == "assistant"] == ["FAKE_TEXT_ANSWER"]
+
+
+def test_astream_closes_upstream_when_consumer_stops(monkeypatch):
+    import asyncio
+    import app.services.llm_service as llm_service
+
+    upstream = _FakeStream("a fairly long streamed answer", chunk_size=2)
+
+    async def _fake_acompletion(*args, **kwargs):
+        assert kwargs["stream"] is True
+        return upstream
+
+    monkeypatch.setattr(llm_service, "acompletion", _fake_acompletion)
+
+    async def _consume_one():
+        plan = {"system": "s", "user": "u"}
+        _, deltas = await llm_service.astream(None, plan)
+        async for _ in deltas:
+            break  # e.g. the SSE client went away
+        await deltas.aclose()
+
+    asyncio.run(_consume_one())
+    assert upstream.closed
+
+
+def test_ask_stream_holds_no_slot_when_response_never_sends(client, mock_litellm):
+    import asyncio
+    from app.api.routes import ask_ai_stream
+    from app.db.database import SessionLocal
+    from app.schemas.dto import AskRequest
+    from app.services.llm_router import router as llm_router
+
+    payload = AskRequest(
+        user_query="Explain this",
+        selection={"type": "text", "page": 1, "content": "Some selected snippet"},
+        cache="bypass",
+    )
+
+    async def _send(message):
+        raise OSError("client went away")
+
+    async def _receive():
+        await asyncio.Event().wait()
+
+    async def _serve_and_fail():
+        async with SessionLocal() as db:
+            response = await ask_ai_stream(payload, db)
+        with pytest.raises(Exception):
+            await response({"type": "http"}, _receive, _send)
+        return llm_router.gauges()
+
+    gauges = client.portal.call(_serve_and_fail)
+    assert all(g["in_flight"] == 0 for g in gauges.values())
+
+
+def test_ask_response_cache_hit_bypass_and_refresh(client, monkeypatch):
+    import app.services.llm_service as llm_service
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_FUZZY", True)
+    calls = []
+
+    async def _counting(*args, **kwargs):
+        calls.append(kwargs)
+        return _FakeResp(f"ANSWER_{len(calls)}")
+
+    monkeypatch.setattr(llm_service, "acompletion", _counting)
+
+    def _ask(query: str, cache: str = "use"):
+        payload = {
+            "user_query": query,
+            "selection": {"type": "text", "page": 3, "content": "Cached paragraph"},
+            "cache": cache,
+        }
+        resp = client.post("/api/ask", json=payload)
+        assert resp.status_code == 200, resp.text
+        return resp.json()
+
+    first = _ask("What does this paragraph mean?")
+    assert first["cache"]["hit"] is False
+
+    # near-duplicate wording hits the same entry with fuzzy normalization
+    second = _ask("what does this  paragraph mean")
+    assert second["answer"] == first["answer"]
+    assert second["cache"]["hit"] is True
+    assert second["cache"]["time_saved_ms"] >= 0
+    assert len(calls) == 1
+
+    bypass = _ask("What does this paragraph mean?", cache="bypass")
+    assert bypass["cache"]["hit"] is False
+    assert len(calls) == 2
+
+    refreshed = _ask("What does this paragraph mean?", cache="refresh")
+    assert refreshed["answer"] == "ANSWER_3"
+    assert _ask("What does this paragraph mean?")["answer"] == "ANSWER_3"
+
+    stats = client.get("/api/admin/response-cache").json()
+    assert stats["hits"] >= 2
+    assert 0 < stats["hit_ratio"] <= 1
+
+
+def test_chat_history_keyset_pagination_and_export(client):
+    import json
+    from datetime import datetime, timedelta
+    from app.db.database import SessionLocal
+    from app.db.models import ChatMessage
+    from app.db.repo import insert_chats
+
+    out = upload_sample_pdf(client, pages=1)
+    doc_id = out["doc_id"]
+    base = datetime(2024, 1, 1)
+    rows = [
+        ChatMessage(
+            id=f"msg_hist_{doc_id}_{i:03d}",
+            doc_id=doc_id,
+            role="user" if i % 2 == 0 else "assistant",
+            content=f"message {i}",
+            # pairs share a timestamp: the id breaks ties
+            created_at=base + timedelta(seconds=i // 2),
+        )
+        for i in range(25)
+    ]
+
+    async def _seed():
+        async with SessionLocal() as db:
+            await insert_chats(db, rows)
+
+    client.portal.call(_seed)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 10}
+        if cursor:
+            params["cursor"] = cursor
+        resp = client.get(f"/api/documents/{doc_id}/messages", params=params)
+        assert resp.status_code == 200, resp.text
+        page = resp.json()
+        seen.extend(m["content"] for m in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [f"message {i}" for i in range(25)]
+
+    newest = client.get(
+        f"/api/documents/{doc_id}/messages", params={"limit": 2, "order": "desc"}
+    ).json()
+    assert [m["content"] for m in newest["items"]] == ["message 24", "message 23"]
+
+    bad = client.get(f"/api/documents/{doc_id}/messages", params={"cursor": "nope"})
+    assert bad.status_code == 400
+
+    resp = client.get(f"/api/documents/{doc_id}/messages/export")
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["content"] for line in lines] == seen
+
+
+def test_chat_history_query_uses_composite_index(client):
+    from sqlalchemy import text
+    from app.db.database import engine
+
+    async def _plan():
+        async with engine.connect() as conn:
+            res = await conn.execute(
+                text(
+                    "EXPLAIN QUERY PLAN SELECT * FROM chat_messages "
+                    "WHERE doc_id = 'd' AND (created_at, id) > ('2024-01-01', 'm') "
+                    "ORDER BY created_at, id LIMIT 50"
+                )
+            )
+            return " ".join(str(r[-1]) for r in res)
+
+    plan = client.portal.call(_plan)
+    assert "ix_chat_messages_doc_created" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_upload_deduplicates_identical_content(client):
+    pdf_bytes = make_pdf_bytes("Dedup Document", pages=3)
+    files = {"file": ("first.pdf", pdf_bytes, "application/pdf")}
+    first = client.post("/api/upload", files=files).json()
+    assert first["deduplicated"] is False
+
+    files = {"file": ("second.pdf", pdf_bytes, "application/pdf")}
+    second = client.post("/api/upload", files=files).json()
+    assert second["deduplicated"] is True
+    assert second["doc_id"] == first["doc_id"]
+    assert second["filename"] == "first.pdf"
+
+    pdf_dir = os.environ["PDF_DIR"]
+    stored = [f for f in os.listdir(pdf_dir) if f.endswith("first.pdf")]
+    assert len(stored) == 1
+    assert not any(f.endswith("second.pdf") for f in os.listdir(pdf_dir))
+    assert not any(f.endswith(".part") for f in os.listdir(pdf_dir))
+
+
+def test_upload_rejects_oversized_and_invalid_files(client, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 1024)
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_BYTES", 256)
+    files = {"file": ("big.pdf", make_pdf_bytes("Big", pages=5), "application/pdf")}
+    resp = client.post("/api/upload", files=files)
+    assert resp.status_code == 413
+
+    monkeypatch.setattr(settings, "MAX_UPLOAD_BYTES", 10 * 1024 * 1024)
+    files = {"file": ("fake.pdf", b"not a pdf at all", "application/pdf")}
+    resp = client.post("/api/upload", files=files)
+    assert resp.status_code == 400
+
+    pdf_dir = os.environ["PDF_DIR"]
+    assert not any(f.endswith(".part") for f in os.listdir(pdf_dir))
+    assert not any(f.endswith(("big.pdf", "fake.pdf")) for f in os.listdir(pdf_dir))
+
+
+def test_thumbnail_and_tiles_with_conditional_get(client):
+    from PIL import Image
+    from app.services import tile_service
+
+    cache = tile_service.tile_cache
+    misses = cache.misses
+    doc_id = upload_sample_pdf(client, pages=2)["doc_id"]
+    # first-page thumbnail rendered in the background at upload
+    assert cache.misses == misses + 1
+    hits = cache.hits
+
+    resp = client.get(f"/api/documents/{doc_id}/page/1/thumbnail")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "image/webp"
+    assert "max-age=" in resp.headers["cache-control"]
+    etag = resp.headers["etag"]
+    assert max(Image.open(io.BytesIO(resp.content)).size) == 256
+    # served from the disk cache, not rendered again
+    assert (cache.hits, cache.misses) == (hits + 1, misses + 1)
+
+    again = client.get(
+        f"/api/documents/{doc_id}/page/1/thumbnail",
+        headers={"If-None-Match": etag},
+    )
+    assert again.status_code == 304 and again.content == b""
+    assert again.headers["etag"] == etag
+
+    other = client.get(f"/api/documents/{doc_id}/page/2/thumbnail")
+    assert other.status_code == 200 and other.headers["etag"] != etag
+
+    layout = client.get(f"/api/documents/{doc_id}/page/1/tiles").json()
+    level = layout["levels"][2]  # zoom 2: A4 page, 1190 x 1684 px
+    assert (level["cols"], level["rows"]) == (5, 7)
+
+    tile = client.get(f"/api/documents/{doc_id}/page/1/tiles/2/0/0")
+    assert tile.status_code == 200
+    assert Image.open(io.BytesIO(tile.content)).size == (256, 256)
+    edge = client.get(f"/api/documents/{doc_id}/page/1/tiles/2/4/6")
+    assert Image.open(io.BytesIO(edge.content)).size == (1190 - 4 * 256, 1684 - 6 * 256)
+
+    assert client.get(f"/api/documents/{doc_id}/page/1/tiles/2/5/0").status_code == 404
+    assert client.get(f"/api/documents/{doc_id}/page/1/tiles/9/0/0").status_code == 404
+    assert client.get(f"/api/documents/{doc_id}/page/3/thumbnail").status_code == 404
+
+
+def test_upload_and_reads_go_through_storage_backend(client, monkeypatch, tmp_path):
+    from app.services import document_service
+    from app.services.storage import LocalStorage, load_storage
+
+    class _KeyedStorage(LocalStorage):
+        # refs are opaque keys; reads resolve them like a remote backend would
+        is_local = False
+        resolved = 0
+
+        def store(self, local_file, name):
+            super().store(local_file, name)
+            return f"keyed://{name}"
+
+        def local_path(self, ref):
+            _KeyedStorage.resolved += 1
+            return os.path.join(self.root, ref.removeprefix("keyed://"))
+
+        def delete(self, ref):
+            super().delete(self.local_path(ref))
+
+    monkeypatch.setattr(document_service, "storage", _KeyedStorage(str(tmp_path)))
+    pdf_bytes = make_pdf_bytes("Keyed Storage", pages=2)
+    files = {"file": ("keyed.pdf", pdf_bytes, "application/pdf")}
+    doc_id = client.post("/api/upload", files=files).json()["doc_id"]
+    assert os.path.exists(tmp_path / f"{doc_id}_keyed.pdf")
+
+    resp = client.get(f"/api/documents/{doc_id}/page/2/text")
+    assert resp.status_code == 200
+    assert "Keyed Storage (page 2)" in resp.json()["text"]
+    assert _KeyedStorage.resolved > 0
+
+    assert isinstance(load_storage("app.services.storage:LocalStorage"), LocalStorage)
+    with pytest.raises(ValueError):
+        load_storage("s3")
+    # an incomplete backend fails when built, not on its first missing call
+    with pytest.raises(TypeError):
+        load_storage("app.services.storage:StorageBackend")
+
+
+def test_document_deleted_by_another_worker_gives_404(client):
+    from app.db import repo
+    from app.db.database import SessionLocal
+    from app.services.metadata_cache import metadata_cache
+    from app.services.storage import storage
+
+    doc_id = upload_sample_pdf(client)["doc_id"]
+    assert client.get(f"/api/documents/{doc_id}").status_code == 200
+    ref = metadata_cache.get(doc_id).path
+
+    async def _delete_elsewhere():
+        # row and file gone, this worker's cache untouched
+        async with SessionLocal() as db:
+            await repo.delete_document(db, doc_id)
+        storage.delete(ref)
+
+    client.portal.call(_delete_elsewhere)
+    resp = client.get(f"/api/documents/{doc_id}/page/2/thumbnail")
+    assert resp.status_code == 404
+    assert metadata_cache.get(doc_id) is None
+    assert client.get(f"/api/documents/{doc_id}").status_code == 404
+
+
+def test_document_metadata_cached_with_etags_and_delete(client):
+    from app.services.document_service import (
+        cache_prefix,
+        crop_cache,
+        document_fingerprint,
+        get_crop,
+    )
+    from app.services.layout_service import layout_disk_cache
+    from app.services.metadata_cache import metadata_cache
+    from app.services.tile_service import tile_cache
+
+    pdf_bytes = make_pdf_bytes("Cached Metadata", pages=2)
+    files = {"file": ("meta.pdf", pdf_bytes, "application/pdf")}
+    doc_id = client.post("/api/upload", files=files).json()["doc_id"]
+
+    # the index job has finished (TestClient waits for background tasks),
+    # and its status changes evicted any stale entry
+    first = client.get(f"/api/documents/{doc_id}")
+    assert first.json()["index_status"] == "done"
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+
+    hits = metadata_cache.hits
+    again = client.get(f"/api/documents/{doc_id}", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert metadata_cache.hits == hits + 1
+    # tag lists and weak tags match exactly; a tag inside another doesn't
+    for header, status in (
+        (f'"other", W/{etag}', 304),
+        ("*", 304),
+        (etag[:-2] + '"', 200),
+        (f'"x{etag}"', 200),
+    ):
+        cond = client.get(f"/api/documents/{doc_id}", headers={"If-None-Match": header})
+        assert cond.status_code == status, header
+
+    text = client.get(f"/api/documents/{doc_id}/page/1/text")
+    assert "Cached Metadata (page 1)" in text.json()["text"]
+    assert "max-age" in text.headers["cache-control"]
+    cond = client.get(
+        f"/api/documents/{doc_id}/page/1/text",
+        headers={"If-None-Match": text.headers["etag"]},
+    )
+    assert cond.status_code == 304
+    other = client.get(f"/api/documents/{doc_id}/page/2/text")
+    assert other.headers["etag"] != text.headers["etag"]
+
+    # derived files: thumbnail, layout and a crop
+    assert client.get(f"/api/documents/{doc_id}/page/1/thumbnail").status_code == 200
+    assert client.get(f"/api/documents/{doc_id}/page/1/layout").status_code == 200
+    doc = metadata_cache.get(doc_id)
+    client.portal.call(get_crop, doc, 1, {"x": 10, "y": 10, "w": 80, "h": 40})
+    prefix = cache_prefix(document_fingerprint(doc))
+    caches = (tile_cache, layout_disk_cache, crop_cache)
+
+    def _cached_files() -> list[int]:
+        return [
+            sum(name.startswith(c.prefix + prefix) for name in os.listdir(c.directory))
+            for c in caches
+        ]
+
+    assert _cached_files() == [1, 1, 1]
+
+    path = doc.path
+    assert client.delete(f"/api/documents/{doc_id}").status_code == 204
+    assert not os.path.exists(path)
+    assert _cached_files() == [0, 0, 0]
+    assert client.get(f"/api/documents/{doc_id}").status_code == 404
+    assert client.get(f"/api/documents/{doc_id}/page/1/text").status_code == 404
+    assert client.delete(f"/api/documents/{doc_id}").status_code == 404
+
+    # same bytes upload again as a new document, not a dedup hit
+    again = client.post("/api/upload", files=files).json()
+    assert again["deduplicated"] is False
+
+
+def test_metadata_cache_expires_unsettled_rows(monkeypatch):
+    from app.db.models import Document
+    from app.services.metadata_cache import MetadataCache
+
+    clock = [100.0]
+    monkeypatch.setattr("app.utils.lru.time.monotonic", lambda: clock[0])
+    cache = MetadataCache(max_entries=2, ttl_seconds=300, pending_ttl_seconds=2)
+
+    pending = Document(
+        id="a", filename="a.pdf", path="a", pages=1, index_status="pending"
+    )
+    done = Document(id="b", filename="b.pdf", path="b", pages=1, index_status="done")
+    cache.put(pending)
+    cache.put(done)
+    assert cache.get("a").index_status == "pending"
+    clock[0] += 5
+    assert cache.get("a") is None
+    assert cache.get("b").filename == "b.pdf"
+
+    cache.put(pending)
+    cache.get("b")
+    cache.put(
+        Document(id="c", filename="c.pdf", path="c", pages=1, index_status="done")
+    )
+    # LRU: "b" was used more recently than "a"
+    assert cache.get("b") is not None
+    assert cache.get("a") is None
+
+
+def test_ask_multi_region_selections(client, monkeypatch):
+    import asyncio
+    import app.services.llm_service as llm_service
+    from app.services import document_service
+
+    seen = []
+
+    async def _fake(*args, **kwargs):
+        seen.append(kwargs["messages"][-1]["content"])
+        return _FakeResp("MULTI")
+
+    monkeypatch.setattr(llm_service, "acompletion", _fake)
+    pdf_bytes = make_pdf_bytes("Multi Region", pages=3)
+    files = {"file": ("multi.pdf", pdf_bytes, "application/pdf")}
+    doc_id = client.post("/api/upload", files=files).json()["doc_id"]
+
+    # text across a page break: page 3 comes from the document
+    text_payload = {
+        "document_id": doc_id,
+        "user_query": "Summarise this paragraph",
+        "selection": {
+            "type": "text",
+            "regions": [{"page": 2, "content": "first half of it"}, {"page": 3}],
+        },
+        "cache": "bypass",
+    }
+    resp = client.post("/api/ask", json=text_payload)
+    assert resp.status_code == 200, resp.text
+    used = resp.json()["used_context"]
+    assert (used["page"], used["pages"], used["regions"]) == (2, [2, 3], 2)
+    assert "(pages 2, 3)" in seen[-1]
+    assert "first half of it" in seen[-1]
+    assert "Multi Region (page 3)" in seen[-1]
+
+    # image regions render concurrently and go out as one call, in order
+    real_get_crop = document_service.get_crop
+    in_flight = [0, 0]  # current, peak
+
+    async def _slow_crop(doc, page, bbox):
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        return await real_get_crop(doc, page, bbox)
+
+    monkeypatch.setattr(document_service, "get_crop", _slow_crop)
+    bbox = {"x": 50, "y": 50, "w": 300, "h": 200}
+    image_payload = {
+        "document_id": doc_id,
+        "user_query": "Compare these figures",
+        "selection": {
+            "type": "image",
+            "regions": [{"page": p, "bbox": bbox} for p in (1, 2, 3)],
+        },
+        "cache": "bypass",
+    }
+    resp = client.post("/api/ask", json=image_payload)
+    assert resp.status_code == 200, resp.text
+    assert in_flight[1] == 3
+    content = seen[-1]
+    assert [part["type"] for part in content] == ["text"] + ["image_url"] * 3
+    assert "1) page 1, 2) page 2, 3) page 3" in content[0]["text"]
+
+    bad = dict(
+        image_payload,
+        selection={"type": "image", "regions": [{"page": 9, "bbox": bbox}]},
+    )
+    assert client.post("/api/ask", json=bad).status_code == 400
+    no_page = {"user_query": "q", "selection": {"type": "text"}}
+    assert client.post("/api/ask", json=no_page).status_code == 422
+
+
+def test_ask_batch_streams_ndjson_and_persists_once(client, monkeypatch):
+    import asyncio
+    import json
+    import app.services.llm_service as llm_service
+    from app.db import repo
+
+    calls = []
+    in_flight = [0, 0]  # current, peak
+
+    async def _fake(*args, **kwargs):
+        calls.append(kwargs["messages"])
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.02)
+        in_flight[0] -= 1
+        return _FakeResp(f"ANSWER {len(calls)}")
+
+    monkeypatch.setattr(llm_service, "acompletion", _fake)
+    pdf_bytes = make_pdf_bytes("Batch Document", pages=3)
+    files = {"file": ("batch.pdf", pdf_bytes, "application/pdf")}
+    doc_id = client.post("/api/upload", files=files).json()["doc_id"]
+
+    page_lookups = []
+    real_get_page_text = repo.get_page_text
+
+    async def _count_lookups(db, doc, page):
+        page_lookups.append(page)
+        return await real_get_page_text(db, doc, page)
+
+    monkeypatch.setattr(repo, "get_page_text", _count_lookups)
+
+    text_item = {
+        "user_query": "What is on this page?",
+        "selection": {"type": "text", "page": 2},
+        "retrieval": False,
+    }
+    items = [
+        *[dict(text_item, user_query=f"Question {i}") for i in range(6)],
+        text_item,
+        text_item,  # identical: one LLM call
+        {
+            "user_query": "Describe the figure",
+            "selection": {
+                "type": "image",
+                "page": 1,
+                "bbox": {"x": 50, "y": 50, "w": 300, "h": 200},
+            },
+        },
+        {"user_query": "bad", "selection": {"type": "image", "page": 1}},
+        {
+            "user_query": "other doc",
+            "document_id": "doc_other",
+            "selection": text_item["selection"],
+        },
+    ]
+    resp = client.post(
+        "/api/ask/batch",
+        json={"document_id": doc_id, "items": items, "concurrency": 3},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    summary = lines[-1]
+    by_index = {line["index"]: line for line in lines[:-1]}
+
+    assert sorted(by_index) == list(range(len(items)))
+    assert summary["done"] is True
+    assert (summary["succeeded"], summary["failed"]) == (9, 2)
+    assert summary["persisted_messages"] == 18
+    assert by_index[9]["status"] == 400
+    assert by_index[10]["status"] == 400
+    assert "Batch Document (page 2)" in calls[0][-1]["content"]
+    assert by_index[8]["result"]["used_context"]["type"] == "image"
+    assert by_index[6]["result"]["answer"] == by_index[7]["result"]["answer"]
+
+    # page 2 was read once for all eight text items; LLM calls bounded
+    assert page_lookups == []
+    assert len(calls) == 8
+    assert in_flight[1] <= 3
+
+    history = client.get(f"/api/documents/{doc_id}/messages", params={"limit": 50})
+    assert len(history.json()["items"]) == 18
+
+    too_many = {"document_id": doc_id, "items": [text_item] * 101}
+    assert client.post("/api/ask/batch", json=too_many).status_code == 400
+    missing = {"document_id": "doc_missing", "items": [text_item]}
+    assert client.post("/api/ask/batch", json=missing).status_code == 404
+
+
+def test_page_layout_endpoints_and_image_ask_text(client, monkeypatch):
+    import app.services.llm_service as llm_service
+    from app.core.config import settings
+    from app.services import layout_service
+
+    seen = []
+
+    async def _fake(*args, **kwargs):
+        seen.append(kwargs["messages"][-1]["content"])
+        return _FakeResp("LAYOUT")
+
+    monkeypatch.setattr(llm_service, "acompletion", _fake)
+    pdf_bytes = make_pdf_bytes("Layout Words", pages=2)
+    files = {"file": ("layout.pdf", pdf_bytes, "application/pdf")}
+    doc_id = client.post("/api/upload", files=files).json()["doc_id"]
+
+    resp = client.get(f"/api/documents/{doc_id}/page/2/layout")
+    assert resp.status_code == 200
+    layout = resp.json()
+    assert layout["units"] == "pt"
+    assert layout["words"]["text"] == ["Layout", "Words", "(page", "2)"]
+    assert len(layout["words"]["bbox"]) == 16
+    assert len(layout["blocks"]["bbox"]) == 4
+    cond = client.get(
+        f"/api/documents/{doc_id}/page/2/layout",
+        headers={"If-None-Match": resp.headers["etag"]},
+    )
+    assert cond.status_code == 304
+
+    # selection-pixel bbox (CROP_BBOX_ZOOM=2) around the first two words
+    x0, y0, x1, y1 = layout["words"]["bbox"][:4]
+    x1 = layout["words"]["bbox"][6]
+    found = client.get(
+        f"/api/documents/{doc_id}/page/2/layout/text",
+        params={
+            "x": x0 * 2 - 2,
+            "y": y0 * 2 - 2,
+            "w": (x1 - x0) * 2 + 4,
+            "h": (y1 - y0) * 2 + 4,
+        },
+    ).json()
+    assert found["text"] == "Layout Words"
+    assert found["words"] == [0, 1]
+
+    misses = layout_service.layout_cache.misses
+    payload = {
+        "document_id": doc_id,
+        "user_query": "What does this say?",
+        "selection": {
+            "type": "image",
+            "page": 2,
+            "bbox": {"x": 100, "y": 100, "w": 500, "h": 80},
+        },
+        "cache": "bypass",
+    }
+    resp = client.post("/api/ask", json=payload)
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["used_context"]["selection_text_tokens"] > 0
+    assert (
+        "Text found inside the selection:\nLayout Words (page 2)" in seen[-1][0]["text"]
+    )
+    # page 2's layout was already cached by the endpoints
+    assert layout_service.layout_cache.misses == misses
+
+    monkeypatch.setattr(settings, "IMAGE_SELECTION_TEXT_TOKENS", 0)
+    client.post("/api/ask", json=payload)
+    assert "Text found inside" not in seen[-1][0]["text"]
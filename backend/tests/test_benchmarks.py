@@ -0,0 +1,17 @@
+# tests/test_benchmarks.py
+
+
+def test_summary_percentiles_and_baseline_compare():
+    from benchmarks.common import summarize
+    from benchmarks.run import compare
+
+    s = summarize([float(i) for i in range(1, 101)], wall_seconds=2.0)
+    assert (s["n"], s["p50_ms"], s["p95_ms"]) == (100, 50.5, 95.05)
+    assert s["throughput_rps"] == 50.0
+
+    old = {"results": {"a": s, "b": s, "gone": s}}
+    slower = {**s, "p95_ms": s["p95_ms"] * 1.5}
+    new = {"results": {"a": s, "b": slower, "added": s}}
+    rows, regressions = compare(old, new, threshold=0.2)
+    assert [r["name"] for r in rows] == ["a", "b"]
+    assert regressions == ["b"]
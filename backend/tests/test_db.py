@@ -0,0 +1,294 @@
+# tests/test_db.py
+import asyncio
+import os
+
+import pytest
+
+
+def test_sqlite_engine_is_tuned(client):
+    from sqlalchemy import text
+    from app.db.database import engine
+
+    async def _pragmas():
+        async with engine.connect() as conn:
+            mode = (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+            sync = (await conn.execute(text("PRAGMA synchronous"))).scalar()
+            return mode, sync
+
+    mode, sync = client.portal.call(_pragmas)
+    assert mode.lower() == "wal"
+    assert sync == 1  # NORMAL
+
+
+def test_chat_write_behind_flushes_in_batches(monkeypatch):
+    from fastapi.testclient import TestClient
+    from sqlalchemy import select, func
+    from app.core.config import settings
+    from app.db.chat_writer import chat_writer
+    from app.db.database import SessionLocal
+    from app.db.models import ChatMessage
+    from app.main import app
+    import app.services.llm_service as llm_service
+
+    async def _fake(*args, **kwargs):
+        from tests.test_api import _FakeResp
+
+        return _FakeResp("BUFFERED")
+
+    monkeypatch.setattr(settings, "CHAT_WRITE_BEHIND", True)
+    monkeypatch.setattr(chat_writer, "flush_interval", 60)
+    monkeypatch.setattr(llm_service, "acompletion", _fake)
+
+    async def _count():
+        async with SessionLocal() as db:
+            res = await db.execute(
+                select(func.count()).where(ChatMessage.content == "BUFFERED")
+            )
+            return res.scalar_one()
+
+    payload = {
+        "user_query": "Buffered question",
+        "selection": {"type": "text", "page": 1, "content": "buffered"},
+        "cache": "bypass",
+    }
+    with TestClient(app) as c:
+        for _ in range(3):
+            assert c.post("/api/ask", json=payload).status_code == 200
+        stats = c.get("/api/admin/chat-writer").json()
+        assert stats["running"] is True
+        assert stats["pending"] == 6
+        assert c.portal.call(_count) == 0
+
+        assert c.portal.call(chat_writer.flush) == 6
+        assert c.portal.call(_count) == 3
+    # shutdown drains whatever is left
+    assert chat_writer.stats()["pending"] == 0
+
+
+def test_chat_write_behind_drops_bad_rows_and_bounds_queue(client):
+    import uuid
+    from sqlalchemy import select
+    from app.db.chat_writer import ChatWriteBuffer
+    from app.db.database import SessionLocal
+    from app.db.models import ChatMessage
+    from app.db.repo import insert_chats
+
+    def _msg(msg_id: str) -> ChatMessage:
+        return ChatMessage(id=msg_id, role="user", content="retry test")
+
+    taken = uuid.uuid4().hex
+    good = [uuid.uuid4().hex for _ in range(2)]
+    buffer = ChatWriteBuffer(10, 1000, max_retries=1, max_pending=3)
+
+    async def _run():
+        async with SessionLocal() as db:
+            await insert_chats(db, [_msg(taken)])
+        # a primary key clash fails the whole batch
+        assert buffer.submit([_msg(good[0]), _msg(taken), _msg(good[1])])
+        assert not buffer.submit([_msg(uuid.uuid4().hex)])
+        first = await buffer.flush()  # retried later
+        pending = buffer.stats()["pending"]
+        second = await buffer.flush()  # row by row, the clash is dropped
+        async with SessionLocal() as db:
+            res = await db.execute(
+                select(ChatMessage.id).where(ChatMessage.id.in_(good))
+            )
+            stored = set(res.scalars())
+        return first, pending, second, stored
+
+    first, pending, second, stored = client.portal.call(_run)
+    assert (first, pending, second) == (0, 3, 2)
+    assert stored == set(good)
+    stats = buffer.stats()
+    assert (stats["pending"], stats["dropped"], stats["rejected"]) == (0, 1, 1)
+
+
+def test_startup_migrates_to_head(client):
+    from sqlalchemy import text
+    from app.db.database import engine
+
+    async def _state():
+        async with engine.connect() as conn:
+            version = (
+                await conn.execute(text("SELECT version_num FROM alembic_version"))
+            ).scalar()
+            fts = (
+                await conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = 'page_fts'")
+                )
+            ).scalar()
+            return version, fts
+
+    assert client.portal.call(_state) == ("0007", 1)
+
+
+# what Base.metadata.create_all built before migrations (SQLite)
+LEGACY_BASELINE_DDL = [
+    """
+    CREATE TABLE documents (
+        id VARCHAR NOT NULL, filename VARCHAR NOT NULL, path VARCHAR NOT NULL,
+        pages INTEGER NOT NULL, created_at DATETIME NOT NULL, PRIMARY KEY (id)
+    )
+    """,
+    """
+    CREATE TABLE chat_messages (
+        id VARCHAR NOT NULL, doc_id VARCHAR, role VARCHAR NOT NULL,
+        content TEXT NOT NULL, created_at DATETIME NOT NULL, PRIMARY KEY (id)
+    )
+    """,
+]
+# ...and later, once page texts were indexed (non-unique content_hash)
+LEGACY_PAGE_TEXTS_DDL = [
+    "ALTER TABLE documents ADD COLUMN content_hash VARCHAR",
+    "ALTER TABLE documents ADD COLUMN index_status VARCHAR NOT NULL DEFAULT 'done'",
+    "CREATE INDEX ix_documents_content_hash ON documents (content_hash)",
+    """
+    CREATE TABLE page_texts (
+        doc_id VARCHAR NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL,
+        PRIMARY KEY (doc_id, page)
+    )
+    """,
+    "INSERT INTO page_texts (doc_id, page, text) VALUES ('d1', 1, 'legacy kestrel')",
+]
+
+
+def _upgrade_legacy(tmp_path, ddl: list[str]):
+    from sqlalchemy import select, text
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from app.db.database import create_engine_for
+    from app.db.migrate import upgrade_database
+    from app.db.models import Document
+    from app.db.search import search_pages
+
+    async def _run():
+        engine = create_engine_for(f"sqlite+aiosqlite:///{tmp_path / 'legacy.db'}")
+        async with engine.begin() as conn:
+            await conn.execute(text(LEGACY_BASELINE_DDL[0]))
+            await conn.execute(text(LEGACY_BASELINE_DDL[1]))
+            await conn.execute(
+                text(
+                    "INSERT INTO documents (id, filename, path, pages, created_at) "
+                    "VALUES ('d1', 'a.pdf', 'a.pdf', 1, '2024-01-01')"
+                )
+            )
+            for stmt in ddl:
+                await conn.execute(text(stmt))
+        await upgrade_database(engine)
+        # idempotent
+        await upgrade_database(engine)
+        async with engine.connect() as conn:
+            version = (
+                await conn.execute(text("SELECT version_num FROM alembic_version"))
+            ).scalar()
+        async with async_sessionmaker(engine)() as db:
+            doc = (await db.execute(select(Document))).scalar_one()
+            hits = await search_pages(db, "kestrel")
+        await engine.dispose()
+        return version, doc, hits
+
+    return asyncio.run(_run())
+
+
+def test_legacy_create_all_database_is_upgraded(tmp_path):
+    version, doc, hits = _upgrade_legacy(tmp_path, [])
+    assert version == "0007"
+    assert (doc.id, doc.content_hash, doc.index_status) == ("d1", None, "pending")
+    assert hits == []
+
+
+def test_legacy_page_texts_database_is_upgraded(tmp_path):
+    version, doc, hits = _upgrade_legacy(tmp_path, LEGACY_PAGE_TEXTS_DDL)
+    assert version == "0007"
+    assert doc.index_status == "done"
+    # existing page texts keep their rows and land in the search index
+    assert [(h["doc_id"], h["page"]) for h in hits] == [("d1", 1)]
+
+
+def test_sqlite_migrations_serialise_on_lock_file(tmp_path):
+    fcntl = pytest.importorskip("fcntl")
+    from sqlalchemy import inspect
+    from app.db.database import create_engine_for
+    from app.db.migrate import upgrade_database
+
+    db_path = tmp_path / "workers.db"
+
+    async def _tables(engine):
+        async with engine.connect() as conn:
+            return await conn.run_sync(lambda c: inspect(c).get_table_names())
+
+    async def _run():
+        engine = create_engine_for(f"sqlite+aiosqlite:///{db_path}")
+        # another worker is mid-migration
+        with open(f"{db_path}.migrate.lock", "w") as other:
+            fcntl.flock(other, fcntl.LOCK_EX)
+            task = asyncio.ensure_future(upgrade_database(engine))
+            await asyncio.sleep(0.2)
+            assert not task.done()
+            assert "alembic_version" not in await _tables(engine)
+        await task
+        tables = await _tables(engine)
+        await engine.dispose()
+        return tables
+
+    assert "alembic_version" in asyncio.run(_run())
+
+
+def test_postgres_engine_pool_settings(monkeypatch):
+    from app.core.config import settings
+    from app.db.database import _postgres_connect_args, create_engine_for
+
+    monkeypatch.setattr(settings, "DB_PGBOUNCER", True)
+    engine = create_engine_for("postgresql+asyncpg://u:p@localhost/marginai")
+    pool = engine.sync_engine.pool
+    assert pool._pre_ping is True
+    assert pool._recycle == settings.DB_POOL_RECYCLE_SECONDS
+    assert pool.size() == settings.DB_POOL_SIZE
+    connect_args = _postgres_connect_args()
+    assert connect_args["statement_cache_size"] == 0
+    assert connect_args["server_settings"]["statement_timeout"] == str(
+        settings.DB_STATEMENT_TIMEOUT_MS
+    )
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TEST_POSTGRES_URL"),
+    reason="set TEST_POSTGRES_URL (postgresql+asyncpg://...) to a scratch database",
+)
+def test_postgres_migrations_and_search():
+    import uuid
+    from sqlalchemy import delete
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from app.db.database import create_engine_for
+    from app.db.migrate import upgrade_database
+    from app.db.models import Document, PageText
+    from app.db.search import search_pages
+
+    doc_id = uuid.uuid4().hex
+
+    async def _run():
+        engine = create_engine_for(os.environ["TEST_POSTGRES_URL"])
+        # concurrent starts serialize on the advisory lock
+        await asyncio.gather(upgrade_database(engine), upgrade_database(engine))
+        async with async_sessionmaker(engine)() as db:
+            db.add(Document(id=doc_id, filename="pg.pdf", path="pg.pdf", pages=2))
+            db.add_all(
+                [
+                    PageText(doc_id=doc_id, page=1, text="the migrating kestrels"),
+                    PageText(doc_id=doc_id, page=2, text="nothing to see"),
+                ]
+            )
+            await db.commit()
+            try:
+                hits = await search_pages(db, "kestrel", doc_id=doc_id)
+                missing = await search_pages(db, "kestrel absent", doc_id=doc_id)
+            finally:
+                await db.execute(delete(PageText).where(PageText.doc_id == doc_id))
+                await db.execute(delete(Document).where(Document.id == doc_id))
+                await db.commit()
+        await engine.dispose()
+        return hits, missing
+
+    hits, missing = asyncio.run(_run())
+    assert [(h["page"], h["filename"]) for h in hits] == [(1, "pg.pdf")]
+    assert "kestrels" in hits[0]["snippet"]
+    assert missing == []
@@ -0,0 +1,71 @@
+# tests/test_disk_cache.py
+import os
+import time
+
+
+def test_disk_cache_evicts_oldest_over_size(tmp_path):
+    from app.utils.disk_cache import DiskCache
+
+    cache = DiskCache(str(tmp_path), max_bytes=250, prefix="c_")
+    first = cache.put("a", ".bin", b"x" * 100)
+    past = time.time() - 60
+    os.utime(first, (past, past))
+    cache._entries[first] = (100, past)
+
+    cache.put("b", ".bin", b"x" * 100)
+    assert cache.get("a", ".bin") == first  # hit refreshes recency of "a"
+    cache.put("c", ".bin", b"x" * 100)
+
+    assert cache.get("b", ".bin") is None
+    assert cache.get("a", ".bin") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["files"] == 2
+    assert stats["bytes"] == 200
+
+
+def test_disk_cache_expires_by_age_and_purges(tmp_path):
+    from app.utils.disk_cache import DiskCache
+
+    cache = DiskCache(str(tmp_path), max_bytes=10_000, max_age_seconds=30)
+    path = cache.put("old", ".bin", b"old")
+    past = time.time() - 120
+    os.utime(path, (past, past))
+
+    # a fresh instance picks up existing files from a directory scan
+    cache = DiskCache(str(tmp_path), max_bytes=10_000, max_age_seconds=30)
+    assert cache.get("old", ".bin") is None
+    assert not os.path.exists(path)
+
+    cache.put("new", ".bin", b"new")
+    assert cache.purge() == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_disk_cache_sweeps_expired_every_n_writes(tmp_path):
+    from app.utils.disk_cache import DiskCache
+
+    cache = DiskCache(str(tmp_path), 10_000, max_age_seconds=30, sweep_every=3)
+    old = cache.put("old", ".bin", b"old")
+    past = time.time() - 120
+    os.utime(old, (past, past))
+    cache._entries[old] = (3, past)
+
+    cache.put("b", ".bin", b"b")
+    assert os.path.exists(old)  # under budget, no sweep yet
+    cache.put("c", ".bin", b"c")
+    assert not os.path.exists(old)
+    assert cache.stats()["files"] == 2
+
+
+def test_disk_cache_removes_keys_by_prefix(tmp_path):
+    from app.utils.disk_cache import DiskCache
+
+    cache = DiskCache(str(tmp_path), max_bytes=10_000, prefix="c_")
+    cache.put("doc1_a", ".bin", b"a")
+    cache.put("doc1_b", ".bin", b"b")
+    keep = cache.put("doc2_a", ".bin", b"c")
+
+    assert cache.remove_prefix("doc1_") == 2
+    assert os.listdir(tmp_path) == [os.path.basename(keep)]
+    assert cache.stats()["bytes"] == 1
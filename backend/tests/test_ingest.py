@@ -0,0 +1,99 @@
+# tests/test_ingest.py
+import io
+import tarfile
+import zipfile
+
+from tests.test_api import make_pdf_bytes
+
+
+def test_bulk_ingest_files_and_zip(client):
+    loose_a = make_pdf_bytes("Ingest A", pages=1)
+    loose_b = make_pdf_bytes("Ingest B", pages=2)
+    zipped = make_pdf_bytes("Ingest Zipped", pages=3)
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("course/week1/zipped.pdf", zipped)
+        zf.writestr("../../escape/dup.pdf", loose_a)  # duplicate + hostile path
+        zf.writestr("notes.txt", "ignored")
+
+    files = [
+        ("files", ("a.pdf", loose_a, "application/pdf")),
+        ("files", ("b.pdf", loose_b, "application/pdf")),
+        ("files", ("library.zip", buf.getvalue(), "application/zip")),
+        ("files", ("readme.md", b"# hi", "text/markdown")),
+        ("files", ("broken.pdf", b"%PDF-nope", "application/pdf")),
+    ]
+    resp = client.post("/api/ingest", files=files, data={"concurrency": "2"})
+    assert resp.status_code == 202, resp.text
+    job = resp.json()
+    # the archive counts as one file until the job unpacks it
+    assert job["total"] == 5
+    assert job["concurrency"] == 2
+
+    status = client.get(f"/api/ingest/{job['job_id']}").json()
+    assert status["status"] == "done"
+    assert status["total"] == 6
+    assert status["processed"] == 6
+    assert status["progress"] == 1.0
+    assert status["succeeded"] == 4
+    assert status["failed"] == 2
+
+    items = client.get(f"/api/ingest/{job['job_id']}/items").json()["items"]
+    by_name = {i["filename"]: i for i in items}
+    assert by_name["zipped.pdf"]["status"] == "done"
+    assert by_name["readme.md"]["error"] == "Only PDF files supported"
+    assert by_name["broken.pdf"]["error"] == "Invalid PDF file"
+    # a.pdf and dup.pdf have the same bytes: one of them is the duplicate
+    statuses = sorted([by_name["a.pdf"]["status"], by_name["dup.pdf"]["status"]])
+    assert statuses == ["done", "duplicate"]
+    assert by_name["a.pdf"]["doc_id"] == by_name["dup.pdf"]["doc_id"]
+
+    doc = client.get(f"/api/documents/{by_name['zipped.pdf']['doc_id']}").json()
+    assert doc["pages"] == 3
+    assert doc["index_status"] == "done"
+
+
+def test_bulk_ingest_tar_archive(client):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+        for i in range(3):
+            data = make_pdf_bytes(f"Tarred {i}", pages=1)
+            info = tarfile.TarInfo(f"papers/p{i}.pdf")
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+    files = [("files", ("papers.tar.gz", buf.getvalue(), "application/gzip"))]
+    job = client.post("/api/ingest", files=files, data={"index_text": "false"}).json()
+
+    status = client.get(f"/api/ingest/{job['job_id']}").json()
+    assert (status["status"], status["succeeded"], status["failed"]) == ("done", 3, 0)
+
+    items = client.get(f"/api/ingest/{job['job_id']}/items").json()["items"]
+    doc = client.get(f"/api/documents/{items[0]['doc_id']}").json()
+    assert doc["index_status"] == "pending"
+
+
+def test_archive_over_file_limit_fails_its_item(client, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "INGEST_MAX_FILES", 3)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for i in range(3):
+            zf.writestr(f"p{i}.pdf", make_pdf_bytes(f"Limit {i}", pages=1))
+    files = [
+        ("files", ("solo.pdf", make_pdf_bytes("Limit solo"), "application/pdf")),
+        ("files", ("big.zip", buf.getvalue(), "application/zip")),
+    ]
+    job = client.post("/api/ingest", files=files).json()
+
+    status = client.get(f"/api/ingest/{job['job_id']}").json()
+    assert (status["total"], status["succeeded"], status["failed"]) == (2, 1, 1)
+    items = client.get(f"/api/ingest/{job['job_id']}/items").json()["items"]
+    by_name = {i["filename"]: i for i in items}
+    assert by_name["big.zip"]["error"] == "more than 2 files"
+
+
+def test_ingest_unknown_job_is_404(client):
+    assert client.get("/api/ingest/job_missing").status_code == 404
@@ -0,0 +1,180 @@
+# tests/test_llm_router.py
+import asyncio
+
+import pytest
+
+
+class _UpstreamError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"upstream {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture()
+def fake_backend(monkeypatch):
+    """
+    Local fake LiteLLM: per-model scripts of outcomes ("ok", an HTTP status
+    to raise, or "hang"), consumed one per call; unscripted calls succeed.
+    """
+    import app.services.llm_service as llm_service
+    from app.core.config import settings
+    from app.services.llm_router import router
+    from tests.test_api import _FakeResp, _FakeStream
+
+    backend = {"scripts": {}, "calls": [], "active": 0, "peak": 0, "delay": 0.0}
+
+    async def _fake_acompletion(*args, **kwargs):
+        model = kwargs["model"]
+        backend["calls"].append(model)
+        script = backend["scripts"].get(model) or []
+        outcome = script.pop(0) if script else "ok"
+        backend["active"] += 1
+        backend["peak"] = max(backend["peak"], backend["active"])
+        try:
+            if outcome == "hang":
+                await asyncio.sleep(10)
+            await asyncio.sleep(backend["delay"])
+            if isinstance(outcome, int):
+                raise _UpstreamError(outcome)
+            if kwargs.get("stream"):
+                return _FakeStream(f"answer from {model}")
+            return _FakeResp(f"answer from {model}")
+        finally:
+            backend["active"] -= 1
+
+    monkeypatch.setattr(llm_service, "acompletion", _fake_acompletion)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_MS", 1)
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_MS", 5)
+    router.reset_stats()
+    return backend
+
+
+def _plan(user: str = "hi") -> dict:
+    return {"system": "s", "user": user, "used_context": {"prompt_tokens": 20}}
+
+
+def test_retries_then_fails_over_along_chain(fake_backend, monkeypatch):
+    from app.core.config import settings
+    from app.services.llm_router import router
+    from app.services.llm_service import aask
+
+    monkeypatch.setattr(settings, "LLM_FALLBACK_MODELS", "backup-a, backup-b")
+    fake_backend["scripts"] = {"primary": [503, 429, 503], "backup-a": [400]}
+
+    model, answer = asyncio.run(aask("primary", _plan()))
+    assert (model, answer) == ("backup-b", "answer from backup-b")
+    # 3 attempts on primary (retryable), 1 on backup-a (400 is not retried)
+    assert fake_backend["calls"] == [
+        "primary",
+        "primary",
+        "primary",
+        "backup-a",
+        "backup-b",
+    ]
+    stats = router.stats()["models"]
+    assert stats["primary"]["retries"] == 2 and stats["primary"]["errors"] == 3
+    assert stats["backup-a"]["retries"] == 0
+    assert stats["backup-b"]["fallbacks"] == 1
+    assert stats["backup-b"]["latency"]["count"] == 1
+
+
+def test_timeout_exhausts_chain_and_ask_returns_503(client, fake_backend, monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 1)
+    fake_backend["scripts"] = {"slow-model": ["hang", "hang"]}
+
+    resp = client.post(
+        "/api/ask",
+        json={
+            "model": "slow-model",
+            "user_query": "q",
+            "selection": {"type": "text", "page": 1, "content": "c"},
+            "cache": "bypass",
+        },
+    )
+    assert resp.status_code == 503
+    assert "TimeoutError" in resp.json()["detail"]
+
+    stats = client.get("/api/admin/llm").json()["models"]["slow-model"]
+    assert stats["timeouts"] == 2 and stats["in_flight"] == 0
+
+
+def test_per_model_concurrency_limit(fake_backend, monkeypatch):
+    from app.core.config import settings
+    from app.services.llm_service import aask
+
+    monkeypatch.setattr(settings, "LLM_MODEL_CONCURRENCY", {"narrow": 2})
+    fake_backend["delay"] = 0.02
+
+    async def _burst():
+        return await asyncio.gather(*(aask("narrow", _plan()) for _ in range(6)))
+
+    results = asyncio.run(_burst())
+    assert len(results) == 6
+    assert fake_backend["peak"] == 2
+
+
+def test_cheap_model_for_short_text_questions(monkeypatch):
+    from app.core.config import settings
+    from app.services.llm_router import router
+
+    monkeypatch.setattr(settings, "LLM_CHEAP_MODEL", "tiny")
+    monkeypatch.setattr(settings, "LLM_CHEAP_MAX_PROMPT_TOKENS", 50)
+
+    assert router.choose(None, _plan()) == "tiny"
+    long_plan = {"used_context": {"prompt_tokens": 500}}
+    assert router.choose(None, long_plan) == settings.DEFAULT_MODEL
+    assert router.choose(None, _plan(), image={"data": b""}) == settings.DEFAULT_MODEL
+    assert router.choose("explicit", _plan()) == "explicit"
+
+
+def test_cancelled_call_releases_model_slot(fake_backend, monkeypatch):
+    from app.core.config import settings
+    from app.services.llm_router import router
+    from app.services.llm_service import aask
+
+    monkeypatch.setattr(settings, "LLM_MODEL_CONCURRENCY", {"single": 1})
+    fake_backend["scripts"] = {"single": ["hang"]}
+
+    async def _cancel_then_ask():
+        task = asyncio.create_task(aask("single", _plan()))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # the only slot is free again
+        return await asyncio.wait_for(aask("single", _plan()), 1)
+
+    assert asyncio.run(_cancel_then_ask()) == ("single", "answer from single")
+    assert router.stats()["models"]["single"]["in_flight"] == 0
+
+
+def test_fallback_answers_are_not_cached_for_chosen_model(fake_backend, monkeypatch):
+    from app.core.config import settings
+    from app.services.llm_service import aask_cached, astream_cached
+
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_FALLBACK_MODELS", "backup")
+    fake_backend["scripts"] = {"flaky": [400]}
+
+    async def _drain(stream) -> str:
+        return "".join([text async for text in stream])
+
+    async def _run():
+        first = await aask_cached("flaky", _plan("fallback cache"))
+        # primary is back: asked again instead of replaying backup's answer
+        second = await aask_cached("flaky", _plan("fallback cache"))
+        fake_backend["scripts"]["flaky"] = [400]
+        served, stream, info = await astream_cached("flaky", _plan("fallback stream"))
+        streamed = (served, await _drain(stream), info["hit"])
+        again, stream, info = await astream_cached("flaky", _plan("fallback stream"))
+        return first, second, streamed, (again, await _drain(stream), info["hit"])
+
+    first, second, streamed, streamed_again = asyncio.run(_run())
+    assert first[:2] == ("backup", "answer from backup")
+    assert second[:2] == ("flaky", "answer from flaky")
+    assert second[2]["hit"] is False
+    assert streamed == ("backup", "answer from backup", False)
+    assert streamed_again == ("flaky", "answer from flaky", False)
@@ -0,0 +1,38 @@
+# tests/test_lru.py
+
+
+def test_lru_cache_recency_ttl_and_stats(monkeypatch):
+    from app.utils.lru import LRUCache
+
+    clock = [100.0]
+    monkeypatch.setattr("app.utils.lru.time.monotonic", lambda: clock[0])
+    cache = LRUCache(max_entries=2, ttl_seconds=10)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+    cache.put("short", 4, ttl_seconds=1)
+    clock[0] += 5
+    assert cache.get("short") is None  # expired, and dropped
+    assert cache.get("c") == 3
+    clock[0] += 10
+    assert cache.get("c") is None
+
+    cache.put("p_1", 1)
+    cache.put("p_2", 2)
+    assert cache.evict_where(lambda key, _: key.startswith("p_")) == 2
+    assert cache.stats() == {
+        "entries": 0,
+        "max_entries": 2,
+        "ttl_seconds": 10,
+        "hits": 4,
+        "misses": 3,
+        "hit_ratio": 0.5714,
+    }
+
+    disabled = LRUCache(max_entries=0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None and len(disabled) == 0
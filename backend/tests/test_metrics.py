@@ -0,0 +1,75 @@
+# tests/test_metrics.py
+import json
+import logging
+
+
+def test_metrics_endpoint_and_timing_log(client, caplog, monkeypatch):
+    import app.services.llm_service as llm_service
+    from tests.test_api import _FakeResp, upload_sample_pdf
+
+    async def _fake_acompletion(*args, **kwargs):
+        return _FakeResp("FAKE_TEXT_ANSWER")
+
+    monkeypatch.setattr(llm_service, "acompletion", _fake_acompletion)
+    doc_id = upload_sample_pdf(client)["doc_id"]
+
+    with caplog.at_level(logging.INFO, logger="app.timing"):
+        resp = client.post(
+            "/api/ask",
+            json={
+                "user_query": "what is this?",
+                "selection": {
+                    "type": "image",
+                    "page": 1,
+                    "bbox": {"x": 0, "y": 0, "w": 50, "h": 50},
+                },
+                "document_id": doc_id,
+                "cache": "bypass",
+            },
+        )
+    assert resp.status_code == 200
+
+    lines = [json.loads(r.message) for r in caplog.records if r.name == "app.timing"]
+    ask_line = next(line for line in lines if line["route"] == "/api/ask")
+    assert ask_line["status"] == 200 and ask_line["ms"] > 0
+    for stage in (
+        "get_document",
+        "crop_render",
+        "base64_encode",
+        "llm_call",
+        "persist_chat",
+    ):
+        assert stage in ask_line["stages_ms"], stage
+
+    body = client.get("/metrics")
+    assert body.status_code == 200
+    assert body.headers["content-type"].startswith("text/plain")
+    text = body.text
+    assert "# TYPE marginstudio_stage_seconds histogram" in text
+    assert 'marginstudio_stage_seconds_bucket{stage="llm_call",le="+Inf"}' in text
+    assert (
+        'marginstudio_http_requests_total{method="POST",route="/api/ask",status="200"}'
+        in text
+    )
+    assert "marginstudio_http_requests_in_flight 0.0" in text
+    assert 'marginstudio_llm_attempts_total{model="gpt-4o-mini",outcome="ok"}' in text
+    # existing stats folded in as gauges
+    assert 'marginstudio_pool_submitted{name="io"}' in text
+    assert "marginstudio_response_cache_hits " in text
+
+
+def test_spans_are_noops_when_disabled(monkeypatch):
+    from app.core import metrics
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+    before = metrics.stage_seconds.count(stage="disabled_stage")
+    with metrics.span("disabled_stage"):
+        pass
+    assert metrics.stage_seconds.count(stage="disabled_stage") == before
+    assert metrics.span("a") is metrics.span("b")
+
+    monkeypatch.setattr(settings, "METRICS_ENABLED", True)
+    with metrics.span("disabled_stage"):
+        pass
+    assert metrics.stage_seconds.count(stage="disabled_stage") == before + 1
@@ -0,0 +1,157 @@
+# tests/test_pdf_utils.py
+import os
+
+from tests.test_api import make_pdf_bytes
+
+
+def _write_pdf(path, pages: int = 1, text: str = "Cached Document"):
+    with open(path, "wb") as f:
+        f.write(make_pdf_bytes(text, pages=pages))
+    return str(path)
+
+
+def test_doc_cache_hits_and_evicts(tmp_path):
+    from app.utils.pdf_utils import DocumentHandleCache
+
+    cache = DocumentHandleCache(max_open=2)
+    a = _write_pdf(tmp_path / "a.pdf", pages=3)
+    b = _write_pdf(tmp_path / "b.pdf")
+    c = _write_pdf(tmp_path / "c.pdf")
+
+    with cache.open(a) as doc:
+        assert doc.page_count == 3
+    with cache.open(a):
+        pass
+    with cache.open(b):
+        pass
+    with cache.open(c):
+        pass
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["evictions"] == 1
+    assert stats["open"] == 2
+
+
+def test_doc_cache_reopens_replaced_file(tmp_path):
+    from app.utils.pdf_utils import DocumentHandleCache
+
+    cache = DocumentHandleCache(max_open=4)
+    path = _write_pdf(tmp_path / "doc.pdf", pages=1)
+    with cache.open(path) as doc:
+        assert doc.page_count == 1
+
+    _write_pdf(tmp_path / "doc.pdf", pages=2)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    with cache.open(path) as doc:
+        assert doc.page_count == 2
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["open"] == 1
+
+
+def test_pdf_utils_share_open_handle(tmp_path):
+    from app.utils.pdf_utils import doc_cache, get_page_count, extract_page_text
+
+    path = _write_pdf(tmp_path / "shared.pdf", pages=2)
+    before = doc_cache.stats()
+    assert get_page_count(path) == 2
+    assert "Cached Document (page 2)" in extract_page_text(path, 2)
+    after = doc_cache.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+
+def test_extract_all_page_texts_takes_handle_per_page(tmp_path):
+    from app.utils.pdf_utils import doc_cache, extract_all_page_texts
+
+    path = _write_pdf(tmp_path / "all.pdf", pages=3)
+    before = doc_cache.stats()
+    texts = extract_all_page_texts(path)
+    assert [f"(page {i})" in t for i, t in enumerate(texts, 1)] == [True] * 3
+    after = doc_cache.stats()
+    # page count, then one short hold per page
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 3
+
+
+def test_region_render_matches_full_render_crop(tmp_path):
+    from app.utils.image_utils import crop_bbox
+    from app.utils.pdf_utils import render_page_to_image, render_region_to_image
+
+    path = _write_pdf(tmp_path / "region.pdf")
+    bbox = {"x": 90, "y": 230, "w": 520, "h": 220}
+
+    full = crop_bbox(render_page_to_image(path, 1, zoom=2.0), bbox)
+    region = render_region_to_image(path, 1, bbox, bbox_zoom=2.0, zoom=2.0)
+    assert region.size == full.size
+
+    # bbox running off the page is clamped like crop_bbox does
+    edge = {"x": 1100, "y": 1500, "w": 500, "h": 500}
+    full_edge = crop_bbox(render_page_to_image(path, 1, zoom=2.0), edge)
+    region_edge = render_region_to_image(path, 1, edge, bbox_zoom=2.0, zoom=2.0)
+    assert region_edge.size == full_edge.size
+
+
+def test_region_render_caps_pixel_count(tmp_path):
+    from app.utils.pdf_utils import render_region_to_image
+
+    path = _write_pdf(tmp_path / "cap.pdf")
+    bbox = {"x": 0, "y": 0, "w": 1224, "h": 1584}
+
+    img = render_region_to_image(path, 1, bbox, zoom=4.0, max_pixels=500_000)
+    assert img.width * img.height <= 500_000 * 1.01
+    assert img.width * img.height > 400_000
+
+
+def test_page_layout_structure_roundtrip_and_bbox_lookup(tmp_path):
+    import fitz
+    from app.utils.layout import PageLayout
+    from app.utils.pdf_utils import extract_page_layout
+
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(
+        fitz.Rect(36, 36, 300, 200), "alpha beta gamma delta " * 12, fontsize=10
+    )
+    page.insert_text((36, 400), "Figure 2: the caption", fontsize=10)
+    path = str(tmp_path / "layout.pdf")
+    doc.save(path)
+    doc.close()
+
+    layout = extract_page_layout(path, 1)
+    assert layout.n_blocks == 2
+    assert layout.n_lines > 2
+    assert layout.n_words == 48 + 4
+    assert layout.word(0) == "alpha"
+    assert layout.word(layout.n_words - 1) == "caption"
+    # every line lies inside its block
+    for line in range(layout.n_lines):
+        bx0, by0, bx1, by1 = layout.block_boxes[
+            layout.line_block[line] * 4 : layout.line_block[line] * 4 + 4
+        ]
+        lx0, ly0, lx1, ly1 = layout.line_boxes[line * 4 : line * 4 + 4]
+        assert bx0 <= lx0 and by0 <= ly0 and lx1 <= bx1 and ly1 <= by1
+
+    again = PageLayout.from_bytes(layout.to_bytes())
+    assert again.text == layout.text
+    assert again.word_boxes == layout.word_boxes
+    assert again.line_block == layout.line_block
+    assert again.to_dict() == layout.to_dict()
+
+    assert layout.text_in_rect(0, 380, 600, 420) == "Figure 2: the caption"
+    # grid lookup agrees with a brute-force scan
+    rect = (30, 40, 200, 90)
+    brute = [
+        i
+        for i in range(layout.n_words)
+        if rect[0] <= layout.word_boxes[i * 4]
+        and layout.word_boxes[i * 4 + 2] <= rect[2]
+        and rect[1] <= layout.word_boxes[i * 4 + 1]
+        and layout.word_boxes[i * 4 + 3] <= rect[3]
+    ]
+    assert brute and layout.words_in_rect(*rect, min_overlap=1.0) == brute
+    assert "\n" in layout.text_of(brute)
+    assert layout.text_in_rect(400, 600, 500, 700) == ""
@@ -0,0 +1,192 @@
+# tests/test_retrieval.py
+import pytest
+
+
+def test_bm25_prefers_matching_chunk_and_respects_budget():
+    from app.services.retrieval import BM25Index, chunk_pages, select_chunks
+
+    pages = [
+        "Gradient descent updates weights along the negative gradient.\n"
+        "The learning rate controls the step size of each update.",
+        "Momentum accumulates past gradients to damp oscillations.\n"
+        "Unrelated filler about the history of the printing press.",
+    ]
+    index = BM25Index(chunk_pages(pages, max_tokens=16))
+    assert len(index.chunks) == 4
+
+    best = index.search("what does the learning rate control?")
+    assert index.chunks[best[0][0]]["text"].startswith("The learning rate")
+
+    picked = select_chunks(index, "gradient momentum", budget_tokens=20, top_k=4)
+    assert picked and sum(c["tokens"] for c in picked) <= 20
+    # reading order, not score order
+    assert [c["page"] for c in picked] == sorted(c["page"] for c in picked)
+
+
+@pytest.fixture()
+def capture_prompts(monkeypatch):
+    import app.services.llm_service as llm_service
+    from tests.test_api import _FakeResp
+
+    prompts = []
+
+    async def _fake_acompletion(*args, **kwargs):
+        prompts.append(kwargs["messages"][-1]["content"])
+        return _FakeResp("FAKE_TEXT_ANSWER")
+
+    monkeypatch.setattr(llm_service, "acompletion", _fake_acompletion)
+    return prompts
+
+
+def _upload_lines(client, lines_per_page: list[list[str]]) -> str:
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for lines in lines_per_page:
+        page = doc.new_page()
+        for i, line in enumerate(lines):
+            page.insert_text((72, 72 + 14 * i), line)
+    data = doc.tobytes()
+    doc.close()
+    resp = client.post(
+        "/api/upload", files={"file": ("r.pdf", data, "application/pdf")}
+    )
+    assert resp.status_code == 200, resp.text
+    return resp.json()["doc_id"]
+
+
+def test_ask_fallback_sends_relevant_chunks_not_whole_page(
+    client, capture_prompts, monkeypatch
+):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "RETRIEVAL_CHUNK_TOKENS", 12)
+    monkeypatch.setattr(settings, "RETRIEVAL_TOP_K", 1)
+
+    filler = [f"Filler sentence number {i} about nothing much." for i in range(12)]
+    doc_id = _upload_lines(
+        client,
+        [
+            filler[:6]
+            + ["Eigenvalues measure how a matrix stretches space."]
+            + filler[6:],
+            ["An eigenvalue definition also appears here."],
+        ],
+    )
+
+    payload = {
+        "user_query": "What do eigenvalues measure?",
+        "selection": {"type": "text", "page": 1},
+        "document_id": doc_id,
+        "cache": "bypass",
+    }
+    resp = client.post("/api/ask", json=payload)
+    assert resp.status_code == 200, resp.text
+    report = resp.json()["used_context"]["retrieval"]
+    assert report["chunks"] == 1 and report["pages"] == [1]
+    assert report["tokens_saved"] > 0
+    assert report["tokens_saved"] == report["page_tokens"] - report["context_tokens"]
+    assert "stretches space" in capture_prompts[-1]
+    assert "Filler sentence number 0" not in capture_prompts[-1]
+
+    # a real selection keeps its text and gains related context from elsewhere
+    payload["selection"][
+        "content"
+    ] = "Eigenvalues measure how a matrix stretches space."
+    monkeypatch.setattr(settings, "RETRIEVAL_TOP_K", 2)
+    resp = client.post("/api/ask", json=payload)
+    assert resp.status_code == 200
+    assert "[page 2] An eigenvalue definition" in capture_prompts[-1]
+    # extra context costs tokens: nothing is reported as saved
+    report = resp.json()["used_context"]["retrieval"]
+    assert report["context_tokens"] > 0 and report["tokens_saved"] == 0
+
+    # opt out per request: whole page, no report
+    payload["selection"].pop("content")
+    payload["retrieval"] = False
+    resp = client.post("/api/ask", json=payload)
+    assert "retrieval" not in resp.json()["used_context"]
+    assert "Filler sentence number 0" in capture_prompts[-1]
+
+
+def test_build_prompt_trims_to_model_budget(monkeypatch):
+    from app.core.config import settings
+    from app.services.prompt_engine import build_prompt
+    from app.utils.tokens import count_tokens
+
+    monkeypatch.setattr(settings, "MODEL_INPUT_BUDGETS", {"gpt-4o-mini": 200})
+    filler = " ".join(f"Sentence {i} talks about unrelated filler." for i in range(200))
+    content = filler + " The Jacobian collects all first-order partial derivatives."
+    selection = {"type": "text", "page": 3, "content": content}
+
+    plan = build_prompt("What is the Jacobian?", selection, model="gpt-4o-mini")
+    used = plan["used_context"]
+    assert used["input_budget"] == 200
+    assert used["prompt_tokens"] <= 200
+    assert used["trimmed"]["strategy"] == "relevance"
+    assert used["trimmed"]["content_tokens"] == count_tokens(content, "gpt-4o-mini")
+    assert "first-order partial derivatives" in plan["user"]
+
+    monkeypatch.setattr(settings, "PROMPT_TRIM_STRATEGY", "head_tail")
+    plan = build_prompt("What is the Jacobian?", selection, model="gpt-4o-mini")
+    assert plan["used_context"]["prompt_tokens"] <= 200
+    assert "Sentence 0 talks" in plan["user"] and "[...]" in plan["user"]
+    assert plan["user"].rstrip().endswith("partial derivatives.")
+
+    # small selections are untouched; prompt_tokens is still reported
+    plan = build_prompt("Why?", {"type": "text", "page": 1, "content": "Short."})
+    assert "trimmed" not in plan["used_context"]
+    assert plan["used_context"]["prompt_tokens"] > 0
+
+
+def test_build_prompt_counts_each_sentence_once(monkeypatch):
+    import app.services.prompt_engine as prompt_engine
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "MODEL_INPUT_BUDGETS", {"gpt-4o-mini": 150})
+    sentences = [f"Sentence {i} talks about unrelated filler." for i in range(300)]
+    seen: dict[str, int] = {}
+    real_count = prompt_engine.count_tokens
+
+    def _counting(text, model=None):
+        seen[text] = seen.get(text, 0) + 1
+        return real_count(text, model)
+
+    monkeypatch.setattr(prompt_engine, "count_tokens", _counting)
+    selection = {"type": "text", "page": 1, "content": " ".join(sentences)}
+    plan = prompt_engine.build_prompt("Why?", selection, model="gpt-4o-mini")
+    assert plan["used_context"]["prompt_tokens"] <= 150
+    assert max(seen.get(s, 0) for s in sentences) == 1
+
+
+def test_ask_budgets_for_the_routed_cheap_model(client, monkeypatch):
+    import app.services.llm_service as llm_service
+    from app.core.config import settings
+    from tests.test_api import _FakeResp, upload_sample_pdf
+
+    monkeypatch.setattr(settings, "LLM_CHEAP_MODEL", "tiny-model")
+    monkeypatch.setattr(settings, "LLM_CHEAP_MAX_PROMPT_TOKENS", 400)
+    monkeypatch.setattr(settings, "MODEL_INPUT_BUDGETS", {"tiny-model": 150})
+    called = []
+
+    async def _fake_acompletion(*args, **kwargs):
+        called.append(kwargs["model"])
+        return _FakeResp("FAKE_TEXT_ANSWER")
+
+    monkeypatch.setattr(llm_service, "acompletion", _fake_acompletion)
+    doc_id = upload_sample_pdf(client)["doc_id"]
+    content = " ".join(f"Sentence {i} is about filler." for i in range(40))
+    resp = client.post(
+        "/api/ask",
+        json={
+            "user_query": "Summarise this.",
+            "selection": {"type": "text", "page": 1, "content": content},
+            "document_id": doc_id,
+            "cache": "bypass",
+        },
+    )
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert called == ["tiny-model"] and body["model"] == "tiny-model"
+    assert body["used_context"]["input_budget"] == 150
+    assert body["used_context"]["prompt_tokens"] <= 150
@@ -0,0 +1,48 @@
+# tests/test_search.py
+
+
+def _upload(client, name: str, page_texts: list[str]) -> str:
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for body in page_texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), body)
+    data = doc.tobytes()
+    doc.close()
+    resp = client.post("/api/upload", files={"file": (name, data, "application/pdf")})
+    assert resp.status_code == 200, resp.text
+    return resp.json()["doc_id"]
+
+
+def test_search_ranks_pages_across_documents(client):
+    a = _upload(
+        client,
+        "thermo.pdf",
+        ["Entropy increases in isolated systems.", "Entropy entropy entropy."],
+    )
+    b = _upload(client, "optics.pdf", ["Refraction bends light; entropy aside."])
+
+    resp = client.get("/api/search", params={"q": "entropy"})
+    assert resp.status_code == 200
+    hits = resp.json()["hits"]
+    found = {(h["doc_id"], h["page"]) for h in hits}
+    assert {(a, 1), (a, 2), (b, 1)} <= found
+    # the page that repeats the term ranks first
+    assert (hits[0]["doc_id"], hits[0]["page"]) == (a, 2)
+    assert "[Entropy]" in hits[0]["snippet"] or "[entropy]" in hits[0]["snippet"]
+    assert hits[0]["filename"] == "thermo.pdf"
+
+    scoped = client.get("/api/search", params={"q": "entropy", "doc_id": b}).json()
+    assert [(h["doc_id"], h["page"]) for h in scoped["hits"]] == [(b, 1)]
+
+    # stemming + AND semantics
+    both = client.get("/api/search", params={"q": "bending light"}).json()["hits"]
+    assert [(h["doc_id"], h["page"]) for h in both] == [(b, 1)]
+
+
+def test_search_treats_query_as_plain_words(client):
+    _upload(client, "ops.pdf", ["NEAR AND OR NOT quotes"])
+    for q in ['"unbalanced', "NOT", "a:b*", ")("]:
+        resp = client.get("/api/search", params={"q": q})
+        assert resp.status_code == 200, (q, resp.text)
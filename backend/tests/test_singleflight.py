@@ -0,0 +1,99 @@
+# tests/test_singleflight.py
+import asyncio
+
+
+def test_single_flight_shares_result_errors_and_survives_cancelled_leader():
+    from app.utils.singleflight import SingleFlight
+
+    flight = SingleFlight("t")
+    runs = []
+
+    async def _work(value):
+        runs.append(value)
+        await asyncio.sleep(0.02)
+        if value == "boom":
+            raise ValueError("boom")
+        return value
+
+    async def _scenario():
+        results = await asyncio.gather(
+            *(flight.do("k", lambda: _work("v")) for _ in range(5))
+        )
+        assert [r for r, _ in results] == ["v"] * 5
+        assert sorted(shared for _, shared in results) == [False] + [True] * 4
+
+        errors = await asyncio.gather(
+            *(flight.do("e", lambda: _work("boom")) for _ in range(3)),
+            return_exceptions=True,
+        )
+        assert all(isinstance(e, ValueError) for e in errors)
+
+        # the leader going away doesn't cancel the work for followers
+        leader = asyncio.ensure_future(flight.do("c", lambda: _work("c")))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("c", lambda: _work("c")))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == ("c", True)
+
+    asyncio.run(_scenario())
+    assert runs == ["v", "boom", "c"]
+    assert flight.stats() == {"in_flight": 0, "executed": 3, "coalesced": 7}
+
+
+def test_concurrent_identical_asks_share_crop_and_llm_call(client, monkeypatch):
+    import app.services.document_service as document_service
+    import app.services.llm_service as llm_service
+    from app.db.database import SessionLocal
+    from app.db.repo import get_document
+    from app.services.prompt_engine import build_prompt
+    from tests.test_api import _FakeResp, upload_sample_pdf
+
+    calls = []
+
+    async def _slow_acompletion(*args, **kwargs):
+        calls.append(kwargs["model"])
+        await asyncio.sleep(0.05)
+        return _FakeResp("FAKE_IMAGE_ANSWER")
+
+    monkeypatch.setattr(llm_service, "acompletion", _slow_acompletion)
+    doc_id = upload_sample_pdf(client)["doc_id"]
+    bbox = {"x": 10, "y": 10, "w": 120, "h": 80}
+    crop_before = document_service.crop_flight.stats()
+    llm_before = llm_service.llm_flight.stats()
+
+    async def _burst():
+        async with SessionLocal() as db:
+            doc = await get_document(db, doc_id)
+
+        async def _one():
+            image = await document_service.get_crop(doc, 1, bbox)
+            plan = build_prompt("what is this?", {"type": "image", "page": 1})
+            return await llm_service.aask_cached(None, plan, image=image)
+
+        return await asyncio.gather(*(_one() for _ in range(8)))
+
+    results = client.portal.call(_burst)
+    assert len(calls) == 1
+    assert {answer for _, answer, _ in results} == {"FAKE_IMAGE_ANSWER"}
+    assert sum(info["coalesced"] for _, _, info in results) == 7
+
+    crop_after = document_service.crop_flight.stats()
+    assert crop_after["executed"] - crop_before["executed"] == 1
+    assert crop_after["coalesced"] - crop_before["coalesced"] == 7
+
+    stats = client.get("/api/admin/single-flight").json()
+    assert stats["llm"]["coalesced"] - llm_before["coalesced"] == 7
+
+
+def test_tiles_skip_single_flight_when_disabled(client, monkeypatch):
+    from app.core.config import settings
+    from app.services import tile_service
+    from tests.test_api import upload_sample_pdf
+
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_ENABLED", False)
+    doc_id = upload_sample_pdf(client)["doc_id"]
+    before = tile_service.tile_flight.stats()
+    resp = client.get(f"/api/documents/{doc_id}/page/2/thumbnail")
+    assert resp.status_code == 200
+    assert tile_service.tile_flight.stats() == before